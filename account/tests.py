@@ -1,3 +1,52 @@
-from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from .models import Group, Permission, User
+
+
+class ListQueryCountTests(APITestCase):
+    """Account list endpoints take the same number of queries whatever the page size."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_authenticate(self.user)
+        self.rows = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.rows += 1
+            permissions = [
+                Permission.objects.create(name=f'Permission {self.rows}.{number}', code=f'perm_{self.rows}_{number}')
+                for number in range(3)
+            ]
+            group = Group.objects.create(name=f'Group {self.rows}')
+            group.permission.set(permissions)
+            user = User.objects.create_user(f'user{self.rows}', f'user{self.rows}@example.com', 'password')
+            user.groups.set([group])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(captured.captured_queries)
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        urls = ['/api/users/', '/api/groups/', '/api/permissions/']
+        self.add_rows(2)
+        small = {url: self.count_queries(url) for url in urls}
+        self.add_rows(6)
+        large = {url: self.count_queries(url) for url in urls}
+        self.assertEqual(small, large)
+
+    def test_group_permissions_are_prefetched(self):
+        self.add_rows(5)
+        with self.assertNumQueries(3):  # count, page, permissions of the whole page
+            response = self.client.get('/api/groups/')
+        self.assertEqual(len(response.data['results'][0]['permission_ids']), 3)
+
+    def test_users_do_not_load_their_groups(self):
+        self.add_rows(5)
+        with self.assertNumQueries(2):  # count, page
+            response = self.client.get('/api/users/')
+        self.assertEqual(list(response.data['results'][1]), ['username', 'email'])
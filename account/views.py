@@ -9,6 +9,7 @@ from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from .models import User, Group, Permission
+from common.eagerloading import EagerLoadingMixin
 from .serializers import UserSerializer, GroupSerializer, PermissionSerializer
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth import authenticate
@@ -18,19 +19,19 @@ from django.contrib.auth import authenticate, login, logout
 
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
     
     
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
     # permission_classes = [IsSuperAdminOrIsAdminOrIsAuthenticated]
     
     
-class PermissionViewSet(viewsets.ModelViewSet):
+class PermissionViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Permission.objects.all()
     serializer_class = PermissionSerializer
     # permission_classes = [IsSuperAdminOrIsAdminOrIsAuthenticated]
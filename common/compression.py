@@ -0,0 +1,192 @@
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# API bodies only: HTML pages put request input next to secrets such as the
+# CSRF token, which compression would leak through the length (BREACH)
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/csv')
+DEFAULT_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+DEFAULT_FLUSH_BYTES = 64 * 1024
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        # wbits 31: a gzip header and trailer around the deflate stream
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+def get_compressors():
+    # In order of preference when the client accepts several equally
+    compressors = {}
+    if zstandard is not None:
+        compressors['zstd'] = ZstdCompressor
+    if brotli is not None:
+        compressors['br'] = BrotliCompressor
+    compressors['gzip'] = GzipCompressor
+    return compressors
+
+
+def parse_accept_encoding(header):
+    """Map each coding in an Accept-Encoding header to its q-value."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted['gzip' if coding == 'x-gzip' else coding] = q
+    return accepted
+
+
+def negotiate_encoding(header, encodings):
+    """The coding in ``encodings`` the client ranks highest, ties going to the earlier one."""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0
+    for encoding in encodings:
+        q = accepted.get(encoding, accepted.get('*', 0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress_sequence(chunks, compressor, flush_bytes=None):
+    # Each chunk goes through as it arrives; the compressor holds only its window,
+    # and a flush every flush_bytes of input sends on what it has buffered
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if flush_bytes and pending >= flush_bytes:
+            data += compressor.flush()
+            pending = 0
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def compress_async_sequence(chunks, compressor, flush_bytes=None):
+    pending = 0
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if flush_bytes and pending >= flush_bytes:
+            data += compressor.flush()
+            pending = 0
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compresses JSON, NDJSON and CSV responses with the best coding the
+    client's Accept-Encoding allows: zstd and br when their packages are
+    installed, gzip always. Bodies under COMPRESSION_MIN_SIZE bytes are left
+    alone; COMPRESSION_LEVELS sets the level per coding. Streaming responses,
+    such as exports, are compressed chunk by chunk as they are sent and
+    flushed every COMPRESSION_FLUSH_BYTES of input.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.levels = {**DEFAULT_LEVELS, **getattr(settings, 'COMPRESSION_LEVELS', {})}
+        self.flush_bytes = getattr(settings, 'COMPRESSION_FLUSH_BYTES', DEFAULT_FLUSH_BYTES)
+        self.compressors = get_compressors()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or not self.is_compressible(response):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.compressors)
+        if encoding is None:
+            return response
+        compressor = self.compressors[encoding](self.levels[encoding])
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compress_async_sequence(
+                    response.streaming_content, compressor, self.flush_bytes
+                )
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content, compressor, self.flush_bytes)
+            del response.headers['Content-Length']
+        else:
+            compressed = compressor.compress(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The body is no longer byte-identical to the uncompressed one
+        etag = response.headers.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def is_compressible(self, response):
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        content_type = response.headers.get('Content-Type', '').lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
@@ -0,0 +1,137 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .signals import post_restore, post_soft_delete, rows_changed
+
+HITS_KEY = 'count-cache:hits'
+MISSES_KEY = 'count-cache:misses'
+
+
+def get_cache():
+    # The "counts" alias lets counts live in Redis while the default cache stays local
+    try:
+        return caches[getattr(settings, 'COUNT_CACHE_ALIAS', 'counts')]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def get_timeout():
+    return getattr(settings, 'COUNT_CACHE_TIMEOUT', 300)
+
+
+def get_generation_key(model):
+    return f'count-cache:generation:{model._meta.label_lower}'
+
+
+def get_generations(models):
+    cache = get_cache()
+    keys = {get_generation_key(model): model for model in models}
+    generations = cache.get_many(keys)
+    for key in keys.keys() - generations.keys():
+        # Start from the clock so an evicted counter never reuses an old generation
+        cache.add(key, time.time_ns(), None)
+        generations[key] = cache.get(key)
+    return [generations[key] for key in sorted(keys)]
+
+
+def bump_generation(model):
+    cache = get_cache()
+    key = get_generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def get_query_models(queryset):
+    # The base model plus every model joined in, so a write to any of them invalidates
+    tables = {alias.table_name for alias in queryset.query.alias_map.values()}
+    models = {queryset.model}
+    for model in get_tracked_models():
+        if model._meta.db_table in tables:
+            models.add(model)
+    return models
+
+
+def get_tracked_models():
+    # The soft-delete models plus everything in COUNT_CACHE_APPS, many-to-many tables included
+    from .softdelete import get_cascade_registry
+
+    models = set(get_cascade_registry())
+    for label in getattr(settings, 'COUNT_CACHE_APPS', []):
+        models.update(apps.get_app_config(label).get_models(include_auto_created=True))
+    return models
+
+
+def get_count_key(queryset):
+    # The SQL carries both the filter parameters and the soft-delete scope
+    queryset = queryset.order_by()
+    generations = get_generations(get_query_models(queryset))
+    digest = hashlib.md5(f'{queryset.db}:{queryset.query}:{generations}'.encode()).hexdigest()
+    return f'count-cache:count:{queryset.model._meta.label_lower}:{digest}'
+
+
+def record(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def cached_count(queryset):
+    cache = get_cache()
+    key = get_count_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        record(MISSES_KEY)
+        count = queryset.count()
+        cache.set(key, count, get_timeout())
+    else:
+        record(HITS_KEY)
+    return count
+
+
+def get_stats():
+    counters = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': counters.get(HITS_KEY, 0), 'misses': counters.get(MISSES_KEY, 0)}
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def retire(model, using=None):
+    # Now, so the writing transaction never reads a count from before its write, and
+    # again on commit, so a count another reader cached from the pre-commit rows goes too
+    bump_generation(model)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(lambda: bump_generation(model), using=using)
+
+
+def invalidate(sender, using=None, **kwargs):
+    retire(sender, using)
+
+
+def invalidate_instance(sender, instance, **kwargs):
+    retire(type(instance), instance._state.db)
+
+
+def connect_signals():
+    # Connected per model: a receiver for every model would stop Django's fast deletes
+    rows_changed.connect(invalidate, dispatch_uid='count-cache:rows_changed')
+    post_soft_delete.connect(invalidate_instance, dispatch_uid='count-cache:post_soft_delete')
+    post_restore.connect(invalidate_instance, dispatch_uid='count-cache:post_restore')
+    for model in get_tracked_models():
+        post_save.connect(invalidate, sender=model, dispatch_uid=f'count-cache:post_save:{model._meta.label}')
+        post_delete.connect(invalidate, sender=model, dispatch_uid=f'count-cache:post_delete:{model._meta.label}')
+        if model._meta.auto_created:
+            # add()/remove()/set() write the through table without saving instances
+            m2m_changed.connect(invalidate, sender=model, dispatch_uid=f'count-cache:m2m_changed:{model._meta.label}')
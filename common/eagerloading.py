@@ -0,0 +1,140 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+
+from .sparsefields import SparseFieldsetMixin, get_selection, is_selected
+
+
+def get_relation(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None  # A property or method
+    return field if field.is_relation else None
+
+
+def collect_lookups(serializer, model, prefix='', many=False, select=None, prefetch=None):
+    """
+    Walk the readable fields of ``serializer`` and sort the relations they
+    read into select_related lookups (single-valued, joined) and
+    prefetch_related lookups (multi-valued, or anything below one).
+    """
+    select = set() if select is None else select
+    prefetch = set() if prefetch is None else prefetch
+    meta = getattr(serializer, 'Meta', None)
+    # Hints for relations the fields can't declare, e.g. ones a SerializerMethodField reads
+    for lookup in getattr(meta, 'select_related', ()):
+        (prefetch if many else select).add(prefix + lookup)
+    for lookup in getattr(meta, 'prefetch_related', ()):
+        prefetch.add(prefix + lookup)
+
+    for field in serializer._readable_fields:
+        if field.source == '*':
+            continue
+        attrs = field.source_attrs
+        if isinstance(field, PrimaryKeyRelatedField):
+            # The last hop is read from the <fk>_id column
+            attrs = attrs[:-1]
+        current_model, path, field_many = model, [], many
+        for attr in attrs:
+            relation = get_relation(current_model, attr)
+            if relation is None:
+                break
+            path.append(attr)
+            field_many = field_many or relation.many_to_many or relation.one_to_many
+            (prefetch if field_many else select).add(prefix + '__'.join(path))
+            current_model = relation.related_model
+        else:
+            child = field.child if isinstance(field, serializers.ListSerializer) else field
+            if path and isinstance(child, serializers.BaseSerializer):
+                collect_lookups(child, current_model, prefix + '__'.join(path) + '__', field_many, select, prefetch)
+    return select, prefetch
+
+
+def collect_columns(serializer, model, prefix=''):
+    """
+    The columns ``serializer`` reads, as only() names, or None when one of its
+    fields reads something its source doesn't tell. ``Meta.field_columns``
+    names the columns of fields with a method source and of computed fields.
+    """
+    meta = getattr(serializer, 'Meta', None)
+    field_columns = getattr(meta, 'field_columns', {})
+    columns = set()
+    for name in getattr(meta, 'computed_fields', ()):
+        if is_selected(serializer, name):
+            if name not in field_columns:
+                return None
+            columns.update(prefix + column for column in field_columns[name])
+
+    for field in serializer._readable_fields:
+        if field.field_name in field_columns:
+            columns.update(prefix + column for column in field_columns[field.field_name])
+            continue
+        if field.source == '*' or len(field.source_attrs) != 1:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None  # A property or method
+        if not model_field.concrete or model_field.many_to_many:
+            continue  # Prefetched by the row's pk
+        columns.add(prefix + model_field.name)
+        if model_field.is_relation and isinstance(field, serializers.BaseSerializer):
+            nested = collect_columns(field, model_field.related_model, prefix + model_field.name + '__')
+            if nested is None:
+                return None
+            columns |= nested
+    return columns
+
+
+@lru_cache(maxsize=256)
+def get_eager_lookups(serializer_class, **selection):
+    """
+    select_related and prefetch_related lookups, and only() columns (None
+    for all of them), for ``serializer_class`` built with ``selection``.
+    """
+    serializer = serializer_class(**selection)
+    model = serializer_class.Meta.model
+    select, prefetch = collect_lookups(serializer, model)
+    columns = collect_columns(serializer, model)
+    return sorted(select), sorted(prefetch), None if columns is None else sorted(columns)
+
+
+class EagerLoadingMixin:
+    """
+    Applies the select_related/prefetch_related the serializer's fields need,
+    so a page of results costs the same number of queries whatever its size.
+
+    Serializers taking a sparse fieldset get ?fields=, ?omit= and ?expand=;
+    list and retrieve then load only() the columns the selected fields read.
+    """
+
+    # Columns list and retrieve read besides the serializer's
+    always_load = ()
+
+    def get_field_selection(self):
+        if getattr(self, 'request', None) is None or not issubclass(self.get_serializer_class(), SparseFieldsetMixin):
+            return {}
+        return get_selection(self.request)
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **{**self.get_field_selection(), **kwargs})
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if not hasattr(getattr(serializer_class, 'Meta', None), 'model'):
+            return queryset
+        selection = self.get_field_selection()
+        select, prefetch, columns = get_eager_lookups(serializer_class, **selection)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        # Writes save instances, and saving a deferred instance skips its unloaded fields
+        trimmed = selection.get('fields') or selection.get('omit')
+        if trimmed and columns is not None and self.action in ('list', 'retrieve'):
+            queryset = queryset.only(*columns, *self.always_load)
+        return queryset
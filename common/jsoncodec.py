@@ -0,0 +1,83 @@
+import decimal
+import io
+import math
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # Datetimes and dataclasses go through the encoder's default(), like every
+    # type orjson doesn't write exactly as json.dumps does
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def has_non_finite(data):
+    # orjson writes NaN and Infinity as null where json.dumps raises or writes them
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, decimal.Decimal):
+            if not value.is_finite():
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    DRF's JSONRenderer, encoding with orjson when it is installed.
+
+    The output is byte for byte what DRF renders, with one exception: floats
+    that json.dumps writes in exponent form (``1e-05``, ``1e+16``) come out
+    in orjson's form (``0.00001``, ``1e16``). Indented output, ASCII-only
+    output, anything orjson rejects (non-string keys, integers over 64
+    bits) and payloads holding NaN or Infinity, which orjson would write as
+    null, are left to DRF's encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Only a payload with a null can hide one, so most skip the walk
+        if b'null' in ret and has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Keep the output a strict javascript subset, as DRF does
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    DRF's JSONParser, decoding with orjson when it is installed. Bodies
+    orjson rejects are parsed again by DRF, so large integers and, without
+    STRICT_JSON, NaN still parse, and errors read the same.
+    """
+
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        body = stream.read()
+        try:
+            return orjson.loads(body if encoding.lower().replace('-', '') == 'utf8' else body.decode(encoding))
+        except (orjson.JSONDecodeError, UnicodeDecodeError):
+            pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
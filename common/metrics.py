@@ -0,0 +1,226 @@
+import bisect
+import contextvars
+import heapq
+import ipaddress
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Per-process metric store; each worker exposes its own numbers."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}  # (name, labels) -> value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, labels, value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+registry = Registry()
+
+METRIC_HELP = {
+    'http_requests_total': ('counter', "Requests by view, method and status."),
+    'http_request_duration_seconds': ('histogram', "Wall time from the first middleware to the response."),
+    'http_response_size_bytes': ('histogram', "Response body size; streamed bodies are not counted."),
+    'db_queries_per_request': ('histogram', "SQL statements per sampled request."),
+    'db_query_duration_seconds': ('histogram', "Total SQL time per sampled request."),
+    'serializer_duration_seconds': ('histogram', "Serializer time per sampled request, SQL excluded."),
+    'metrics_sampled_requests_total': ('counter', "Requests that ran with SQL instrumentation."),
+    'count_cache_requests_total': ('counter', "Paginated count cache lookups by result."),
+}
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+def render_prometheus():
+    from .countcache import get_stats
+
+    lines = []
+    with registry.lock:
+        counters = dict(registry.counters)
+        histograms = {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in registry.histograms.items()}
+    stats = get_stats()
+    counters[('count_cache_requests_total', (('result', 'hit'),))] = stats['hits']
+    counters[('count_cache_requests_total', (('result', 'miss'),))] = stats['misses']
+
+    names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+    for name in names:
+        kind, description = METRIC_HELP.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{{{format_labels(labels)}}} {value}')
+        for (metric, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                bucket_labels = format_labels((*labels, ('le', bound)))
+                lines.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+            lines.append(f'{name}_sum{{{format_labels(labels)}}} {total}')
+            lines.append(f'{name}_count{{{format_labels(labels)}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    def __init__(self, keep_statements):
+        self.query_count = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.keep_statements = keep_statements
+        self.statements = []  # Min-heap of the slowest (duration, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.query_count += 1
+            self.query_time += duration
+            if len(self.statements) < self.keep_statements:
+                heapq.heappush(self.statements, (duration, sql))
+            elif duration > self.statements[0][0]:
+                heapq.heapreplace(self.statements, (duration, sql))
+
+
+current_metrics = contextvars.ContextVar('current_metrics', default=None)
+
+
+@contextmanager
+def serializer_timer():
+    """Time a serialization block of a sampled request, minus the SQL it runs."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    started, query_time = time.perf_counter(), metrics.query_time
+    try:
+        yield
+    finally:
+        metrics.serializer_time += (time.perf_counter() - started) - (metrics.query_time - query_time)
+
+
+def get_view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status and response size for every request. A sampled
+    share of requests (METRICS_SAMPLE_RATE) also counts and times its SQL
+    through execute_wrapper and its serializers; with sampling at 0 the cost
+    is one random() call and a few dictionary updates.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 0.1)
+        self.slow_request_ms = getattr(settings, 'METRICS_SLOW_REQUEST_MS', 1000)
+        self.slow_statements = getattr(settings, 'METRICS_SLOW_REQUEST_STATEMENTS', 5)
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        metrics = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            metrics = RequestMetrics(self.slow_statements)
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics))
+                token = current_metrics.set(metrics)
+                try:
+                    response = self.get_response(request)
+                finally:
+                    current_metrics.reset(token)
+        else:
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, metrics)
+        return response
+
+    def record(self, request, response, duration, metrics):
+        view = get_view_label(request)
+        labels = (('view', view), ('method', request.method))
+        registry.increment('http_requests_total', (*labels, ('status', response.status_code)))
+        registry.observe('http_request_duration_seconds', labels, duration, LATENCY_BUCKETS)
+        if not response.streaming:
+            registry.observe('http_response_size_bytes', labels, len(response.content), SIZE_BUCKETS)
+        if metrics is not None:
+            registry.increment('metrics_sampled_requests_total', labels)
+            registry.observe('db_queries_per_request', labels, metrics.query_count, QUERY_COUNT_BUCKETS)
+            registry.observe('db_query_duration_seconds', labels, metrics.query_time, LATENCY_BUCKETS)
+            registry.observe('serializer_duration_seconds', labels, metrics.serializer_time, LATENCY_BUCKETS)
+
+        if duration * 1000 >= self.slow_request_ms:
+            message = f"Slow request {request.method} {request.get_full_path()} ({view}): {duration * 1000:.0f} ms"
+            if metrics is not None:
+                message += f", {metrics.query_count} queries in {metrics.query_time * 1000:.0f} ms"
+                for statement_time, sql in sorted(metrics.statements, reverse=True):
+                    message += f"\n  {statement_time * 1000:.1f} ms: {sql}"
+            logger.warning(message)
+
+
+def is_metrics_client(request):
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    allowed = getattr(settings, 'METRICS_ALLOWED_NETWORKS', [])
+    return any(address in ipaddress.ip_network(network) for network in allowed)
+
+
+def metrics_view(request):
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,12 +1,119 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.core.paginator import EmptyPage, InvalidPage, Page, PageNotAnInteger, Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import (
     BasePagination,
     PageNumberPagination,
     LimitOffsetPagination,
     CursorPagination,
+    _positive_int,
 )
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .countcache import cached_count
+
+COUNT_NONE = 'none'
+COUNT_APPROX = 'approx'
+COUNT_EXACT = 'exact'
+COUNT_MODES = (COUNT_NONE, COUNT_APPROX, COUNT_EXACT)
+
+
+def get_count_mode(request, default):
+    count_mode = request.query_params.get('count', default)
+    if count_mode not in COUNT_MODES:
+        raise ValidationError({'count': f"Must be one of: {', '.join(COUNT_MODES)}."})
+    return count_mode
+
+
+def estimate_count(queryset):
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        # The planner's row estimate costs a plan, not a scan
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    # Other backends keep no usable statistics, so fall back to the cached exact count
+    return cached_count(queryset)
+
+
+class CachedCountPaginator(DjangoPaginator):
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return cached_count(self.object_list)
+        return super().count
+
+
+class ApproxCountPaginator(DjangoPaginator):
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+
+class UncountedPage(Page):
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class UncountedPaginator(DjangoPaginator):
+    # No COUNT at all: one row past the page tells whether another page follows
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage("That page contains no results")
+        return UncountedPage(rows[:self.per_page], number, self, len(rows) > self.per_page)
+
+
+class OffsetLimitMixin:
+    # Deep OFFSETs scan and discard every skipped row; past this point use the cursor mode
+    max_offset = getattr(settings, 'PAGINATION_MAX_OFFSET', 10000)
+
+    def check_offset(self, offset):
+        if offset > self.max_offset:
+            raise NotFound(
+                f"Offset {offset} is deeper than {self.max_offset}; use ?pagination=cursor for deep pages."
+            )
 
 
 class LargeResultsSetPagination(PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
     page_size = 1000
     page_size_query_param = 'page_size'
     max_page_size = 10000
@@ -18,12 +125,48 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 1000
 
 
-class PageNumberResultsSetPagination(PageNumberPagination):
+class PageNumberResultsSetPagination(OffsetLimitMixin, PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
     # page_size = 1
     page_size_query_param = 'page_size'
     max_page_size = 50
     page_query_param = 'page'  # Can change to anything that you want
 
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = get_count_mode(request, COUNT_EXACT)
+        if self.count_mode == COUNT_APPROX:
+            self.django_paginator_class = ApproxCountPaginator
+        if self.count_mode != COUNT_NONE:
+            return super().paginate_queryset(queryset, request, view)
+
+        # DRF's version, less the page count it reads for the browsable API's page links
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = UncountedPaginator(queryset, page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as e:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(e)))
+        return list(self.page)
+
+    def get_page_number(self, request, paginator):
+        if self.count_mode == COUNT_NONE and request.query_params.get(self.page_query_param) in self.last_page_strings:
+            raise ValidationError({self.page_query_param: "The last page needs ?count=exact or ?count=approx."})
+        page_number = super().get_page_number(request, paginator)
+        try:
+            self.check_offset((int(page_number) - 1) * paginator.per_page)
+        except ValueError:
+            pass  # Left for the paginator to reject
+        return page_number
+
+    def get_paginated_response(self, data):
+        if self.count_mode != COUNT_NONE:
+            return super().get_paginated_response(data)
+        return Response({'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data})
+
     # def get_paginated_response(self, data):
     #     return Response(
     #         {
@@ -49,12 +192,193 @@ class LimitOffsetResultsSetPagination(LimitOffsetPagination):
     max_limit = 50
 
 
+class LimitOffsetCappedPagination(OffsetLimitMixin, LimitOffsetPagination):
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = get_count_mode(request, COUNT_EXACT)
+        if self.count_mode != COUNT_NONE:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        # Enough of a count for the links: it reaches past the page only when a row does
+        self.count = self.offset + len(rows)
+        return rows[:self.limit]
+
+    def get_offset(self, request):
+        offset = super().get_offset(request)
+        self.check_offset(offset)
+        return offset
+
+    def get_count(self, queryset):
+        if self.count_mode == COUNT_APPROX:
+            return estimate_count(queryset)
+        return super().get_count(queryset)
+
+    def get_paginated_response(self, data):
+        if self.count_mode != COUNT_NONE:
+            return super().get_paginated_response(data)
+        return Response({'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data})
+
+
 class CursorResultsSetPagination(CursorPagination):
     page_size = 10
     cursor_query_param = 'cursor'  # Can change to anything that you want
     ordering = '-id'
 
 
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over any stable ordering, e.g. ``?ordering=check_in_date,id``.
+
+    The cursor carries the ordering values of the boundary row, so every page is
+    an index range scan with no OFFSET, however deep it is. ``id`` is appended
+    as a tie-breaker when the ordering doesn't already include it. ``count``
+    defaults to ``none``; ``approx`` and ``exact`` add a ``count`` key.
+    """
+
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    default_ordering = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.count_mode = get_count_mode(request, COUNT_NONE)
+        values, reverse = self.decode_cursor(request)
+
+        if self.count_mode == COUNT_EXACT:
+            self.count = queryset.count()
+        elif self.count_mode == COUNT_APPROX:
+            self.count = estimate_count(queryset)
+
+        queryset = queryset.order_by(*self.get_order_by(reverse))
+        if queryset._fields:
+            # Rows from values() must carry the ordering columns for the cursor
+            missing = [field.attname for field, _ in self.ordering if field.attname not in queryset._fields]
+            if missing:
+                queryset = queryset.values(*queryset._fields, *missing)
+        loaded, deferred = queryset.query.deferred_loading
+        if loaded and not deferred:
+            # So must instances from only()
+            queryset = queryset.only(*loaded, *(field.name for field, _ in self.ordering))
+        if values is not None:
+            queryset = queryset.filter(self.get_seek_filter(values, reverse))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.results = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param], strict=True, cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        raw = request.query_params.get(self.ordering_query_param)
+        names = raw.split(',') if raw else getattr(view, 'keyset_ordering', self.default_ordering)
+        ordering = []
+        for name in (name.strip() for name in names):
+            descending = name.startswith('-')
+            field = self.get_ordering_field(queryset.model, name.lstrip('-'))
+            ordering.append((field, descending))
+        if not any(field.primary_key for field, _ in ordering):
+            ordering.append((queryset.model._meta.pk, ordering[-1][1]))
+        return ordering
+
+    def get_ordering_field(self, model, name):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            field = None
+        # Keyset comparisons need concrete, non-null columns
+        if field is None or not field.concrete or field.null:
+            raise ValidationError({self.ordering_query_param: f"Cannot order by '{name}'."})
+        return field
+
+    def get_order_by(self, reverse):
+        return [
+            f"{'-' if descending != reverse else ''}{field.attname}"
+            for field, descending in self.ordering
+        ]
+
+    def get_seek_filter(self, values, reverse):
+        # (a, b) > (x, y) expands to a > x OR (a = x AND b > y), per column direction
+        seek = Q()
+        for position, (field, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            clause = Q(**{f'{field.attname}__{lookup}': values[position]})
+            for (previous_field, _), value in zip(self.ordering[:position], values):
+                clause &= Q(**{previous_field.attname: value})
+            seek |= clause
+        return seek
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            values = [field.to_python(value) for (field, _), value in zip(self.ordering, cursor['v'], strict=True)]
+            return values, bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound("Invalid cursor.")
+
+    def encode_cursor(self, instance, reverse):
+        values = []
+        for field, _ in self.ordering:
+            # Rows from values() are dicts keyed by attname
+            value = instance[field.attname] if isinstance(instance, dict) else getattr(instance, field.attname)
+            if isinstance(value, (date, datetime, time)):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            values.append(value)
+        cursor = {'v': values}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.results:
+            return None
+        return self.encode_cursor(self.results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.results:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.results[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count_mode != COUNT_NONE:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
+
+
 class DynamicPagination(BasePagination):
     def paginate_queryset(self, queryset, request, view=None):
         # Determine the pagination style based on the 'pagination' query parameter
@@ -63,9 +387,9 @@ class DynamicPagination(BasePagination):
         if pagination_style == 'page_number':
             self.paginator = PageNumberResultsSetPagination()
         elif pagination_style == 'limit_offset':
-            self.paginator = LimitOffsetPagination()
+            self.paginator = LimitOffsetCappedPagination()
         elif pagination_style == 'cursor':
-            self.paginator = CursorResultsSetPagination()
+            self.paginator = KeysetPagination()
         else:
             # Default to CustomPageNumberPagination if the type is not specified or recognized
             self.paginator = PageNumberResultsSetPagination()
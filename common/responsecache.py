@@ -0,0 +1,80 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import countcache
+from .countcache import get_generations
+
+
+def get_cache():
+    try:
+        return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'responses')]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def is_shared(cache):
+    # A per-process cache can't see another worker's writes retire its entries
+    return not isinstance(cache, LocMemCache)
+
+
+def is_enabled():
+    """
+    RESPONSE_CACHE "on" caches in any backend, for a single-process server;
+    "shared" (the default) only when both the entries and the generations
+    that retire them are shared by every worker; "off" never.
+    """
+    mode = getattr(settings, 'RESPONSE_CACHE', 'shared')
+    if mode == 'on':
+        return True
+    if mode == 'shared':
+        return is_shared(get_cache()) and is_shared(countcache.get_cache())
+    return False
+
+
+def get_or_build(key, models, build, timeout):
+    """
+    Return the cached value for ``key``, calling ``build`` on a miss.
+
+    Entries are keyed by the generations of ``models``, so any write to them
+    (see common.countcache) retires the entry. Only one caller rebuilds a
+    retired entry; the others serve the previous value while it does, or wait
+    for it when there is none.
+    """
+    cache = get_cache()
+    generations = hashlib.md5(str(get_generations(models)).encode()).hexdigest()
+    fresh_key = f'{key}:{generations}'
+    stale_key = f'{key}:stale'
+    lock_key = f'{key}:lock'
+
+    value = cache.get(fresh_key)
+    if value is not None:
+        return value
+
+    lock_timeout = getattr(settings, 'RESPONSE_CACHE_LOCK_TIMEOUT', 10)
+    deadline = time.monotonic() + lock_timeout
+    locked = cache.add(lock_key, generations, lock_timeout)
+    while not locked:
+        stale = cache.get(stale_key)
+        if stale is not None:
+            return stale
+        time.sleep(0.05)
+        value = cache.get(fresh_key)
+        if value is not None:
+            return value
+        if time.monotonic() > deadline:
+            break  # The builder is stuck or gone; build without the lock
+        locked = cache.add(lock_key, generations, lock_timeout)
+
+    try:
+        value = build()
+        # The stale copy outlives the fresh one so it can cover the next rebuild
+        cache.set(fresh_key, value, timeout)
+        cache.set(stale_key, value, timeout * 2)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+# Sent with the model instance after a soft delete or restore changed its state
+post_soft_delete = Signal()
+post_restore = Signal()
+
+# Sent with the model class after a bulk write (queryset update, bulk_create or a
+# soft-delete cascade) touched rows that no per-instance signal reports. ``fields``
+# names the columns an update wrote, or is None when whole rows may have changed;
+# ``using`` is the database alias, when known.
+rows_changed = Signal()
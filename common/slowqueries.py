@@ -0,0 +1,195 @@
+import contextvars
+import hashlib
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+NEXT_KEY = 'slow_queries:next'
+
+current_origin = contextvars.ContextVar('slow_query_origin', default=None)
+explaining = contextvars.ContextVar('slow_query_explaining', default=False)
+
+
+def get_cache():
+    return caches[getattr(settings, 'SLOW_QUERY_CACHE_ALIAS', 'default')]
+
+
+def get_buffer_size():
+    return getattr(settings, 'SLOW_QUERY_BUFFER_SIZE', 500)
+
+
+def normalize(sql):
+    """Reduce a statement to its shape: literals, placeholder lists and VALUES rows collapse."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = sql.replace('%s', '?')
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(...)', sql)
+    sql = re.sub(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize(sql).encode()).hexdigest()[:16]
+
+
+def format_plan(connection, cursor, rows):
+    if connection.vendor == 'mysql':
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in rows]
+        return '\n'.join(f"table={row['table']} type={row['type']} key={row['key']}" for row in rows)
+    # SQLite puts the step in the last column, PostgreSQL has a single one
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def explain(connection, sql, params=None):
+    if connection.in_atomic_block:
+        # A failed EXPLAIN must not abort the transaction the statement ran in
+        with transaction.atomic(using=connection.alias):
+            return run_explain(connection, sql, params)
+    return run_explain(connection, sql, params)
+
+
+def run_explain(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(EXPLAIN_PREFIXES[connection.vendor] + sql, params)
+        return format_plan(connection, cursor, cursor.fetchall())
+
+
+def get_origin_label(view_func, request):
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__qualname__', repr(view_func))
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+def record(entry):
+    """
+    Store the entry in the next ring buffer slot. Redis increments the slot
+    counter atomically; the file-based cache does not, so processes recording
+    at the same moment can share a slot and one of their entries is lost.
+    """
+    cache = get_cache()
+    cache.add(NEXT_KEY, 0, None)
+    try:
+        slot = (cache.incr(NEXT_KEY) - 1) % get_buffer_size()
+    except ValueError:
+        # The counter was evicted between add() and incr(); start over
+        cache.set(NEXT_KEY, 1, None)
+        slot = 0
+    cache.set(f'slow_queries:{slot}', entry, None)
+
+
+def get_records():
+    """Recorded slow queries, newest first."""
+    cache = get_cache()
+    entries = cache.get_many([f'slow_queries:{slot}' for slot in range(get_buffer_size())]).values()
+    return sorted(entries, key=lambda entry: entry['recorded_at'], reverse=True)
+
+
+def clear_records():
+    cache = get_cache()
+    cache.delete_many([NEXT_KEY, *(f'slow_queries:{slot}' for slot in range(get_buffer_size()))])
+
+
+class SlowQueryRecorder:
+    """
+    Execute wrapper that records statements slower than the threshold,
+    with their EXPLAIN plan and the view or task that issued them.
+    """
+
+    def __init__(self, connection, threshold_ms):
+        self.connection = connection
+        self.threshold = threshold_ms / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        if explaining.get():
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - started
+        if duration >= self.threshold:
+            self.record(sql, params, many, duration)
+        return result
+
+    def record(self, sql, params, many, duration):
+        plan = None
+        if not many and self.connection.vendor in EXPLAIN_PREFIXES and sql.lstrip().upper().startswith(EXPLAINABLE):
+            token = explaining.set(True)
+            try:
+                plan = explain(self.connection, sql, params)
+            except Exception as e:
+                plan = f'EXPLAIN failed: {e}'
+            finally:
+                explaining.reset(token)
+        token = explaining.set(True)
+        try:
+            record({
+                'fingerprint': fingerprint(sql),
+                'statement': normalize(sql),
+                'sql': sql,
+                'duration_ms': round(duration * 1000, 3),
+                'origin': current_origin.get() or 'unknown',
+                'database': self.connection.alias,
+                'plan': plan,
+                'recorded_at': timezone.now().isoformat(),
+            })
+        finally:
+            explaining.reset(token)
+
+
+class SlowQueryMiddleware:
+    """Labels slow queries with the view that issued them, e.g. BookingViewSet.list."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_origin.set(f'{request.method} {request.path}')
+        try:
+            return self.get_response(request)
+        finally:
+            current_origin.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_origin.set(get_origin_label(view_func, request))
+
+
+def install_recorder(sender, connection, **kwargs):
+    threshold_ms = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+    if threshold_ms is None:
+        return
+    if not any(isinstance(wrapper, SlowQueryRecorder) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(SlowQueryRecorder(connection, threshold_ms))
+
+
+def set_task_origin(sender=None, **kwargs):
+    kwargs['task'].request.slow_query_origin = current_origin.set(kwargs['task'].name)
+
+
+def reset_task_origin(sender=None, **kwargs):
+    token = getattr(kwargs['task'].request, 'slow_query_origin', None)
+    if token is not None:
+        current_origin.reset(token)
+
+
+def connect_signals():
+    from celery.signals import task_postrun, task_prerun
+
+    # Every connection, in web workers, Celery workers and commands alike
+    connection_created.connect(install_recorder, dispatch_uid='slow_query_recorder')
+    task_prerun.connect(set_task_origin, dispatch_uid='slow_query_task_origin', weak=False)
+    task_postrun.connect(reset_task_origin, dispatch_uid='slow_query_task_origin', weak=False)
@@ -1,10 +1,10 @@
-from django.db import models
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import models, transaction
 from django.utils import timezone
 from django.conf import settings
-from django.db.models.fields.related_descriptors import (
-    ReverseManyToOneDescriptor,
-    ReverseOneToOneDescriptor,
-)
+
+from .signals import post_restore, post_soft_delete, rows_changed
 
 
 def get_settings():
@@ -14,16 +14,152 @@ def get_settings():
     return getattr(settings, 'DJANGO_SOFTDELETE_SETTINGS', default_settings)
 
 
-class SoftDeleteQuerySet(models.query.QuerySet):
-    def delete(self, cascade=None):
-        cascade = get_settings()['cascade']
-        if cascade:  # delete one by one if cascade
-            for obj in self.all():
-                obj.delete(cascade=cascade)
-        return self.update(is_deleted=True, deleted_at=timezone.now())
+# Soft-delete model -> reverse relations the cascade follows, built at app ready
+_cascade_registry = {}
+
+
+def find_cascade_relations(model):
+    return tuple(
+        relation
+        for relation in model._meta.related_objects
+        if (relation.one_to_many or relation.one_to_one)
+        and issubclass(relation.related_model, SoftDeleteModel)
+    )
+
+
+def build_cascade_registry():
+    registry = {
+        model: find_cascade_relations(model)
+        for model in apps.get_models()
+        if issubclass(model, SoftDeleteModel)
+    }
+    _cascade_registry.clear()
+    _cascade_registry.update(registry)
+    return _cascade_registry
+
+
+def get_cascade_registry():
+    if not _cascade_registry:
+        raise ImproperlyConfigured("The soft-delete cascade registry is built in HotelConfig.ready().")
+    return _cascade_registry
+
+
+def get_cascade_relations(model):
+    registry = get_cascade_registry()
+    relations = registry.get(model)
+    if relations is None:
+        # Models registered after the build, such as test-only ones
+        relations = registry[model] = find_cascade_relations(model)
+    return relations
+
+
+class SoftDeleteCollector:
+    """
+    Walks the reverse relations below a set of root rows once and flips
+    ``is_deleted``/``deleted_at`` on every descendant with one UPDATE per model.
+
+    Descendants are selected with nested ``fk IN (SELECT ...)`` subqueries, so
+    no rows are loaded into memory. Updates run children first, which keeps
+    every parent subquery valid until its own model is updated.
+    """
+
+    def __init__(self, restore=False, using=None):
+        self.restore = restore
+        self.using = using
+        self.querysets = {}  # model -> queryset of descendants to flip
+        self.order = []  # descendants always come before their ancestors
+
+    def collect(self, queryset):
+        self._collect(queryset.model, queryset, {queryset.model})
+
+    def _collect(self, model, queryset, path):
+        for relation in get_cascade_relations(model):
+            related_model = relation.related_model
+            if related_model in path:
+                continue
+            field_name = relation.field.name
+            children = related_model.all_objects.using(self.using).filter(
+                **{f'{field_name}__in': queryset.values('pk')}
+            )
+            if self.restore:
+                # Only bring back rows removed by the same cascade as their parent
+                children = children.filter(
+                    is_deleted=True, deleted_at=models.F(f'{field_name}__deleted_at')
+                )
+            else:
+                children = children.filter(is_deleted=False)
+            if related_model in self.querysets:
+                self.querysets[related_model] = self.querysets[related_model] | children
+            else:
+                self.querysets[related_model] = children
+            self._collect(related_model, children, path | {related_model})
+            if related_model not in self.order:
+                self.order.append(related_model)
+
+    def counts(self):
+        return {model._meta.label: self.querysets[model].count() for model in self.order}
+
+    def execute(self, deleted_at=None):
+        counts = {}
+        for model in self.order:
+            if self.restore:
+                model.before_bulk_restore(self.querysets[model])
+                counts[model._meta.label] = self.querysets[model].update(is_deleted=False, deleted_at=None)
+            else:
+                model.before_bulk_delete(self.querysets[model])
+                counts[model._meta.label] = self.querysets[model].update(is_deleted=True, deleted_at=deleted_at)
+        return counts
+
+
+def get_cascade(cascade):
+    return get_settings()['cascade'] if cascade is None else cascade
+
+
+def has_updated_at(model):
+    try:
+        model._meta.get_field('updated_at')
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+class ChangeTrackingQuerySet(models.query.QuerySet):
+    # Bulk writes skip post_save, so they report the touched model themselves
+    def update(self, **kwargs):
+        # ...and skip auto_now, so stamp updated_at the way save() would
+        if 'updated_at' not in kwargs and has_updated_at(self.model):
+            kwargs['updated_at'] = timezone.now()
+        rows = super().update(**kwargs)
+        if rows:
+            rows_changed.send(sender=self.model, fields=frozenset(kwargs), using=self.db)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            rows_changed.send(sender=self.model, fields=None, using=self.db)
+        return objs
+
+
+class SoftDeleteQuerySet(ChangeTrackingQuerySet):
+    def delete(self, cascade=None, dry_run=False):
+        collector = SoftDeleteCollector(using=self.db)
+        if get_cascade(cascade):
+            collector.collect(self)
+        if dry_run:
+            counts = {self.model._meta.label: self.count(), **collector.counts()}
+            return sum(counts.values()), counts
+        with transaction.atomic(using=self.db):
+            deleted_at = timezone.now()
+            counts = collector.execute(deleted_at)
+            self.model.before_bulk_delete(self.filter(is_deleted=False))
+            counts[self.model._meta.label] = self.update(is_deleted=True, deleted_at=deleted_at)
+        return sum(counts.values()), counts
 
     def hard_delete(self):
-        return super().delete()
+        with transaction.atomic(using=self.db):
+            self.model.before_bulk_delete(self.filter(is_deleted=False))
+            return super().delete()
 
 
 class SoftDeleteManager(models.Manager):
@@ -31,10 +167,20 @@ class SoftDeleteManager(models.Manager):
         return SoftDeleteQuerySet(self.model, using=self._db).filter(is_deleted=False)
 
 
-class DeletedQuerySet(models.query.QuerySet):
-    def restore(self, *args, **kwargs):
+class DeletedQuerySet(ChangeTrackingQuerySet):
+    def restore(self, *args, cascade=None, dry_run=False, **kwargs):
         qs = self.filter(*args, **kwargs)
-        qs.update(is_deleted=False, deleted_at=None)
+        collector = SoftDeleteCollector(restore=True, using=qs.db)
+        if get_cascade(cascade):
+            collector.collect(qs)
+        if dry_run:
+            counts = {qs.model._meta.label: qs.count(), **collector.counts()}
+            return sum(counts.values()), counts
+        with transaction.atomic(using=qs.db):
+            counts = collector.execute()
+            qs.model.before_bulk_restore(qs)
+            counts[qs.model._meta.label] = qs.update(is_deleted=False, deleted_at=None)
+        return sum(counts.values()), counts
 
 
 class DeletedManager(models.Manager):
@@ -42,7 +188,7 @@ class DeletedManager(models.Manager):
         return DeletedQuerySet(self.model, using=self._db).filter(is_deleted=True)
 
 
-class GlobalManager(models.Manager):
+class GlobalManager(models.Manager.from_queryset(ChangeTrackingQuerySet)):
     pass
 
 
@@ -58,54 +204,74 @@ class SoftDeleteModel(models.Model):
     class Meta:
         abstract = True
 
-    def delete(self, cascade=None, *args, **kwargs):
-        cascade = get_settings()['cascade']
-        self.is_deleted = True
-        self.deleted_at = timezone.now()
-        self.save()
-        self.after_delete()
-        if cascade:
-            self.delete_related_objects()
-        # TODO: Call soft_delete_signals
-
-    def restore(self, cascade=None):
-        cascade = get_settings()['cascade']
-        self.is_deleted = False
-        self.deleted_at = None
-        self.save()
-        self.after_restore()
-        if cascade:
-            self.restore_related_objects()
-        # TODO: Call soft_delete_signals
+    def delete(self, cascade=None, dry_run=False, *args, **kwargs):
+        collector = SoftDeleteCollector(using=self._state.db)
+        if get_cascade(cascade):
+            collector.collect(self.get_self_queryset())
+        if dry_run:
+            counts = {self._meta.label: 1, **collector.counts()}
+            return sum(counts.values()), counts
+        with transaction.atomic(using=self._state.db):
+            was_deleted = self.is_deleted
+            self.is_deleted = True
+            self.deleted_at = timezone.now()
+            counts = collector.execute(self.deleted_at)
+            self.save()
+            counts[self._meta.label] = 1
+            if not was_deleted:
+                self.after_delete()
+                post_soft_delete.send(sender=type(self), instance=self)
+        return sum(counts.values()), counts
+
+    def restore(self, cascade=None, dry_run=False):
+        collector = SoftDeleteCollector(restore=True, using=self._state.db)
+        if get_cascade(cascade):
+            collector.collect(self.get_self_queryset())
+        if dry_run:
+            counts = {self._meta.label: 1, **collector.counts()}
+            return sum(counts.values()), counts
+        with transaction.atomic(using=self._state.db):
+            was_deleted = self.is_deleted
+            counts = collector.execute()
+            self.is_deleted = False
+            self.deleted_at = None
+            self.save()
+            counts[self._meta.label] = 1
+            if was_deleted:
+                self.after_restore()
+                post_restore.send(sender=type(self), instance=self)
+        return sum(counts.values()), counts
 
     def hard_delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
 
-    def get_related_objects(self):
-        attributes = vars(self._meta.model)
-        reverse_attributes = [
-            a
-            for a, b in attributes.items()
-            if type(b) in [ReverseManyToOneDescriptor, ReverseOneToOneDescriptor]
-        ]
-        related_objects = []
-        for reverse_attribute in reverse_attributes:
-            try:
-                related_objects.extend(list(getattr(self, reverse_attribute).all()))
-            except:
-                pass
-        return related_objects
+    def get_self_queryset(self):
+        # Reads the stored row, so restore still matches the original deleted_at
+        return type(self).all_objects.using(self._state.db).filter(pk=self.pk)
 
     def delete_related_objects(self):
-        for obj in self.get_related_objects():
-            obj.delete()
+        collector = SoftDeleteCollector(using=self._state.db)
+        collector.collect(self.get_self_queryset())
+        return collector.execute(timezone.now())
 
     def restore_related_objects(self):
-        for obj in self.get_related_objects():
-            obj.restore()
+        collector = SoftDeleteCollector(restore=True, using=self._state.db)
+        collector.collect(self.get_self_queryset())
+        return collector.execute()
 
+    # Hooks run inside the delete/restore transaction, only when the state changes
     def after_delete(self):
         pass
 
     def after_restore(self):
         pass
+
+    # Their set-based counterparts for queryset deletes, restores and cascades,
+    # given the rows about to change before the UPDATE runs
+    @classmethod
+    def before_bulk_delete(cls, queryset):
+        pass
+
+    @classmethod
+    def before_bulk_restore(cls, queryset):
+        pass
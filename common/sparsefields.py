@@ -0,0 +1,63 @@
+from rest_framework.exceptions import ValidationError
+
+SELECTION_PARAMS = ('fields', 'omit', 'expand')
+
+
+def parse_names(value):
+    names = frozenset(name.strip() for name in value.split(',') if name.strip()) if value else None
+    return names or None
+
+
+def get_selection(request):
+    # ?fields=, ?omit= and ?expand= as serializer kwargs
+    return {param: parse_names(request.query_params.get(param)) for param in SELECTION_PARAMS}
+
+
+def is_selected(serializer, name):
+    return serializer.is_selected(name) if isinstance(serializer, SparseFieldsetMixin) else True
+
+
+class SparseFieldsetMixin:
+    """
+    Lets the client shape a serializer's output: ``fields`` keeps only the
+    named keys, ``omit`` drops them, and ``expand`` renders the relations in
+    ``Meta.expandable_fields`` as nested objects instead of primary keys.
+    Writes still go through every field.
+
+    ``Meta.computed_fields`` names the keys to_representation adds itself;
+    it adds them only when is_selected().
+    """
+
+    def __init__(self, *args, fields=None, omit=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selected_fields = fields
+        self.omitted_fields = omit or frozenset()
+        self.expansions = {}
+
+        meta = getattr(self, 'Meta', None)
+        known = {name for name, field in self.fields.items() if not field.write_only}
+        known.update(getattr(meta, 'computed_fields', ()))
+        for param, names in (('fields', fields), ('omit', omit)):
+            unknown = sorted(set(names or ()) - known)
+            if unknown:
+                raise ValidationError({param: f"Unknown field(s): {', '.join(unknown)}."})
+
+        expandable = getattr(meta, 'expandable_fields', {})
+        unknown = sorted(set(expand or ()) - set(expandable))
+        if unknown:
+            raise ValidationError({'expand': f"Cannot expand: {', '.join(unknown)}."})
+        for name in expand or ():
+            serializer = expandable[name](read_only=True)
+            serializer.bind(name, self)
+            self.expansions[name] = serializer
+
+    def is_selected(self, name):
+        if name in self.omitted_fields:
+            return False
+        return self.selected_fields is None or name in self.selected_fields
+
+    @property
+    def _readable_fields(self):
+        for field in super()._readable_fields:
+            if self.is_selected(field.field_name):
+                yield self.expansions.get(field.field_name, field)
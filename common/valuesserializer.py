@@ -0,0 +1,164 @@
+import decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .sparsefields import is_selected
+
+
+def compile_decimal(field):
+    # DecimalField.to_representation with the quantize context built once
+    if not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING) or field.localize:
+        return field.to_representation
+    if field.decimal_places is None:
+        return lambda value: '{:f}'.format(value)
+    quantum = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def to_representation(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(quantum, rounding=rounding, context=context))
+    return to_representation
+
+
+def compile_datetime(field):
+    # DateTimeField.to_representation for the aware values the database returns
+    if getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() != ISO_8601 or not settings.USE_TZ:
+        return field.to_representation
+
+    def to_representation(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        field_timezone = field.timezone if hasattr(field, 'timezone') else timezone.get_current_timezone()
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return to_representation
+
+
+def compile_choice(field):
+    choices = field.choice_strings_to_values
+    return lambda value: value if value == '' else choices.get(str(value), value)
+
+
+def compile_converter(field):
+    """
+    A function giving the same output as ``field.to_representation`` for a
+    non-null column value, or None when the value passes through unchanged.
+    """
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        if field.pk_field is not None:
+            return field.pk_field.to_representation
+        return None  # The <fk>_id column is the pk
+    if isinstance(field, serializers.BooleanField):
+        return bool
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, serializers.FloatField):
+        return float
+    if isinstance(field, serializers.DecimalField):
+        return compile_decimal(field)
+    if isinstance(field, serializers.DateTimeField):
+        return compile_datetime(field)
+    if isinstance(field, serializers.DateField):
+        if getattr(field, 'format', api_settings.DATE_FORMAT).lower() == ISO_8601:
+            return lambda value: value.isoformat()
+        return field.to_representation
+    if isinstance(field, serializers.ChoiceField):
+        return compile_choice(field)
+    if isinstance(field, serializers.CharField):
+        return str
+    if isinstance(field, (serializers.TimeField, serializers.DurationField)):
+        return field.to_representation
+    raise ImproperlyConfigured(f"{type(field).__name__} '{field.field_name}' has no values() representation.")
+
+
+class ValuesSerializer:
+    """
+    Renders values() rows exactly as ``serializer_class`` renders instances,
+    without building model instances or running field objects per row.
+
+    Readable fields must map onto concrete columns, or onto a database
+    expression in ``annotations``. ``extra_fields`` are appended after them,
+    as keys a serializer's to_representation adds: name -> (expression,
+    function turning the annotated value into the output value).
+
+    ``selection`` is passed on to ``serializer_class``, e.g. the ``fields``
+    and ``omit`` of a sparse fieldset; see select().
+    """
+
+    serializer_class = None
+    annotations = {}
+    extra_fields = {}
+
+    def __init__(self, **selection):
+        self.selection = selection
+
+    @lru_cache(maxsize=64)
+    def select(self, **selection):
+        # One instance, so one compiled plan, per selection
+        return type(self)(**selection)
+
+    @cached_property
+    def plan(self):
+        serializer = self.serializer_class(**self.selection)
+        model = self.serializer_class.Meta.model
+        columns = {field.name: field.attname for field in model._meta.concrete_fields}
+        plan = []
+        for field in serializer._readable_fields:
+            if field.field_name in self.annotations:
+                key = field.field_name
+            elif field.source in columns and not isinstance(field, serializers.BaseSerializer):
+                key = columns[field.source]
+            else:
+                raise ImproperlyConfigured(
+                    f"{self.serializer_class.__name__}.{field.field_name} needs an entry in "
+                    f"{type(self).__name__}.annotations."
+                )
+            plan.append((field.field_name, key, compile_converter(field)))
+        for name, (_, converter) in self.extra_fields.items():
+            if is_selected(serializer, name):
+                plan.append((name, name, converter))
+        return plan
+
+    def get_annotations(self):
+        keys = {key for _, key, _ in self.plan}
+        expressions = {
+            **self.annotations,
+            **{name: expression for name, (expression, _) in self.extra_fields.items()},
+        }
+        return {name: expression for name, expression in expressions.items() if name in keys}
+
+    def annotate(self, queryset):
+        return queryset.annotate(**self.get_annotations())
+
+    def get_rows(self, queryset):
+        # values() can't carry prefetches, and the rows need none
+        annotations = self.get_annotations()
+        columns = [key for _, key, _ in self.plan if key not in annotations]
+        return queryset.prefetch_related(None).annotate(**annotations).values(*columns, *annotations)
+
+    def to_representation(self, row):
+        return {
+            name: None if row[key] is None else converter(row[key]) if converter else row[key]
+            for name, key, converter in self.plan
+        }
+
+    def to_representation_many(self, rows):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
+
+    def is_annotated(self, instance):
+        return all(hasattr(instance, name) for name in self.get_annotations())
+
+    def instance_to_representation(self, instance):
+        # The instance must come from annotate(); see is_annotated()
+        return self.to_representation({key: getattr(instance, key) for _, key, _ in self.plan})
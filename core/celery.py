@@ -8,9 +8,17 @@ app = Celery("core")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
+# Rooms are released by per-booking ETA tasks scheduled from BookingViewSet;
+# the hourly sweep reconciles anything those tasks missed over the last day,
+# and the nightly full sweep anything older.
 app.conf.beat_schedule = {
-    "update-room-status-every-minute": {
+    "reconcile-room-status-hourly": {
         "task": "hotel.tasks.update_room_status",
-        "schedule": crontab(),
+        "schedule": crontab(minute=0),
+    },
+    "reconcile-room-status-nightly": {
+        "task": "hotel.tasks.update_room_status",
+        "schedule": crontab(minute=30, hour=3),
+        "kwargs": {"full": True},
     },
 }
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -61,6 +62,16 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_PAGINATION_CLASS": "common.paginations.DynamicPagination",
     "PAGE_SIZE": 100,
+    # DRF's JSON renderer and parser, on orjson when it is installed
+    "DEFAULT_RENDERER_CLASSES": [
+        "common.jsoncodec.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "common.jsoncodec.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 SIMPLE_JWT = {
@@ -98,6 +109,9 @@ SIMPLE_JWT = {
 
 
 MIDDLEWARE = [
+    "common.metrics.MetricsMiddleware",
+    "common.slowqueries.SlowQueryMiddleware",
+    "common.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -195,6 +209,85 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "account.User"
 
 
+# Cache
+# Paginated list counts go to the "counts" alias; set COUNT_CACHE_REDIS_URL
+# (e.g. redis://localhost:6379/1) to share them between processes.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "counts": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "counts",
+    },
+    "slow_queries": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(tempfile.gettempdir(), "myhotel-slow-queries"),
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+}
+
+if os.environ.get("COUNT_CACHE_REDIS_URL"):
+    CACHES["counts"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["COUNT_CACHE_REDIS_URL"],
+    }
+    CACHES["slow_queries"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["COUNT_CACHE_REDIS_URL"],
+        "KEY_PREFIX": "slow_queries",
+    }
+    CACHES["responses"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["COUNT_CACHE_REDIS_URL"],
+        "KEY_PREFIX": "responses",
+    }
+
+COUNT_CACHE_TIMEOUT = 300
+# Writes to these apps' models retire cached counts (soft-delete models always do)
+COUNT_CACHE_APPS = ["account", "hotel"]
+# Hotel and room type responses are cached in "responses". RESPONSE_CACHE is
+# "shared" (on only when it and "counts" are shared by every worker, i.e. with
+# COUNT_CACHE_REDIS_URL set, e.g. to the Redis Celery already uses, on another
+# database: redis://localhost:6379/1), "on" (any cache, for a single-process
+# server such as runserver: local-memory caches in several workers would serve
+# entries other workers' writes retired) or "off".
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "shared")
+RESPONSE_CACHE_ALIAS = "responses"
+
+# Request metrics, scraped from /internal/metrics/ by staff users or the
+# networks below. Every request records latency and size; only the sampled
+# share also counts SQL and serializer time; 0 turns sampling off.
+METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", "0.1"))
+METRICS_SLOW_REQUEST_MS = int(os.environ.get("METRICS_SLOW_REQUEST_MS", "1000"))
+METRICS_SLOW_REQUEST_STATEMENTS = 5
+# Matched against REMOTE_ADDR, which is the proxy's address behind a reverse
+# proxy, so even loopback is opt-in, e.g. "127.0.0.0/8,::1/128".
+METRICS_ALLOWED_NETWORKS = [
+    network.strip() for network in os.environ.get("METRICS_ALLOWED_NETWORKS", "").split(",") if network.strip()
+]
+
+# Statements slower than this are recorded with their EXPLAIN plan and origin
+# (view or Celery task) in a ring buffer; see `manage.py slow_queries`. The
+# buffer lives in the "slow_queries" cache, shared by every process on the
+# host, or through Redis when COUNT_CACHE_REDIS_URL is set. None disables it.
+# Only Redis hands out slots atomically; with the file-based cache, entries
+# recorded by two processes at the same moment may overwrite each other.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_BUFFER_SIZE = 500
+SLOW_QUERY_CACHE_ALIAS = "slow_queries"
+
+# JSON, NDJSON and CSV responses are compressed with zstd, br (when the
+# zstandard/brotli packages are installed) or gzip, as Accept-Encoding allows.
+# HTML is not, so pages with a CSRF token stay out of reach of BREACH.
+# Smaller bodies are sent as they are; levels trade CPU for bytes per coding.
+# Streamed exports are flushed to the client every COMPRESSION_FLUSH_BYTES.
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+COMPRESSION_FLUSH_BYTES = 64 * 1024
+
+
 # Base url to serve media files
 MEDIA_URL = "/media/"
 
@@ -204,8 +297,10 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media/")
 
 # myproject/settings.py
 
-CELERY_BROKER_URL = "redis://localhost:6379/0"
-CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+# Set CELERY_TASK_ALWAYS_EAGER=1 (e.g. with CELERY_BROKER_URL=memory://) to run tasks without Redis
+CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_TASK_ALWAYS_EAGER") == "1"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class HotelConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'hotel'
+
+    def ready(self):
+        from common import countcache, slowqueries, softdelete
+        from hotel import occupancy
+
+        # Every model is loaded by now, so a bad relation fails at startup rather than on the first delete
+        softdelete.build_cascade_registry()
+        countcache.connect_signals()
+        slowqueries.connect_signals()
+        occupancy.connect_signals()
@@ -0,0 +1,37 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+CONTENT_TYPES = {
+    CSV: 'text/csv',
+    NDJSON: 'application/x-ndjson',
+}
+
+
+class Echo:
+    # csv.writer only needs write(); hand each formatted line straight back
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, output_format, chunk_size=2000):
+    """
+    Yield the rows of a ``values()`` queryset as CSV or NDJSON lines.
+
+    ``iterator()`` streams from a server-side cursor where the backend has one,
+    so memory stays flat however many rows are exported.
+    """
+    rows = queryset.iterator(chunk_size=chunk_size)
+    if output_format == CSV:
+        writer = csv.writer(Echo())
+        columns = list(queryset.query.values_select) + list(queryset.query.annotation_select)
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([row[column] for column in columns])
+    else:
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        for row in rows:
+            yield encoder.encode(row) + '\n'
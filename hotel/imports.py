@@ -0,0 +1,278 @@
+import csv
+import json
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Booking, Guest, Hotel, Room, RoomType, is_lock_error
+from .tasks import new_checkout_task_id, schedule_checkouts
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+CONTENT_TYPE_FORMATS = {
+    'text/csv': CSV,
+    'application/csv': CSV,
+    'application/x-ndjson': NDJSON,
+    'application/ndjson': NDJSON,
+    'application/jsonl': NDJSON,
+}
+
+
+def read_rows(lines, input_format):
+    """Yield one dict per input row from an iterable of text lines."""
+    if input_format == CSV:
+        yield from csv.DictReader(lines)
+    elif input_format == NDJSON:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("Each NDJSON line must be a JSON object.")
+            yield row
+    else:
+        raise ValueError(f"Unsupported import format: {input_format}")
+
+
+def get_error_messages(error):
+    if isinstance(error, ValidationError):
+        return error.messages
+    return [str(error)]
+
+
+class ModelImporter:
+    """
+    Validates and inserts rows for one model a batch at a time.
+
+    Plain columns go through the model field's own ``clean``; foreign keys are
+    resolved with one ``in_bulk`` query per batch instead of one per row.
+    """
+
+    model = None
+    fields = []
+    foreign_keys = {}  # column -> queryset the ids must exist in
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.model_fields = {name: self.model._meta.get_field(name) for name in self.fields}
+
+    def clean_row(self, row):
+        values, errors = {}, {}
+        for name, field in self.model_fields.items():
+            raw = row.get(name)
+            if raw in (None, '') and field.has_default():
+                values[name] = field.get_default()
+                continue
+            try:
+                values[name] = field.clean(None if raw == '' and field.null else raw, None)
+            except ValidationError as e:
+                errors[name] = e.messages
+        return values, errors
+
+    def resolve_foreign_keys(self, rows):
+        related = {}
+        for column, queryset in self.foreign_keys.items():
+            ids = {row[column] for row in rows if row.get(column) not in (None, '')}
+            try:
+                related[column] = queryset.in_bulk(ids)
+            except (TypeError, ValueError, ValidationError):
+                # Fall back to resolving what parses; bad ids are reported per row
+                related[column] = queryset.in_bulk(id for id in ids if str(id).isdigit())
+        return related
+
+    def build(self, values, related):
+        return self.model(**values)
+
+    def lock_batch(self, instances):
+        # Hook run first in the batch transaction, before check_batch
+        pass
+
+    def check_batch(self, instances):
+        # Hook for cross-row checks; returns {position: [messages]}
+        return {}
+
+    def after_batch(self, instances):
+        # Hook run last in the batch transaction, with the created instances
+        pass
+
+    def import_batch(self, numbered_rows):
+        rows = [row for _, row in numbered_rows]
+        related = self.resolve_foreign_keys(rows)
+        instances, row_numbers, errors = [], [], []
+
+        for row_number, row in numbered_rows:
+            values, row_errors = self.clean_row(row)
+            for column, lookup in related.items():
+                raw = row.get(column)
+                obj = lookup.get(raw) or (lookup.get(int(raw)) if str(raw).isdigit() else None)
+                if raw in (None, ''):
+                    row_errors[column] = ["This field is required."]
+                elif obj is None:
+                    row_errors[column] = [f"Unknown {column} '{raw}'."]
+                else:
+                    values[column] = obj
+            if not row_errors:
+                try:
+                    instance = self.build(values, related)
+                except (ValueError, ValidationError) as e:
+                    row_errors['non_field_errors'] = get_error_messages(e)
+                else:
+                    instances.append(instance)
+                    row_numbers.append(row_number)
+                    continue
+            errors.append({'row': row_number, 'errors': row_errors})
+
+        try:
+            with transaction.atomic():
+                self.lock_batch(instances)
+                for position, messages in sorted(self.check_batch(instances).items(), reverse=True):
+                    errors.append({'row': row_numbers[position], 'errors': {'non_field_errors': messages}})
+                    del instances[position]
+                    del row_numbers[position]
+                self.model.objects.bulk_create(instances, batch_size=self.batch_size)
+                self.after_batch(instances)
+        except IntegrityError as e:
+            return 0, errors + self.fail_rows(row_numbers, str(e))
+        except OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            return 0, errors + self.fail_rows(row_numbers, "Another writer holds the lock; import these rows again.")
+        return len(instances), errors
+
+    def fail_rows(self, row_numbers, message):
+        return [{'row': number, 'errors': {'non_field_errors': [message]}} for number in row_numbers]
+
+    def run(self, rows):
+        created, errors, batch = 0, [], []
+        numbered = enumerate(rows, start=1)
+        row_number = 0
+        while True:
+            # Row by row, so malformed input fails its own line and the rows read before it still go in
+            try:
+                row_number, row = next(numbered)
+            except StopIteration:
+                break
+            except (ValueError, csv.Error) as e:
+                # Malformed input (bad JSON line, broken CSV quoting) stops the import
+                errors.append({'row': row_number + 1, 'errors': {'non_field_errors': [str(e)]}})
+                break
+            batch.append((row_number, row))
+            if len(batch) == self.batch_size:
+                created += self.run_batch(batch, errors)
+                batch = []
+        if batch:
+            created += self.run_batch(batch, errors)
+        return {'created': created, 'failed': len(errors), 'errors': sorted(errors, key=lambda e: e['row'])}
+
+    def run_batch(self, batch, errors):
+        batch_created, batch_errors = self.import_batch(batch)
+        errors.extend(batch_errors)
+        return batch_created
+
+
+class GuestImporter(ModelImporter):
+    model = Guest
+    fields = ['first_name', 'last_name', 'date_of_birth', 'address', 'phone', 'email']
+
+
+class RoomImporter(ModelImporter):
+    model = Room
+    fields = ['room_number', 'status']
+    foreign_keys = {
+        'hotel': Hotel.objects.all(),
+        'room_type': RoomType.objects.all(),
+    }
+
+    def check_batch(self, instances):
+        numbers = [room.room_number for room in instances]
+        taken = set(Room.all_objects.filter(room_number__in=numbers).values_list('room_number', flat=True))
+        errors = {}
+        for position, room in enumerate(instances):
+            if room.room_number in taken:
+                errors[position] = [f"Room number '{room.room_number}' already exists."]
+            taken.add(room.room_number)
+        return errors
+
+
+class BookingImporter(ModelImporter):
+    model = Booking
+    fields = ['check_in_date']
+    foreign_keys = {
+        'guest': Guest.objects.all(),
+        # build() prices stays from room_type; schedule_checkouts reads hotel
+        'room': Room.objects.select_related('room_type', 'hotel'),
+    }
+
+    def clean_row(self, row):
+        values, errors = super().clean_row(row)
+        check_out_field = Booking._meta.get_field('check_out_date')
+        try:
+            if row.get('check_out_date') not in (None, ''):
+                values['check_out_date'] = check_out_field.clean(row['check_out_date'], None)
+            elif row.get('number_of_days') not in (None, '') and 'check_in_date' in values:
+                values['check_out_date'] = values['check_in_date'] + timedelta(days=int(row['number_of_days']))
+            else:
+                errors['check_out_date'] = ["Either check_out_date or number_of_days must be provided."]
+        except (TypeError, ValueError, ValidationError) as e:
+            errors['check_out_date'] = get_error_messages(e)
+        return values, errors
+
+    def build(self, values, related):
+        # Same invariants as Booking.save, without a save per row
+        booking = Booking(**values)
+        if booking.check_in_date >= booking.check_out_date:
+            raise ValueError("Check-in date must be before check-out date.")
+        booking.total_price = booking.calculate_total_price()
+        if booking.check_out_date >= timezone.localdate():
+            # Inserted with the row, so after_batch schedules the release without an UPDATE
+            booking.checkout_task_id = new_checkout_task_id()
+        return booking
+
+    def lock_batch(self, instances):
+        # Take the rooms' row locks as BookingViewSet.reserve_room does, without
+        # changing them yet, so the overlap check sees every committed booking
+        Room.objects.filter(pk__in={booking.room_id for booking in instances}).update(
+            status=F('status'), updated_at=F('updated_at')
+        )
+
+    def check_batch(self, instances):
+        if not instances:
+            return {}
+        # One query fetches every active stay that could clash with this batch
+        stays = defaultdict(list)
+        existing = Booking.objects.filter(
+            room_id__in={booking.room_id for booking in instances},
+            check_in_date__lt=max(booking.check_out_date for booking in instances),
+            check_out_date__gt=min(booking.check_in_date for booking in instances),
+        ).values_list('room_id', 'check_in_date', 'check_out_date')
+        for room_id, check_in_date, check_out_date in existing:
+            stays[room_id].append((check_in_date, check_out_date))
+
+        errors = {}
+        for position, booking in enumerate(instances):
+            room_stays = stays[booking.room_id]
+            if any(booking.check_in_date < check_out and check_in < booking.check_out_date
+                   for check_in, check_out in room_stays):
+                errors[position] = ["The room is already booked for these dates."]
+            else:
+                room_stays.append((booking.check_in_date, booking.check_out_date))
+        return errors
+
+    def after_batch(self, instances):
+        # Stays not over yet occupy their room until checkout, as in BookingViewSet.perform_create
+        pending = [booking for booking in instances if booking.checkout_task_id]
+        Room.objects.filter(pk__in={booking.room_id for booking in pending}).update(status=Room.OCCUPIED)
+        schedule_checkouts(pending)
+
+
+IMPORTERS = {
+    'guests': GuestImporter,
+    'rooms': RoomImporter,
+    'bookings': BookingImporter,
+}
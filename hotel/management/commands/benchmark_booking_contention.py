@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import time as dt_time, timedelta
+
+from celery import current_app
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.test import Client
+from django.utils import timezone
+
+from hotel.models import Booking, Guest, Hotel, Room, RoomType
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer POST /api/bookings/ from parallel threads against a few rooms and check "
+        "that no overlapping bookings get through. Uses committed data and removes it afterwards. "
+        "Run with CELERY_TASK_ALWAYS_EAGER=1 CELERY_BROKER_URL=memory:// to keep the broker out of the numbers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=50)
+        parser.add_argument('--attempts', type=int, default=20, help="Booking attempts per thread.")
+        parser.add_argument('--rooms', type=int, default=5)
+        parser.add_argument('--days', type=int, default=30, help="Window of check-in dates to pick from.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not current_app.conf.task_always_eager:
+            self.stdout.write(self.style.WARNING(
+                "Celery is not eager: every booking will also publish a checkout task to the broker."
+            ))
+        hotel, rooms, guest = self.create_fixtures(options['rooms'])
+        try:
+            self.run(hotel, rooms, guest, options)
+        finally:
+            hotel.hard_delete()
+            RoomType.all_objects.filter(pk=rooms[0].room_type_id).delete()
+            guest.hard_delete()
+
+    def create_fixtures(self, room_count):
+        hotel = Hotel.objects.create(
+            name='Contention Hotel', address='-', village='-', district='-', province='-',
+            phone='-', email='bench@example.com', stars=3,
+            check_in_time=dt_time(14), check_out_time=dt_time(12),
+        )
+        room_type = RoomType.objects.create(
+            name='Contention', description='-', price_per_night=100, capacity=2, image='bench.png'
+        )
+        guest = Guest.objects.create(
+            first_name='Bench', last_name='Mark', date_of_birth=timezone.localdate(),
+            address='-', phone='-', email='bench@example.com',
+        )
+        rooms = Room.objects.bulk_create(
+            Room(hotel=hotel, room_type=room_type, room_number=f'contention-{hotel.pk}-{number}')
+            for number in range(room_count)
+        )
+        return hotel, rooms, guest
+
+    def run(self, hotel, rooms, guest, options):
+        start_date = timezone.localdate() + timedelta(days=1)
+        outcomes = Counter()
+        outcomes_lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def worker(seed):
+            rng = random.Random(seed)
+            # Server errors (e.g. SQLite "database is locked") are counted, not raised
+            client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+            barrier.wait()
+            try:
+                for _ in range(options['attempts']):
+                    check_in = start_date + timedelta(days=rng.randrange(options['days']))
+                    response = client.post('/api/bookings/', {
+                        'guest': guest.pk,
+                        'room': rng.choice(rooms).pk,
+                        'check_in_date': check_in.isoformat(),
+                        'check_out_date': (check_in + timedelta(days=rng.randint(1, 4))).isoformat(),
+                    })
+                    with outcomes_lock:
+                        outcomes[response.status_code] += 1
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(options['seed'] + number,))
+            for number in range(options['threads'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        attempts = sum(outcomes.values())
+        overlapping = Booking.objects.filter(room__hotel=hotel).filter(
+            Exists(
+                Booking.objects.filter(
+                    room=OuterRef('room'),
+                    check_in_date__lt=OuterRef('check_out_date'),
+                    check_out_date__gt=OuterRef('check_in_date'),
+                ).exclude(pk=OuterRef('pk'))
+            )
+        ).count()
+
+        self.stdout.write(f"{attempts} attempts from {options['threads']} threads in {elapsed:.2f} s "
+                          f"({attempts / elapsed:.0f} req/s)")
+        self.stdout.write(f"Created: {outcomes[201]}, rejected: {outcomes[400]}, "
+                          f"errors: {attempts - outcomes[201] - outcomes[400]}")
+        if overlapping:
+            self.stdout.write(self.style.ERROR(f"{overlapping} overlapping bookings slipped through!"))
+        else:
+            self.stdout.write(self.style.SUCCESS("No overlapping bookings."))
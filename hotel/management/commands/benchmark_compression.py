@@ -0,0 +1,74 @@
+import io
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import setup_databases, teardown_databases
+
+from account.models import User
+from common.compression import DEFAULT_FLUSH_BYTES, compress_sequence, get_compressors
+
+PAGES = [
+    ('bookings, 50 per page', '/api/bookings/?page_size=50'),
+    ('bookings, 100 rows', '/api/bookings/?pagination=limit_offset&limit=100'),
+    ('bookings, 1000 rows', '/api/bookings/?pagination=limit_offset&limit=1000'),
+    ('bookings, 1000 rows, 4 fields', '/api/bookings/?pagination=cursor&page_size=1000&fields=id,room,check_in_date,check_out_date'),
+    ('rooms, 1000 rows', '/api/rooms/?pagination=limit_offset&limit=1000'),
+    ('bookings export, csv', '/api/bookings/export/?output_format=csv'),
+]
+LEVELS = {'gzip': [1, 6, 9], 'br': [1, 4, 8], 'zstd': [1, 3, 9]}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the CPU cost of each response compression coding and level against the bytes it saves "
+        "on typical /api/bookings/ pages, in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotels', type=int, default=2, help="Hotels to seed.")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--link-kbps', type=int, default=2000, help="Link speed for the transfer estimate.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            call_command(
+                'seed_hotel_data', hotels=options['hotels'], years=1, guests=1000, seed=options['seed'],
+                stdout=io.StringIO(),
+            )
+            user = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            for name, path in PAGES:
+                response = client.get(path, HTTP_ACCEPT_ENCODING='identity')
+                # Streaming bodies are compressed as the middleware does, chunk by chunk
+                chunks = list(response.streaming_content) if response.streaming else [response.content]
+                self.report(name, chunks, options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def report(self, name, chunks, options):
+        size = sum(len(chunk) for chunk in chunks)
+        flush_bytes = getattr(settings, 'COMPRESSION_FLUSH_BYTES', DEFAULT_FLUSH_BYTES)
+        bytes_per_ms = options['link_kbps'] * 1000 / 8 / 1000
+        self.stdout.write(
+            f"{name}: {size} bytes in {len(chunks)} chunk(s), "
+            f"{size / bytes_per_ms:.0f} ms uncompressed at {options['link_kbps']} kbit/s"
+        )
+        for encoding, compressor_class in get_compressors().items():
+            for level in LEVELS[encoding]:
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    compressed = b''.join(compress_sequence(iter(chunks), compressor_class(level), flush_bytes))
+                    timings.append((time.perf_counter() - started) * 1000)
+                cpu_ms = sorted(timings)[len(timings) // 2]
+                self.stdout.write(
+                    f"  {encoding:<4} level {level}: {len(compressed):>9} bytes ({len(compressed) / size:6.1%})  "
+                    f"cpu {cpu_ms:7.2f} ms ({size / 1000 / cpu_ms:6.1f} MB/s)  "
+                    f"cpu + transfer {cpu_ms + len(compressed) / bytes_per_ms:7.0f} ms"
+                )
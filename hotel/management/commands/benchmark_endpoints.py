@@ -0,0 +1,323 @@
+import io
+import json
+import math
+import random
+import time
+from datetime import time as dt_time, timedelta
+
+from celery import current_app
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.utils import CursorDebugWrapper
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_databases, teardown_databases
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from account.models import Group, Permission, User
+from hotel.models import Booking, Guest, Hotel, Payment, Room, RoomType
+from hotel.urls import router
+
+# Most SQL statements one request may issue, whatever the dataset size. A list
+# that grows with the page (an N+1 in a serializer) blows through these at once.
+# Session auth accounts for two queries in every request.
+QUERY_BUDGETS = {
+    'list': 5,
+    'retrieve': 4,
+    'summary': 4,
+    'create hotels': 3,
+    'create rooms': 8,
+    'create bookings': 14,
+    'create payments': 12,
+    # Booking deletes and restores also settle the checkout task after commit
+    'soft-delete': 15,
+    'restore': 17,
+    'hard-delete': 10,
+}
+
+
+class RowCountingCursor(CursorDebugWrapper):
+    rows = 0
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            RowCountingCursor.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        RowCountingCursor.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        RowCountingCursor.rows += len(rows)
+        return rows
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every router endpoint with the test client against seeded datasets of growing "
+        "size, in a throwaway test database. Records p50/p95 latency, SQL queries and rows fetched "
+        "per endpoint, and fails when an endpoint exceeds its query budget or answers with an error. Run with "
+        "CELERY_TASK_ALWAYS_EAGER=1 CELERY_BROKER_URL=memory:// to keep the broker out of the numbers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,20', help="Comma-separated hotel counts, seeded cumulatively.")
+        parser.add_argument('--years', type=float, default=1, help="Years of booking history per hotel.")
+        parser.add_argument('--repeat', type=int, default=20, help="Requests per endpoint and size.")
+        parser.add_argument('--output', default='benchmark-endpoints.json', help="Where to write the JSON results.")
+        parser.add_argument('--budgets', help="JSON file of {budget name: max queries} overriding the defaults.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers.")
+        budgets = dict(QUERY_BUDGETS)
+        if options['budgets']:
+            with open(options['budgets']) as f:
+                budgets.update(json.load(f))
+        if not current_app.conf.task_always_eager:
+            self.stdout.write(self.style.WARNING(
+                "Celery is not eager: booking writes will also publish checkout tasks to the broker."
+            ))
+
+        self.rng = random.Random(options['seed'])
+        results, violations = [], []
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            self.create_accounts()
+            seeded = 0
+            for size in sizes:
+                call_command(
+                    'seed_hotel_data', hotels=size - seeded, years=options['years'], guests=max(100, size * 500),
+                    seed=options['seed'] + size, stdout=io.StringIO(),
+                )
+                seeded = size
+                dataset = {'hotels': Hotel.objects.count(), 'bookings': Booking.objects.count()}
+                self.stdout.write(f"Dataset: {dataset['hotels']} hotels, {dataset['bookings']} bookings")
+                for result in self.run_dataset(options['repeat']):
+                    result['dataset'] = dataset
+                    result['budget'] = budgets.get(result['budget_name'])
+                    results.append(result)
+                    over = result['budget'] is not None and result['max_queries'] > result['budget']
+                    if over:
+                        violations.append(f"{result['endpoint']} ({result['max_queries']} > {result['budget']} queries)")
+                    if result.get('identical') is False:
+                        violations.append(f"{result['endpoint']} (output differs)")
+                    # A 4xx or 5xx is usually cheap, so its numbers would pass for a fast endpoint
+                    if result['errors']:
+                        violations.append(f"{result['endpoint']} ({result['errors']} error response(s))")
+                    self.stdout.write(
+                        f"  {result['endpoint']:<42} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+                        f"queries {result['max_queries']:>3}/{result['budget']}  rows {result['max_rows']:>6}  "
+                        f"bytes {result.get('max_bytes', 0):>8}"
+                        + (f"  x{result['speedup']:.2f} vs serializer" if 'speedup' in result else "")
+                        + ("  OVER BUDGET" if over else "")
+                        + ("  OUTPUT DIFFERS" if result.get('identical') is False else "")
+                        + (f"  {result['errors']} ERRORS {result['statuses']}" if result['errors'] else "")
+                    )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        with open(options['output'], 'w') as f:
+            json.dump({'results': results, 'violations': violations}, f, indent=2, default=str)
+        self.stdout.write(f"Wrote {len(results)} results to {options['output']}")
+        if violations:
+            raise CommandError(
+                f"{len(set(violations))} endpoint(s) over their query budget, rendering differently or failing: "
+                + ', '.join(sorted(set(violations)))
+            )
+        self.stdout.write(self.style.SUCCESS("All endpoints succeeded within their query budgets."))
+
+    def create_accounts(self):
+        self.user = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+        User.objects.bulk_create(
+            User(username=f'user{number}', email=f'user{number}@example.com') for number in range(50)
+        )
+        permissions = Permission.objects.bulk_create(
+            Permission(name=f'Permission {number}', code=f'perm_{number}') for number in range(20)
+        )
+        for number in range(10):
+            Group.objects.create(name=f'Group {number}').permission.set(permissions[:number])
+
+    def run_dataset(self, repeat):
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(self.user)
+        for prefix, viewset, basename in router.registry:
+            queryset = viewset.queryset
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:500])
+            yield self.measure(f'GET /api/{prefix}/', 'list', repeat, lambda: ('get', f'/api/{prefix}/', None))
+            if ids:
+                yield self.measure(
+                    f'GET /api/{prefix}/{{id}}/', 'retrieve', repeat,
+                    lambda: ('get', f'/api/{prefix}/{self.rng.choice(ids)}/', None),
+                )
+        for prefix, viewset, basename in router.registry:
+            if getattr(viewset, 'values_serializer', None) is not None:
+                yield from self.compare_values_serializer(prefix, viewset, repeat)
+        # Sparse fieldsets shrink the payload and the columns read; expand joins instead of a second request
+        for path in (
+            '/api/bookings/?pagination=limit_offset&limit=1000',
+            '/api/bookings/?pagination=limit_offset&limit=1000&fields=id,room,check_in_date,check_out_date',
+            '/api/bookings/?pagination=limit_offset&limit=1000&expand=room,guest',
+        ):
+            yield self.measure(f'GET {path}', 'list', repeat, lambda: ('get', path, None))
+        yield self.measure('GET /api/hotels/summary/', 'summary', repeat, lambda: ('get', '/api/hotels/summary/', None))
+        yield self.measure('POST /api/hotels/', 'create hotels', repeat, lambda: ('post', '/api/hotels/', self.hotel_payload()))
+        yield self.measure('POST /api/rooms/', 'create rooms', repeat, lambda: ('post', '/api/rooms/', self.room_payload()))
+        yield self.measure('POST /api/bookings/', 'create bookings', repeat, lambda: ('post', '/api/bookings/', self.booking_payload()))
+        yield self.measure('POST /api/payments/', 'create payments', repeat, lambda: ('post', '/api/payments/', self.payment_payload()))
+        for prefix, model in [('hotels', Hotel), ('rooms', Room), ('bookings', Booking), ('payments', Payment)]:
+            # Soft delete and restore the same rows, so every size keeps its data
+            targets = list({self.random_pk(model.objects.all()) for _ in range(repeat)})
+            deleted = iter(targets)
+            yield self.measure(
+                f'DELETE /api/{prefix}/{{id}}/', 'soft-delete', len(targets),
+                lambda: ('delete', f'/api/{prefix}/{next(deleted)}/', None),
+            )
+            restored = iter(targets)
+            yield self.measure(
+                f'POST /api/{prefix}/{{id}}/restore/', 'restore', len(targets),
+                lambda: ('post', f'/api/{prefix}/{next(restored)}/restore/', None),
+            )
+            yield self.measure(
+                f'DELETE /api/{prefix}/{{id}}/hard_delete/', 'hard-delete', repeat,
+                lambda: ('delete', f'/api/{prefix}/{self.create_disposable(model).pk}/hard_delete/', None),
+            )
+
+    def measure(self, endpoint, budget_name, repeat, prepare):
+        latencies, query_counts, row_counts, sizes, statuses = [], [], [], [], {}
+        original = connection.make_debug_cursor
+        connection.make_debug_cursor = lambda cursor: RowCountingCursor(cursor, connection)
+        try:
+            for _ in range(repeat):
+                method, path, data = prepare()
+                RowCountingCursor.rows = 0
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    if method == 'get':
+                        response = self.client.get(path)
+                    else:
+                        response = getattr(self.client, method)(path, data or {}, content_type='application/json')
+                    latencies.append((time.perf_counter() - started) * 1000)
+                query_counts.append(len(captured.captured_queries))
+                row_counts.append(RowCountingCursor.rows)
+                sizes.append(len(response.content))
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        finally:
+            connection.make_debug_cursor = original
+        return {
+            'endpoint': endpoint,
+            'budget_name': budget_name,
+            'requests': repeat,
+            'p50_ms': round(percentile(latencies, 0.5), 3) if latencies else 0,
+            'p95_ms': round(percentile(latencies, 0.95), 3) if latencies else 0,
+            'max_queries': max(query_counts, default=0),
+            'max_rows': max(row_counts, default=0),
+            'max_bytes': max(sizes, default=0),
+            'statuses': statuses,
+            'errors': sum(count for status, count in statuses.items() if status >= 400),
+        }
+
+    def compare_values_serializer(self, prefix, viewset, repeat):
+        # The same 1000-row page through the values() path and through serializer_class
+        path = f'/api/{prefix}/?pagination=limit_offset&limit=1000'
+        values_serializer = viewset.values_serializer
+        fast_content = self.client.get(path).content
+        fast = self.measure(f'GET {path}', 'list', repeat, lambda: ('get', path, None))
+        fast_serialize = self.time_serialization(lambda: values_serializer.to_representation_many(
+            list(values_serializer.get_rows(viewset.queryset.all())[:1000])
+        ), repeat)
+        viewset.values_serializer = None
+        try:
+            slow_content = self.client.get(path).content
+            slow = self.measure(f'GET {path} (serializer_class)', 'list', repeat, lambda: ('get', path, None))
+        finally:
+            viewset.values_serializer = values_serializer
+        slow_serialize = self.time_serialization(lambda: viewset.serializer_class(
+            list(viewset.queryset.all()[:1000]), many=True
+        ).data, repeat)
+        fast['identical'] = fast_content == slow_content
+        fast['speedup'] = round(slow['p50_ms'] / fast['p50_ms'], 2) if fast['p50_ms'] else None
+        yield slow
+        yield fast
+        yield {
+            'endpoint': f'fetch + serialize 1000 {prefix}', 'budget_name': None, 'requests': repeat,
+            'p50_ms': fast_serialize, 'p95_ms': fast_serialize, 'max_queries': 0, 'max_rows': 1000, 'statuses': {}, 'errors': 0,
+            'baseline_p50_ms': slow_serialize,
+            'speedup': round(slow_serialize / fast_serialize, 2) if fast_serialize else None,
+        }
+
+    def time_serialization(self, serialize, repeat):
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            serialize()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return round(percentile(latencies, 0.5), 3)
+
+    def random_pk(self, queryset):
+        # A random point in the id range avoids ORDER BY RANDOM() over the whole table
+        bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return None
+        start = self.rng.randint(bounds['low'], bounds['high'])
+        return queryset.filter(pk__gte=start).order_by('pk').values_list('pk', flat=True).first()
+
+    def hotel_payload(self):
+        return {
+            'name': 'Benchmark Hotel', 'address': '-', 'village': '-', 'district': '-', 'province': '-',
+            'phone': '-', 'email': 'bench@example.com', 'stars': 3,
+            'check_in_time': '14:00', 'check_out_time': '12:00',
+        }
+
+    def room_payload(self):
+        return {
+            'hotel': self.random_pk(Hotel.objects.all()),
+            'room_type': self.random_pk(RoomType.objects.all()),
+            'room_number': f'b-{self.rng.getrandbits(48):x}',
+        }
+
+    def booking_payload(self):
+        # Past the seeded horizon, on a random room, so the stay is almost always free
+        check_in = timezone.localdate() + timedelta(days=400 + self.rng.randrange(3000))
+        return {
+            'guest': self.random_pk(Guest.objects.all()),
+            'room': self.random_pk(Room.objects.all()),
+            'check_in_date': check_in.isoformat(),
+            'check_out_date': (check_in + timedelta(days=self.rng.randint(1, 5))).isoformat(),
+        }
+
+    def payment_payload(self):
+        return {'booking': self.random_pk(Booking.objects.filter(amount_paid=0)), 'payment_method': Payment.PAYMENT_METHOD_CASH}
+
+    def create_disposable(self, model):
+        hotel = Hotel.objects.create(
+            name='Disposable', address='-', village='-', district='-', province='-', phone='-',
+            email='bench@example.com', stars=1, check_in_time=dt_time(14), check_out_time=dt_time(12),
+        )
+        if model is Hotel:
+            return hotel
+        room = Room.objects.create(
+            hotel=hotel, room_type=RoomType.objects.first(), room_number=f'd-{self.rng.getrandbits(48):x}'
+        )
+        if model is Room:
+            return room
+        check_in = timezone.localdate() + timedelta(days=30)
+        booking = Booking.objects.create(
+            guest=Guest.objects.first(), room=room, check_in_date=check_in, check_out_date=check_in + timedelta(days=2)
+        )
+        if model is Booking:
+            return booking
+        return Payment.objects.create(booking=booking, amount=booking.total_price, payment_date=check_in)
@@ -0,0 +1,112 @@
+import io
+import random
+import time
+import uuid
+from datetime import time as dt_time, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework import parsers, renderers
+
+from common import jsoncodec
+from hotel.models import Booking, Hotel
+from hotel.serializers import BookingSerializer, HotelSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the JSON renderer and parser in common.jsoncodec with DRF's on list-sized "
+        "BookingSerializer and HotelSerializer payloads. No database is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help="Rows per payload.")
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if jsoncodec.orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed: both sides run DRF's json code."))
+        rng = random.Random(options['seed'])
+        payloads = {
+            'bookings': self.paginated(BookingSerializer(self.bookings(rng, options['rows']), many=True).data),
+            'hotels': self.paginated(HotelSerializer(self.hotels(rng, options['rows']), many=True).data),
+            # Native Decimal/date/time/datetime/UUID values, as values() rows carry them
+            'raw rows': self.paginated(self.raw_rows(rng, options['rows'])),
+        }
+
+        drf_renderer, fast_renderer = renderers.JSONRenderer(), jsoncodec.JSONRenderer()
+        drf_parser, fast_parser = parsers.JSONParser(), jsoncodec.JSONParser()
+        differences = []
+        for name, data in payloads.items():
+            expected = drf_renderer.render(data)
+            if fast_renderer.render(data) != expected:
+                differences.append(f'{name} (render)')
+            if fast_parser.parse(io.BytesIO(expected)) != drf_parser.parse(io.BytesIO(expected)):
+                differences.append(f'{name} (parse)')
+
+            drf_render = self.time(lambda: drf_renderer.render(data), options['repeat'])
+            fast_render = self.time(lambda: fast_renderer.render(data), options['repeat'])
+            drf_parse = self.time(lambda: drf_parser.parse(io.BytesIO(expected)), options['repeat'])
+            fast_parse = self.time(lambda: fast_parser.parse(io.BytesIO(expected)), options['repeat'])
+            self.stdout.write(
+                f"{name:<9} {len(expected):>9} bytes  "
+                f"render {drf_render:>7.2f} -> {fast_render:>6.2f} ms (x{drf_render / fast_render:.1f})  "
+                f"parse {drf_parse:>7.2f} -> {fast_parse:>6.2f} ms (x{drf_parse / fast_parse:.1f})"
+            )
+
+        if differences:
+            raise CommandError(f"Output differs from DRF's for: {', '.join(differences)}")
+        self.stdout.write(self.style.SUCCESS("Output identical to DRF's for every payload."))
+
+    def time(self, function, repeat):
+        # Median of the runs, in milliseconds
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings)[len(timings) // 2]
+
+    def paginated(self, results):
+        return {'count': len(results), 'next': None, 'previous': None, 'results': results}
+
+    def bookings(self, rng, count):
+        today = timezone.localdate()
+        bookings = []
+        for number in range(1, count + 1):
+            check_in = today + timedelta(days=rng.randint(-365, 365))
+            nights = rng.randint(1, 14)
+            total_price = Decimal(nights * rng.randint(40, 400))
+            bookings.append(Booking(
+                id=number, guest_id=rng.randint(1, 5000), room_id=rng.randint(1, 500),
+                check_in_date=check_in, check_out_date=check_in + timedelta(days=nights),
+                total_price=total_price, amount_paid=(total_price * Decimal(rng.random())).quantize(Decimal('.01')),
+            ))
+        return bookings
+
+    def hotels(self, rng, count):
+        now = timezone.now()
+        return [
+            Hotel(
+                id=number, name=f'Hotel {number}', address=f'{number} Main Road', village='Village',
+                district='District', province='Province', phone='+85620000000', email=f'hotel{number}@example.com',
+                stars=rng.randint(1, 5), check_in_time=dt_time(14), check_out_time=dt_time(12),
+                created_at=now - timedelta(seconds=rng.randint(0, 10 ** 8)), updated_at=now,
+            )
+            for number in range(1, count + 1)
+        ]
+
+    def raw_rows(self, rng, count):
+        now = timezone.now()
+        return [
+            {
+                'id': number, 'reference': uuid.UUID(int=rng.getrandbits(128)),
+                'price_per_night': Decimal(rng.randint(4000, 40000)) / 100,
+                'check_in_date': now.date() + timedelta(days=number), 'check_in_time': dt_time(14, 30),
+                'created_at': now - timedelta(microseconds=rng.randint(0, 10 ** 12)),
+                'note': 'Line\u2028separator' if number % 100 == 0 else 'Ok',
+            }
+            for number in range(1, count + 1)
+        ]
@@ -0,0 +1,94 @@
+import random
+import time
+from datetime import time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from hotel.models import Booking, Guest, Hotel, Room, RoomType
+from hotel.occupancy import OccupancyCalendar
+
+
+class Command(BaseCommand):
+    help = "Compare free-room lookups through the occupancy calendar with the SQL availability query."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=500)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Everything is created inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            hotel = self.create_hotel(options['rooms'], options['days'], random.Random(options['seed']))
+            self.run(hotel, options)
+            transaction.set_rollback(True)
+
+    def create_hotel(self, room_count, days, rng):
+        hotel = Hotel.objects.create(
+            name='Benchmark Hotel', address='-', village='-', district='-', province='-',
+            phone='-', email='bench@example.com', stars=3,
+            check_in_time=dt_time(14), check_out_time=dt_time(12),
+        )
+        room_type = RoomType.objects.create(
+            name='Benchmark', description='-', price_per_night=100, capacity=2, image='bench.png'
+        )
+        guest = Guest.objects.create(
+            first_name='Bench', last_name='Mark', date_of_birth=timezone.localdate(),
+            address='-', phone='-', email='bench@example.com',
+        )
+        rooms = Room.objects.bulk_create(
+            Room(hotel=hotel, room_type=room_type, room_number=f'bench-{hotel.pk}-{number}')
+            for number in range(room_count)
+        )
+        today = timezone.localdate()
+        bookings = []
+        for room in rooms:
+            day = rng.randint(0, 3)
+            while day < days:
+                nights = rng.randint(1, 7)
+                bookings.append(Booking(
+                    guest=guest, room=room,
+                    check_in_date=today + timedelta(days=day),
+                    check_out_date=today + timedelta(days=day + nights),
+                    total_price=nights * room_type.price_per_night,
+                ))
+                day += nights + rng.randint(0, 4)
+        Booking.objects.bulk_create(bookings, batch_size=5000)
+        self.stdout.write(f"Created {len(rooms)} rooms and {len(bookings)} bookings over {days} days")
+        return hotel
+
+    def run(self, hotel, options):
+        rng = random.Random(options['seed'])
+        today = timezone.localdate()
+        windows = []
+        for _ in range(options['queries']):
+            start = rng.randint(0, options['days'] - 8)
+            check_in = today + timedelta(days=start)
+            windows.append((check_in, check_in + timedelta(days=rng.randint(1, 7))))
+
+        started = time.perf_counter()
+        calendar = OccupancyCalendar.build(hotel.pk, today, options['days'])
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        calendar_counts = [len(calendar.free_rooms(check_in, check_out)) for check_in, check_out in windows]
+        calendar_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        sql_counts = [
+            sum(row['available_rooms'] for row in hotel.get_available_room_types(check_in, check_out))
+            for check_in, check_out in windows
+        ]
+        sql_ms = (time.perf_counter() - started) * 1000
+
+        queries = len(windows)
+        self.stdout.write(f"Calendar build: {build_ms:.1f} ms")
+        self.stdout.write(f"Calendar: {calendar_ms / queries:.3f} ms/query")
+        self.stdout.write(f"SQL:      {sql_ms / queries:.3f} ms/query")
+        if calendar_counts != sql_counts:
+            self.stdout.write(self.style.ERROR("Calendar and SQL results disagree."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Results match ({sql_ms / max(calendar_ms, 1e-9):.1f}x speedup)"))
@@ -0,0 +1,103 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from account.models import User
+from common.slowqueries import EXPLAIN_PREFIXES, explain
+from hotel.models import Booking, Guest, Hotel, Payment, Room, RoomType
+from hotel.tasks import get_rooms_to_free
+from hotel.urls import router
+
+
+def find_sequential_scans(plan):
+    """Return the tables a plan reads in full, per backend's EXPLAIN dialect."""
+    if connection.vendor == 'sqlite':
+        # "SCAN t USING INDEX i" walks an index; a bare "SCAN t" reads the table
+        tables = re.findall(r'\bSCAN (\w+)\b(?! USING)', plan)
+        return [table for table in tables if table != 'CONSTANT']
+    if connection.vendor == 'postgresql':
+        return re.findall(r'Seq Scan on (\w+)', plan)
+    if connection.vendor == 'mysql':
+        return re.findall(r'table=(\w+) type=ALL\b', plan)
+    return []
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the SQL behind every viewset list and the model helper methods, "
+        "and flag sequential scans. Planners prefer scans on tiny tables, so run it against "
+        "a realistically sized database (see seed_hotel_data)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plans', action='store_true', help="Print every query plan.")
+        parser.add_argument('--fail-on-seq-scan', action='store_true', help="Exit with an error if any scan is flagged.")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAIN_PREFIXES:
+            raise CommandError(f"EXPLAIN is not supported for the {connection.vendor} backend.")
+        flagged = 0
+        for label, run in [*self.get_viewset_lists(), *self.get_model_helpers()]:
+            with CaptureQueriesContext(connection) as captured:
+                run()
+            for query in captured.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                plan = explain(connection, sql)
+                tables = find_sequential_scans(plan)
+                if tables:
+                    flagged += 1
+                    self.stdout.write(self.style.WARNING(f"{label}: sequential scan on {', '.join(tables)}"))
+                    self.stdout.write(f"  {sql}")
+                else:
+                    self.stdout.write(f"{label}: ok")
+                if options['plans']:
+                    self.stdout.write('\n'.join(f"    {line}" for line in plan.splitlines()))
+        if flagged:
+            message = f"{flagged} quer{'y' if flagged == 1 else 'ies'} with sequential scans."
+            if options['fail_on_seq_scan']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("No sequential scans."))
+
+    def get_viewset_lists(self):
+        factory = APIRequestFactory()
+        # An unsaved user passes IsAuthenticated without touching the database
+        user = User(email='explain@example.com')
+        for prefix, viewset, basename in router.registry:
+            def run(viewset=viewset, prefix=prefix):
+                request = factory.get(f'/api/{prefix}/', HTTP_HOST='localhost')
+                force_authenticate(request, user=user)
+                viewset.as_view({'get': 'list'})(request).render()
+            yield f"GET /api/{prefix}/", run
+
+    def get_model_helpers(self):
+        # Plans don't depend on the ids, so an unsaved stand-in works on an empty database
+        hotel = Hotel.objects.first() or Hotel(pk=0)
+        guest = Guest.objects.first() or Guest(pk=0)
+        room_type = RoomType.objects.first() or RoomType(pk=0)
+        today = timezone.localdate()
+        yield 'Hotel.get_available_rooms', hotel.get_available_rooms
+        yield 'Hotel.get_staff_count', hotel.get_staff_count
+        yield 'Hotel.objects.with_stats', lambda: list(Hotel.objects.with_stats()[:100])
+        yield 'Hotel.get_available_room_types', lambda: list(
+            hotel.get_available_room_types(today, today + timedelta(days=3), capacity=2)
+        )
+        yield 'Guest.get_current_bookings', lambda: list(guest.get_current_bookings())
+        yield 'Guest.get_booking_history', lambda: list(guest.get_booking_history())
+        yield 'RoomType.get_total_revenue', room_type.get_total_revenue
+        yield 'Booking.get_payments_total', lambda: list(
+            Booking.objects.annotate(payments_total=Booking.get_payments_total())[:1]
+        )
+        yield 'Payment ledger lookup', lambda: list(Payment.objects.filter(booking_id=0))
+        yield 'tasks.get_rooms_to_free', lambda: list(get_rooms_to_free(timezone.localtime()))
+        yield 'Room.objects.filter(hotel, status)', lambda: list(
+            Room.objects.filter(hotel=hotel, status=Room.AVAILABLE)
+        )
@@ -0,0 +1,49 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hotel.imports import CSV, IMPORTERS, NDJSON, read_rows
+
+
+class Command(BaseCommand):
+    help = "Stream guests, rooms or bookings from a CSV or NDJSON file into the database in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path', help="Input file, or - for stdin.")
+        parser.add_argument('--format', dest='input_format', choices=[CSV, NDJSON],
+                            help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--errors', help="Write the per-row error report to this NDJSON file.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['input_format'] or (NDJSON if path.endswith(('.ndjson', '.jsonl')) else CSV)
+        importer = IMPORTERS[options['kind']](batch_size=options['batch_size'])
+
+        started = time.perf_counter()
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        try:
+            report = importer.run(read_rows(stream, input_format))
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        elapsed = time.perf_counter() - started
+
+        if options['errors']:
+            with open(options['errors'], 'w') as errors_file:
+                for error in report['errors']:
+                    errors_file.write(json.dumps(error) + '\n')
+        else:
+            for error in report['errors'][:50]:
+                self.stdout.write(self.style.ERROR(json.dumps(error)))
+
+        rows = report['created'] + report['failed']
+        self.stdout.write(
+            f"Imported {report['created']} {options['kind']}, {report['failed']} failed "
+            f"in {elapsed:.2f} s ({rows / max(elapsed, 1e-9):.0f} rows/s)"
+        )
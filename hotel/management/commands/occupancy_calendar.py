@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from hotel import occupancy
+from hotel.models import Hotel
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a build of the occupancy calendars. Calendars live in each web worker's memory, so a build "
+        "here says nothing about theirs: check or rebuild a worker's calendar with GET or POST "
+        "/api/hotels/{id}/calendar/ as a staff user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotel', type=int, action='append', help="Hotel id (repeatable). Defaults to all hotels.")
+
+    def handle(self, *args, **options):
+        hotel_ids = options['hotel'] or list(Hotel.objects.values_list('id', flat=True))
+        for hotel_id in hotel_ids:
+            started = time.perf_counter()
+            calendar = occupancy.OccupancyCalendar.build(hotel_id)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(
+                f"Hotel {hotel_id}: {len(calendar.rooms)} rooms, "
+                f"{calendar.start_date} to {calendar.end_date}, built in {elapsed:.1f} ms"
+            )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from hotel.models import Booking
+
+
+class Command(BaseCommand):
+    help = "Check Booking.amount_paid against the sum of active payments, optionally repairing drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Rewrite amount_paid from the Payment table for mismatched bookings.")
+        parser.add_argument('--limit', type=int, default=50, help="Maximum number of mismatches to print.")
+
+    def handle(self, *args, **options):
+        mismatched = (
+            Booking.objects.annotate(payments_total=Booking.get_payments_total())
+            .exclude(amount_paid=F('payments_total'))
+            .values_list('pk', 'amount_paid', 'payments_total')
+        )
+        mismatched_ids = []
+        for booking_id, amount_paid, payments_total in mismatched.iterator(chunk_size=2000):
+            if len(mismatched_ids) < options['limit']:
+                self.stdout.write(f"Booking {booking_id}: ledger {amount_paid}, payments {payments_total}")
+            mismatched_ids.append(booking_id)
+
+        if not mismatched_ids:
+            self.stdout.write(self.style.SUCCESS("All booking ledgers match their payments."))
+            return
+        self.stdout.write(self.style.ERROR(f"{len(mismatched_ids)} booking ledger(s) out of sync."))
+        if options['fix']:
+            updated = 0
+            for start in range(0, len(mismatched_ids), 500):
+                updated += Booking.objects.filter(pk__in=mismatched_ids[start:start + 500]).update(
+                    amount_paid=Booking.get_payments_total()
+                )
+            self.stdout.write(self.style.SUCCESS(f"Repaired {updated} booking ledger(s)."))
@@ -0,0 +1,265 @@
+import multiprocessing
+import random
+import time
+from datetime import date, time as dt_time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from common.signals import rows_changed
+from hotel import occupancy
+from hotel.models import Booking, Guest, Hotel, Payment, Room, RoomType, Staff
+
+FIRST_NAMES = ['Somchai', 'Noy', 'Khamla', 'Vanh', 'Anna', 'Lucas', 'Mei', 'Hiro', 'Sara', 'Omar', 'Ines', 'Tom']
+LAST_NAMES = ['Phommachanh', 'Sisavath', 'Vongsa', 'Keo', 'Smith', 'Garcia', 'Chen', 'Sato', 'Muller', 'Rossi']
+PROVINCES = ['Vientiane', 'Luang Prabang', 'Champasak', 'Savannakhet', 'Xiengkhouang']
+POSITIONS = ['Receptionist', 'Housekeeper', 'Manager', 'Chef', 'Porter', 'Concierge']
+ROOM_TYPES = [
+    # name, price per night, capacity
+    ('Single', Decimal('35.00'), 1),
+    ('Double', Decimal('55.00'), 2),
+    ('Twin', Decimal('55.00'), 2),
+    ('Deluxe', Decimal('90.00'), 2),
+    ('Family', Decimal('120.00'), 4),
+    ('Suite', Decimal('220.00'), 4),
+]
+PAYMENT_METHODS = [method for method, _ in Payment.PAYMENT_METHOD_CHOICES]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def generate_stays(rng, first_day, last_day, occupancy_rate):
+    """Yield back-to-back (check_in, check_out) pairs for one room; they never overlap."""
+    day = first_day + timedelta(days=rng.randint(0, 3))
+    while day < last_day:
+        nights = min(rng.choice((1, 1, 2, 2, 3, 3, 4, 5, 7, 10, 14)), (last_day - day).days)
+        yield day, day + timedelta(days=nights)
+        # Idle gaps sized so the room ends up booked about occupancy_rate of the time
+        gap = round(rng.expovariate(occupancy_rate / (nights * (1 - occupancy_rate) + 1e-9)))
+        day += timedelta(days=nights + gap)
+
+
+def build_payments(rng, total_price, check_in_date, today):
+    """(amount, payment date, method) tuples: settled in full once the stay has started, maybe a deposit before."""
+    if check_in_date <= today:
+        parts = rng.choice((1, 1, 1, 2))
+    else:
+        parts = rng.choice((0, 0, 1))
+    if not parts:
+        return []
+    deposit = (total_price * Decimal('0.3')).quantize(Decimal('0.01'))
+    if parts == 2:
+        amounts = [deposit, total_price - deposit]
+    elif check_in_date <= today:
+        amounts = [total_price]
+    else:
+        amounts = [deposit]
+    deposit_date = check_in_date - timedelta(days=rng.randint(0, 30))
+    return [
+        (amount, deposit_date if position == 0 else check_in_date, rng.choice(PAYMENT_METHODS))
+        for position, amount in enumerate(amounts)
+        if amount > 0
+    ]
+
+
+def insert_rows(model, field_names, rows):
+    """
+    Plain executemany INSERT. bulk_create prepares every field of every object
+    through the ORM, which caps it at a few thousand rows a second; these rows
+    are already in database form.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in field_names)
+    placeholders = ', '.join(['%s'] * len(field_names))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})', rows)
+
+
+BOOKING_COLUMNS = [
+    'guest', 'room', 'check_in_date', 'check_out_date', 'total_price', 'amount_paid', 'checkout_task_id',
+    'is_deleted', 'created_at', 'updated_at',
+]
+PAYMENT_COLUMNS = ['booking', 'amount', 'payment_date', 'payment_method', 'is_deleted', 'created_at', 'updated_at']
+
+
+def seed_bookings(position, hotel_id, options, guest_ids):
+    """
+    Fill one hotel with bookings and payments. Each hotel draws from its own RNG,
+    seeded by its position, so the data is the same whatever the number of workers.
+    """
+    rng = random.Random(f"{options['seed']}:{position}")
+    today = timezone.localdate()
+    first_day = today - timedelta(days=round(365 * options['years']))
+    last_day = today + timedelta(days=options['future_days'])
+    rooms = Room.objects.filter(hotel_id=hotel_id).order_by('pk').values_list('pk', 'room_type__price_per_night')
+
+    def stays():
+        for room_id, price in rooms:
+            for check_in, check_out in generate_stays(rng, first_day, last_day, options['occupancy']):
+                yield room_id, check_in, check_out, (check_out - check_in).days * price
+
+    booking_count = payment_count = 0
+    for chunk in chunked(stays(), options['chunk_size']):
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        bookings, payments = [], {}
+        for room_id, check_in, check_out, total_price in chunk:
+            # Same invariants as Booking.save and Payment.save, without calling them:
+            # total_price from the nightly rate, amount_paid equal to the payments' sum
+            booking_payments = build_payments(rng, total_price, check_in, today)
+            amount_paid = sum((amount for amount, _, _ in booking_payments), Decimal('0'))
+            bookings.append((
+                rng.choice(guest_ids), room_id, check_in, check_out, total_price, amount_paid, '', False, now, now,
+            ))
+            payments[room_id, check_in] = booking_payments
+        with transaction.atomic():
+            insert_rows(Booking, BOOKING_COLUMNS, bookings)
+            # Seeded stays never overlap, so (room, check-in) identifies each new booking
+            booking_ids = Booking.objects.filter(
+                room_id__in={room_id for room_id, *_ in chunk},
+                check_in_date__range=(min(stay[1] for stay in chunk), max(stay[1] for stay in chunk)),
+            ).values_list('room_id', 'check_in_date', 'pk')
+            payment_rows = [
+                (booking_id, amount, payment_date, method, False, now, now)
+                for room_id, check_in, booking_id in booking_ids
+                for amount, payment_date, method in payments.get((room_id, check_in), ())
+            ]
+            insert_rows(Payment, PAYMENT_COLUMNS, payment_rows)
+        booking_count += len(bookings)
+        payment_count += len(payment_rows)
+    return booking_count, payment_count
+
+
+def seed_bookings_worker(args):
+    try:
+        return seed_bookings(*args)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with deterministic synthetic hotels, rooms, staff, guests, and years of "
+        "non-overlapping bookings with payments. Bookings and payments are written in chunks, "
+        "one hotel per worker when --workers > 1."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotels', type=int, default=10)
+        parser.add_argument('--min-rooms', type=int, default=20, help="Fewest rooms per hotel.")
+        parser.add_argument('--max-rooms', type=int, default=200, help="Most rooms per hotel.")
+        parser.add_argument('--staff', type=int, default=15, help="Average staff per hotel.")
+        parser.add_argument('--guests', type=int, default=10000)
+        parser.add_argument('--years', type=float, default=3, help="Years of booking history.")
+        parser.add_argument('--future-days', type=int, default=180, help="How far ahead bookings go.")
+        parser.add_argument('--occupancy', type=float, default=0.7, help="Share of nights booked, 0-1.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1, help="Parallel booking writers (not on SQLite).")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not 0 < options['occupancy'] < 1:
+            raise CommandError("--occupancy must be between 0 and 1.")
+        if options['guests'] < 1:
+            raise CommandError("--guests must be at least 1.")
+        if options['min_rooms'] > options['max_rooms']:
+            raise CommandError("--min-rooms cannot exceed --max-rooms.")
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING("SQLite allows a single writer; using one worker."))
+            workers = 1
+
+        started = time.perf_counter()
+        rng = random.Random(options['seed'])
+        room_types = self.create_room_types()
+        hotel_ids = self.create_hotels(rng, options, room_types)
+        guest_ids = self.create_guests(rng, options)
+        self.stdout.write(f"Created {len(hotel_ids)} hotels, {Room.objects.filter(hotel_id__in=hotel_ids).count()} rooms "
+                          f"and {len(guest_ids)} guests in {time.perf_counter() - started:.1f} s")
+
+        booking_started = time.perf_counter()
+        jobs = [(position, hotel_id, options, guest_ids) for position, hotel_id in enumerate(hotel_ids)]
+        if workers > 1:
+            # Forked workers must not share the parent's database connection
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                results = pool.map(seed_bookings_worker, jobs)
+        else:
+            results = [seed_bookings(*job) for job in jobs]
+        bookings = sum(result[0] for result in results)
+        payments = sum(result[1] for result in results)
+        elapsed = time.perf_counter() - booking_started
+        # Raw inserts bypass the querysets that report bulk writes to the caches
+        rows_changed.send(sender=Booking, fields=None)
+        rows_changed.send(sender=Payment, fields=None)
+        occupancy.discard_calendar()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {bookings} bookings and {payments} payments in {elapsed:.1f} s "
+            f"({bookings / max(elapsed, 1e-9):.0f} bookings/s, {workers} worker(s))"
+        ))
+
+    def create_room_types(self):
+        return RoomType.objects.bulk_create(
+            RoomType(
+                name=name, description=f'{name} room', price_per_night=price,
+                capacity=capacity, image=f'images/{name.lower()}.jpg',
+            )
+            for name, price, capacity in ROOM_TYPES
+        )
+
+    def create_hotels(self, rng, options, room_types):
+        hotels = Hotel.objects.bulk_create(
+            Hotel(
+                name=f'{rng.choice(LAST_NAMES)} {rng.choice(["Hotel", "Resort", "Inn", "Residence"])} {number}',
+                address=f'{rng.randint(1, 300)} Main Road', village=f'Ban {rng.choice(LAST_NAMES)}',
+                district=f'District {rng.randint(1, 9)}', province=rng.choice(PROVINCES),
+                phone=f'+856 20 {rng.randint(1000000, 9999999)}', email=f'hotel{number}@example.com',
+                stars=rng.randint(1, 5), check_in_time=dt_time(14), check_out_time=dt_time(12),
+            )
+            for number in range(options['hotels'])
+        )
+        rooms, staff = [], []
+        for hotel in hotels:
+            # Bigger hotels lean towards the pricier room types
+            weights = [max(1, 6 - abs(position - hotel.stars)) for position in range(len(room_types))]
+            for number in range(rng.randint(options['min_rooms'], options['max_rooms'])):
+                floor, door = divmod(number, 40)
+                rooms.append(Room(
+                    hotel=hotel, room_type=rng.choices(room_types, weights)[0],
+                    room_number=f'H{hotel.pk}-{floor + 1}{door + 1:02d}',
+                ))
+            for _ in range(max(1, round(rng.gauss(options['staff'], options['staff'] / 4)))):
+                staff.append(Staff(
+                    hotel=hotel, first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                    position=rng.choice(POSITIONS), salary=Decimal(rng.randint(300, 2500)),
+                    date_of_birth=date(rng.randint(1960, 2004), rng.randint(1, 12), rng.randint(1, 28)),
+                    phone=f'+856 20 {rng.randint(1000000, 9999999)}', email=f'staff{hotel.pk}-{len(staff)}@example.com',
+                    hire_date=date(rng.randint(2010, 2025), rng.randint(1, 12), rng.randint(1, 28)),
+                ))
+        for chunk in chunked(rooms, options['chunk_size']):
+            Room.objects.bulk_create(chunk)
+        for chunk in chunked(staff, options['chunk_size']):
+            Staff.objects.bulk_create(chunk)
+        return [hotel.pk for hotel in hotels]
+
+    def create_guests(self, rng, options):
+        guest_ids = []
+        guests = (
+            Guest(
+                first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                date_of_birth=date(rng.randint(1940, 2006), rng.randint(1, 12), rng.randint(1, 28)),
+                address=f'{rng.randint(1, 999)} {rng.choice(PROVINCES)} Road',
+                phone=f'+856 20 {rng.randint(1000000, 9999999)}', email=f'guest{number}@example.com',
+            )
+            for number in range(options['guests'])
+        )
+        for chunk in chunked(guests, options['chunk_size']):
+            guest_ids.extend(guest.pk for guest in Guest.objects.bulk_create(chunk))
+        return guest_ids
@@ -0,0 +1,78 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from common.slowqueries import clear_records, get_records
+
+
+class Command(BaseCommand):
+    help = (
+        "List the statements recorded by the slow-query recorder (SLOW_QUERY_THRESHOLD_MS), "
+        "newest first, or grouped by fingerprint with --group."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--origin', help="Only queries whose view or task contains this text.")
+        parser.add_argument('--fingerprint', help="Only queries whose fingerprint starts with this.")
+        parser.add_argument('--min-ms', type=float, default=0, help="Only queries at least this slow.")
+        parser.add_argument('--group', action='store_true', help="One line per fingerprint, slowest total first.")
+        parser.add_argument('--plans', action='store_true', help="Print the EXPLAIN plan of each query.")
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help="Print the matching records as JSON.")
+        parser.add_argument('--clear', action='store_true', help="Empty the buffer.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            clear_records()
+            self.stdout.write("Slow-query buffer cleared.")
+            return
+
+        records = [
+            record for record in get_records()
+            if record['duration_ms'] >= options['min_ms']
+            and (not options['origin'] or options['origin'] in record['origin'])
+            and (not options['fingerprint'] or record['fingerprint'].startswith(options['fingerprint']))
+        ]
+        if options['group']:
+            records = self.group(records)
+        records = records[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(records, indent=2))
+            return
+        if not records:
+            self.stdout.write("No slow queries recorded.")
+            return
+        for record in records:
+            if options['group']:
+                self.stdout.write(
+                    f"{record['fingerprint']}  {record['count']}x  total {record['total_ms']:.1f} ms  "
+                    f"max {record['max_ms']:.1f} ms  from {', '.join(record['origins'])}"
+                )
+            else:
+                self.stdout.write(
+                    f"{record['recorded_at']}  {record['fingerprint']}  {record['duration_ms']:.1f} ms  "
+                    f"{record['origin']}"
+                )
+            self.stdout.write(f"  {record['statement']}")
+            if options['plans'] and record['plan']:
+                self.stdout.write('\n'.join(f"    {line}" for line in record['plan'].splitlines()))
+
+    def group(self, records):
+        groups = {}
+        for record in records:
+            group = groups.setdefault(record['fingerprint'], {
+                'fingerprint': record['fingerprint'],
+                'statement': record['statement'],
+                'count': 0,
+                'total_ms': 0,
+                'max_ms': 0,
+                'origins': [],
+                'plan': record['plan'],  # Records are newest first, so this is the latest plan
+            })
+            group['count'] += 1
+            group['total_ms'] += record['duration_ms']
+            group['max_ms'] = max(group['max_ms'], record['duration_ms'])
+            if record['origin'] not in group['origins']:
+                group['origins'].append(record['origin'])
+        return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from common.softdelete import get_cascade_registry, get_cascade_relations
+
+
+class Command(BaseCommand):
+    help = "Print the soft-delete cascade graph with the estimated fan-out per relation."
+
+    def handle(self, *args, **options):
+        registry = get_cascade_registry()
+        row_counts = {model: model.objects.count() for model in registry}
+
+        for model, relations in registry.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{model._meta.label} ({row_counts[model]} rows)"))
+            for relation in relations:
+                fan_out = row_counts[relation.related_model] / max(row_counts[model], 1)
+                self.stdout.write(
+                    f"  -> {relation.related_model._meta.label} via {relation.field.name} "
+                    f"(~{fan_out:.1f} per row)"
+                )
+            estimate = self.estimate_cascade(model, row_counts, {model})
+            self.stdout.write(f"  Estimated rows touched per delete: {estimate:.0f}")
+
+    def estimate_cascade(self, model, row_counts, path):
+        rows = 1.0
+        for relation in get_cascade_relations(model):
+            related_model = relation.related_model
+            if related_model in path:
+                continue
+            fan_out = row_counts[related_model] / max(row_counts[model], 1)
+            rows += fan_out * self.estimate_cascade(related_model, row_counts, path | {related_model})
+        return rows
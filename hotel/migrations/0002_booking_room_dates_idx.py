@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['room', 'check_in_date', 'check_out_date'], name='booking_room_dates_idx'),
+        ),
+    ]
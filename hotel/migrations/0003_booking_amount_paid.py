@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:08
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_amount_paid(apps, schema_editor):
+    Booking = apps.get_model('hotel', 'Booking')
+    Payment = apps.get_model('hotel', 'Payment')
+    payments_total = (
+        Payment.objects.filter(booking=models.OuterRef('pk'), is_deleted=False)
+        .values('booking')
+        .annotate(total=models.Sum('amount'))
+        .values('total')
+    )
+    Booking.objects.update(
+        amount_paid=Coalesce(
+            models.Subquery(payments_total),
+            models.Value(0),
+            output_field=models.DecimalField(max_digits=15, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0002_booking_room_dates_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.RunPython(backfill_amount_paid, migrations.RunPython.noop),
+    ]
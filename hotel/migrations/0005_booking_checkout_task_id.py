@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0004_soft_delete_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='checkout_task_id',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+    ]
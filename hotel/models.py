@@ -1,7 +1,83 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from common.basemodel import BaseModel
+from common.softdelete import SoftDeleteManager, SoftDeleteQuerySet
 from datetime import date
 
+
+class DaysBetween(models.Func):
+    # Whole days from start to end, in each backend's native date arithmetic
+    output_field = models.IntegerField()
+
+    def __init__(self, start, end, **extra):
+        super().__init__(end, start, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(', **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='DATEDIFF', **extra_context)
+
+
+def is_lock_error(error):
+    # SQLite gives up on a writer after its busy timeout; PostgreSQL breaks deadlocks
+    message = str(error)
+    return 'database is locked' in message or 'deadlock detected' in message
+
+
+def subquery_aggregate(queryset, aggregate, output_field):
+    # Aggregate a queryset correlated through OuterRef, 0 when it has no rows
+    return models.functions.Coalesce(
+        models.Subquery(
+            queryset.order_by().annotate(group=models.Value(1)).values('group')
+            .annotate(value=aggregate).values('value')
+        ),
+        models.Value(0),
+        output_field=output_field,
+    )
+
+
+class HotelQuerySet(SoftDeleteQuerySet):
+    def with_stats(self, today=None):
+        """
+        Annotate each hotel with its dashboard figures in a single statement.
+        Each figure is a correlated subquery rather than a join, so the
+        aggregates neither multiply each other's rows nor run once per room.
+        """
+        today = today or timezone.localdate()
+        rooms = Room.objects.filter(hotel=models.OuterRef('pk'))
+        bookings = Booking.objects.filter(room__hotel=models.OuterRef('pk'))
+        count = models.Count('pk')
+        return self.annotate(
+            available_rooms=subquery_aggregate(rooms.filter(status=Room.AVAILABLE), count, models.IntegerField()),
+            occupied_rooms=subquery_aggregate(rooms.filter(status=Room.OCCUPIED), count, models.IntegerField()),
+            staff_count=subquery_aggregate(
+                Staff.objects.filter(hotel=models.OuterRef('pk')), count, models.IntegerField()
+            ),
+            arrivals_today=subquery_aggregate(bookings.filter(check_in_date=today), count, models.IntegerField()),
+            departures_today=subquery_aggregate(bookings.filter(check_out_date=today), count, models.IntegerField()),
+            revenue=subquery_aggregate(
+                bookings, models.Sum('total_price'), models.DecimalField(max_digits=15, decimal_places=2)
+            ),
+            # There is no rating model yet; keep the figure in the contract
+            average_rating=models.Value(None, output_field=models.FloatField()),
+        )
+
+
+class HotelManager(SoftDeleteManager):
+    def get_queryset(self):
+        return HotelQuerySet(self.model, using=self._db).filter(is_deleted=False)
+
+    def with_stats(self, today=None):
+        return self.get_queryset().with_stats(today)
+
+
 class Hotel(BaseModel):
     name = models.CharField(max_length=150)
     address = models.CharField(max_length=255)
@@ -14,19 +90,55 @@ class Hotel(BaseModel):
     check_in_time = models.TimeField()
     check_out_time = models.TimeField()
 
+    objects = HotelManager()
+
     def __str__(self):
         return self.name
 
+    # The helpers read the with_stats() annotations when present, so listing
+    # hotels from Hotel.objects.with_stats() costs no query per hotel
+
     def get_available_rooms(self):
+        if hasattr(self, 'available_rooms'):
+            return self.available_rooms
         return self.room_hotel.filter(status=Room.AVAILABLE).count()
 
+    def get_occupied_rooms(self):
+        if hasattr(self, 'occupied_rooms'):
+            return self.occupied_rooms
+        return self.room_hotel.filter(status=Room.OCCUPIED).count()
+
     def get_staff_count(self):
+        if hasattr(self, 'staff_count'):
+            return self.staff_count
         return self.staff_hotel.count()
 
     def get_average_rating(self):
-        # Assuming there's a Rating model related to Hotel
-        ratings = self.rating_set.all()
-        return ratings.aggregate(models.Avg('score'))['score__avg'] if ratings else None
+        # Hotels have no ratings to average yet
+        return getattr(self, 'average_rating', None)
+
+    def get_available_room_types(self, check_in_date, check_out_date, capacity=None):
+        # A room is free when no active booking overlaps [check_in_date, check_out_date)
+        overlapping_bookings = Booking.objects.filter(
+            room=models.OuterRef('pk'),
+            check_in_date__lt=check_out_date,
+            check_out_date__gt=check_in_date,
+        )
+        rooms = self.room_hotel.filter(room_type__is_deleted=False).exclude(
+            models.Exists(overlapping_bookings)
+        )
+        if capacity:
+            rooms = rooms.filter(room_type__capacity__gte=capacity)
+        return (
+            rooms.values('room_type')
+            .annotate(
+                name=models.F('room_type__name'),
+                capacity=models.F('room_type__capacity'),
+                price_per_night=models.F('room_type__price_per_night'),
+                available_rooms=models.Count('pk'),
+            )
+            .order_by('price_per_night', 'room_type')
+        )
 
 
 class Staff(BaseModel):
@@ -79,7 +191,8 @@ class RoomType(BaseModel):
         return self.name
 
     def get_total_revenue(self):
-        return sum(booking.total_price for booking in self.room_type.all())
+        total = Booking.objects.filter(room__room_type=self).aggregate(total=models.Sum('total_price'))['total']
+        return total or 0
 
 
 class Room(BaseModel):
@@ -96,6 +209,15 @@ class Room(BaseModel):
     room_number = models.CharField(max_length=15, unique=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=AVAILABLE)
 
+    class Meta:
+        indexes = [
+            # Status first so the room-status sweep can use it without a hotel filter;
+            # partial so soft-deleted rows never take index space
+            models.Index(
+                fields=['status', 'hotel'], condition=models.Q(is_deleted=False), name='room_status_hotel_live_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.room_number
 
@@ -140,6 +262,24 @@ class Booking(BaseModel):
     check_in_date = models.DateField()
     check_out_date = models.DateField(blank=True)
     total_price = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    # Running total of active payments, only ever changed by Payment through F() updates
+    amount_paid = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # Celery id of the pending release_room_at_checkout run, kept by hotel.tasks
+    checkout_task_id = models.CharField(max_length=255, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            # Serves the date-range overlap lookup in Hotel.get_available_room_types
+            models.Index(fields=['room', 'check_in_date', 'check_out_date'], name='booking_room_dates_idx'),
+            # Guest.get_current_bookings / get_booking_history
+            models.Index(
+                fields=['guest', 'check_out_date'], condition=models.Q(is_deleted=False), name='booking_guest_out_live_idx'
+            ),
+            # Ended-booking lookups of the room-status sweep
+            models.Index(
+                fields=['check_out_date'], condition=models.Q(is_deleted=False), name='booking_out_live_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'Booking {self.id} for {self.guest} in room {self.room}'
@@ -148,6 +288,12 @@ class Booking(BaseModel):
         if self.check_in_date >= self.check_out_date:
             raise ValueError("Check-in date must be before check-out date.")
         self.total_price = self.calculate_total_price()
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a possibly stale amount_paid or task id
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('amount_paid', 'checkout_task_id')
+            ]
         super().save(*args, **kwargs)
 
     def calculate_total_price(self):
@@ -156,8 +302,24 @@ class Booking(BaseModel):
         return total_nights * price_per_night
 
     def get_total_paid(self):
-        total_paid = self.payment_booking.aggregate(models.Sum('amount'))['amount__sum']
-        return total_paid if total_paid is not None else 0
+        return self.amount_paid
+
+    def get_outstanding_balance(self):
+        return self.total_price - self.amount_paid
+
+    @classmethod
+    def get_payments_total(cls):
+        # Sum of active payments per booking, straight from the Payment table
+        return models.functions.Coalesce(
+            models.Subquery(
+                Payment.objects.filter(booking=models.OuterRef('pk'))
+                .values('booking')
+                .annotate(total=models.Sum('amount'))
+                .values('total')
+            ),
+            models.Value(0),
+            output_field=models.DecimalField(max_digits=15, decimal_places=2),
+        )
 
 
 class Payment(BaseModel):
@@ -178,9 +340,76 @@ class Payment(BaseModel):
     payment_date = models.DateField()
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES, default=PAYMENT_METHOD_CASH)
 
+    class Meta:
+        indexes = [
+            # Booking.get_payments_total and the live payment list
+            models.Index(fields=['booking'], condition=models.Q(is_deleted=False), name='payment_booking_live_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if self.amount <= 0:
             raise ValueError("Payment amount must be positive.")
-        if self.amount > self.booking.total_price - self.booking.get_total_paid():
+        with transaction.atomic():
+            if self._state.adding:
+                self.add_to_ledger()
+            else:
+                self.move_in_ledger()
+            super().save(*args, **kwargs)
+
+    def add_to_ledger(self):
+        # Lock the booking so concurrent payments cannot both pass the balance check
+        booking = Booking.all_objects.select_for_update().get(pk=self.booking_id)
+        if self.amount > booking.get_outstanding_balance():
             raise ValueError("Payment amount exceeds the outstanding balance for this booking.")
-        super().save(*args, **kwargs)
\ No newline at end of file
+        Booking.all_objects.filter(pk=self.booking_id).update(amount_paid=models.F('amount_paid') + self.amount)
+        if self._meta.get_field('booking').is_cached(self):
+            self.booking.amount_paid = booking.amount_paid + self.amount
+
+    def remove_from_ledger(self):
+        Booking.all_objects.filter(pk=self.booking_id).update(amount_paid=models.F('amount_paid') - self.amount)
+
+    def move_in_ledger(self):
+        # An edit that moves or re-prices an active payment takes it out of the
+        # stored booking's ledger and puts it into the new one; delete and
+        # restore change is_deleted and go through the hooks below instead
+        stored = Payment.all_objects.select_for_update().filter(pk=self.pk).values(
+            'booking_id', 'amount', 'is_deleted'
+        ).first()
+        if stored is None or stored['is_deleted'] or self.is_deleted:
+            return
+        if (stored['booking_id'], stored['amount']) != (self.booking_id, self.amount):
+            Booking.all_objects.filter(pk=stored['booking_id']).update(
+                amount_paid=models.F('amount_paid') - stored['amount']
+            )
+            self.add_to_ledger()
+
+    def after_delete(self):
+        self.remove_from_ledger()
+
+    def after_restore(self):
+        self.add_to_ledger()
+
+    @classmethod
+    def shift_ledgers(cls, payments, sign):
+        # One UPDATE moves every affected booking's amount_paid by its payments' sum
+        total = subquery_aggregate(
+            payments.filter(booking=models.OuterRef('pk')), models.Sum('amount'),
+            models.DecimalField(max_digits=15, decimal_places=2),
+        )
+        Booking.all_objects.filter(pk__in=payments.values('booking')).update(
+            amount_paid=models.F('amount_paid') + sign * total
+        )
+
+    @classmethod
+    def before_bulk_delete(cls, queryset):
+        cls.shift_ledgers(queryset, -1)
+
+    @classmethod
+    def before_bulk_restore(cls, queryset):
+        cls.shift_ledgers(queryset, 1)
+
+    def hard_delete(self, *args, **kwargs):
+        with transaction.atomic():
+            if not self.is_deleted:
+                self.remove_from_ledger()
+            super().hard_delete(*args, **kwargs)
\ No newline at end of file
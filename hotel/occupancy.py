@@ -0,0 +1,251 @@
+import threading
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from common.signals import rows_changed
+from hotel.models import Booking, Room
+
+# What a calendar knows of a booking
+Stay = namedtuple('Stay', ['hotel_id', 'room_id', 'check_in_date', 'check_out_date'])
+
+# Columns calendars are built from; writes to anything else leave them alone
+CALENDAR_FIELDS = {
+    Booking: frozenset(['room', 'room_id', 'check_in_date', 'check_out_date', 'is_deleted']),
+    Room: frozenset(['hotel', 'hotel_id', 'room_type', 'room_type_id', 'is_deleted']),
+}
+
+
+def get_horizon_days():
+    return getattr(settings, 'OCCUPANCY_CALENDAR_DAYS', 365)
+
+
+class OccupancyCalendar:
+    """
+    In-process availability calendar for one hotel.
+
+    Every room owns a bitset (a Python int) where bit ``i`` is set when the
+    night starting at ``start_date + i`` is booked. Free-room lookups are a
+    single AND per room and never touch the database.
+    """
+
+    def __init__(self, hotel_id, start_date, days):
+        self.hotel_id = hotel_id
+        self.start_date = start_date
+        self.days = days
+        self.rooms = {}  # room id -> occupied nights bitset
+        self.room_types = {}  # room id -> room type id
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, hotel_id, start_date=None, days=None):
+        calendar = cls(hotel_id, start_date or timezone.localdate(), days or get_horizon_days())
+        rooms = Room.objects.filter(hotel_id=hotel_id).values_list('id', 'room_type_id')
+        for room_id, room_type_id in rooms:
+            calendar.rooms[room_id] = 0
+            calendar.room_types[room_id] = room_type_id
+        bookings = Booking.objects.filter(
+            room__hotel_id=hotel_id,
+            check_in_date__lt=calendar.end_date,
+            check_out_date__gt=calendar.start_date,
+        ).values_list('room_id', 'check_in_date', 'check_out_date')
+        for room_id, check_in_date, check_out_date in bookings.iterator(chunk_size=5000):
+            if room_id in calendar.rooms:
+                calendar.rooms[room_id] |= calendar.mask(check_in_date, check_out_date)
+        return calendar
+
+    @property
+    def end_date(self):
+        return self.start_date + timedelta(days=self.days)
+
+    def covers(self, check_in_date, check_out_date):
+        return self.start_date <= check_in_date and check_out_date <= self.end_date
+
+    def mask(self, check_in_date, check_out_date):
+        first = max((check_in_date - self.start_date).days, 0)
+        last = min((check_out_date - self.start_date).days, self.days)
+        if first >= last:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def add_booking(self, booking):
+        mask = self.mask(booking.check_in_date, booking.check_out_date)
+        with self.lock:
+            if booking.room_id in self.rooms:
+                self.rooms[booking.room_id] |= mask
+
+    def remove_booking(self, booking):
+        # Bookings on one room never overlap, so clearing the nights is safe
+        mask = self.mask(booking.check_in_date, booking.check_out_date)
+        with self.lock:
+            if booking.room_id in self.rooms:
+                self.rooms[booking.room_id] &= ~mask
+
+    def free_rooms(self, check_in_date, check_out_date, room_type_id=None):
+        if not self.covers(check_in_date, check_out_date):
+            raise ValueError("Requested dates fall outside the calendar horizon.")
+        mask = self.mask(check_in_date, check_out_date)
+        return sorted(
+            room_id
+            for room_id, nights in self.rooms.items()
+            if not nights & mask
+            and (room_type_id is None or self.room_types[room_id] == room_type_id)
+        )
+
+    def occupied_nights(self):
+        # Bitset of nights on which at least one room is booked
+        occupied = 0
+        for nights in self.rooms.values():
+            occupied |= nights
+        return occupied
+
+    def diff(self, other):
+        # Room ids whose bitsets differ between two calendars of the same window
+        room_ids = set(self.rooms) | set(other.rooms)
+        return sorted(
+            room_id for room_id in room_ids
+            if self.rooms.get(room_id) != other.rooms.get(room_id)
+        )
+
+
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+
+def is_loaded(hotel_id):
+    calendar = _calendars.get(hotel_id)
+    return calendar is not None and calendar.start_date == timezone.localdate()
+
+
+def get_calendar(hotel_id):
+    # Calendars are rebuilt lazily when the day rolls over
+    if not is_loaded(hotel_id):
+        with _calendars_lock:
+            if not is_loaded(hotel_id):
+                _calendars[hotel_id] = OccupancyCalendar.build(hotel_id)
+    return _calendars[hotel_id]
+
+
+def rebuild_calendar(hotel_id):
+    calendar = OccupancyCalendar.build(hotel_id)
+    with _calendars_lock:
+        _calendars[hotel_id] = calendar
+    return calendar
+
+
+def discard_calendar(hotel_id=None):
+    with _calendars_lock:
+        if hotel_id is None:
+            _calendars.clear()
+        else:
+            _calendars.pop(hotel_id, None)
+
+
+def check_consistency(calendar):
+    """Return room ids whose in-memory bitset disagrees with the Booking table."""
+    fresh = OccupancyCalendar.build(calendar.hotel_id, calendar.start_date, calendar.days)
+    return calendar.diff(fresh)
+
+
+def get_stay(booking):
+    if Booking._meta.get_field('room').is_cached(booking):
+        hotel_id = booking.room.hotel_id
+    else:
+        hotel_id = Room.all_objects.filter(pk=booking.room_id).values_list('hotel_id', flat=True).first()
+    return Stay(hotel_id, booking.room_id, booking.check_in_date, booking.check_out_date)
+
+
+def record_stay(stay):
+    calendar = _calendars.get(stay.hotel_id)
+    if calendar is not None:
+        calendar.add_booking(stay)
+
+
+def release_stay(stay):
+    calendar = _calendars.get(stay.hotel_id)
+    if calendar is not None:
+        calendar.remove_booking(stay)
+
+
+# Calendars change only once the write commits: a rolled back write never
+# reaches them, and one built from the pre-commit rows is corrected after it
+
+def tracks_update(sender, update_fields):
+    return update_fields is None or not CALENDAR_FIELDS[sender].isdisjoint(update_fields)
+
+
+def remember_stored_row(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._calendar_row = None
+    if raw or instance._state.adding or not tracks_update(sender, update_fields):
+        return
+    rows = sender.all_objects.using(instance._state.db).filter(pk=instance.pk)
+    if sender is Booking:
+        row = rows.values_list('room__hotel_id', 'room_id', 'check_in_date', 'check_out_date', 'is_deleted').first()
+        instance._calendar_row = Stay(*row[:4]) if row and not row[4] else None
+    else:
+        instance._calendar_row = rows.values_list('hotel_id', 'room_type_id', 'is_deleted').first()
+
+
+def booking_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or not (created or tracks_update(sender, update_fields)):
+        return
+    old = getattr(instance, '_calendar_row', None)
+    new = None if instance.is_deleted else get_stay(instance)
+    if old == new:
+        return
+
+    def update_calendars():
+        if old is not None:
+            release_stay(old)
+        if new is not None:
+            record_stay(new)
+
+    transaction.on_commit(update_calendars, using=instance._state.db)
+
+
+def booking_deleted(sender, instance, **kwargs):
+    # Soft-deleted bookings are not in any calendar
+    if not instance.is_deleted:
+        stay = get_stay(instance)
+        transaction.on_commit(lambda: release_stay(stay), using=instance._state.db)
+
+
+def room_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Calendars index rooms at build time, so a change to a hotel's rooms drops its calendar
+    if raw or not (created or tracks_update(sender, update_fields)):
+        return
+    old = getattr(instance, '_calendar_row', None)
+    if old != (instance.hotel_id, instance.room_type_id, instance.is_deleted):
+        hotel_ids = {instance.hotel_id, old[0] if old else None} - {None}
+
+        def discard_calendars():
+            for hotel_id in hotel_ids:
+                discard_calendar(hotel_id)
+
+        transaction.on_commit(discard_calendars, using=instance._state.db)
+
+
+def room_deleted(sender, instance, **kwargs):
+    hotel_id = instance.hotel_id
+    transaction.on_commit(lambda: discard_calendar(hotel_id), using=instance._state.db)
+
+
+def rows_changed_in_bulk(sender, fields=None, **kwargs):
+    # Bulk writes and soft-delete cascades don't say which hotels they touched
+    if fields is None or not CALENDAR_FIELDS[sender].isdisjoint(fields):
+        transaction.on_commit(discard_calendar)
+
+
+def connect_signals():
+    for model in CALENDAR_FIELDS:
+        label = model._meta.label
+        pre_save.connect(remember_stored_row, sender=model, dispatch_uid=f'occupancy:pre_save:{label}')
+        rows_changed.connect(rows_changed_in_bulk, sender=model, dispatch_uid=f'occupancy:rows_changed:{label}')
+    post_save.connect(booking_saved, sender=Booking, dispatch_uid='occupancy:post_save:hotel.Booking')
+    post_delete.connect(booking_deleted, sender=Booking, dispatch_uid='occupancy:post_delete:hotel.Booking')
+    post_save.connect(room_saved, sender=Room, dispatch_uid='occupancy:post_save:hotel.Room')
+    post_delete.connect(room_deleted, sender=Room, dispatch_uid='occupancy:post_delete:hotel.Room')
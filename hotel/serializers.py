@@ -1,32 +1,81 @@
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from datetime import timedelta
-from .models import Hotel, Staff, Guest, RoomType, Room, Booking, Payment
+from django.db.models import DecimalField, ExpressionWrapper, F
+from common.sparsefields import SparseFieldsetMixin
+from common.valuesserializer import ValuesSerializer
+from .models import Hotel, Staff, Guest, RoomType, Room, Booking, Payment, DaysBetween
 
 
-class HotelSerializer(serializers.ModelSerializer):
+class HotelSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Hotel
         fields = '__all__'
 
-class StaffSerializer(serializers.ModelSerializer):
+class HotelSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    # Read through the helpers, which use the with_stats() annotations when present
+    available_rooms = serializers.IntegerField(source='get_available_rooms', read_only=True)
+    occupied_rooms = serializers.IntegerField(source='get_occupied_rooms', read_only=True)
+    staff_count = serializers.IntegerField(source='get_staff_count', read_only=True)
+    average_rating = serializers.FloatField(source='get_average_rating', read_only=True, allow_null=True)
+    arrivals_today = serializers.IntegerField(read_only=True)
+    departures_today = serializers.IntegerField(read_only=True)
+    revenue = serializers.DecimalField(max_digits=15, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Hotel
+        fields = [
+            'id', 'name', 'stars', 'province', 'available_rooms', 'occupied_rooms', 'staff_count',
+            'average_rating', 'arrivals_today', 'departures_today', 'revenue',
+        ]
+
+class AvailabilitySearchSerializer(serializers.Serializer):
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    capacity = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, data):
+        if data['check_in'] >= data['check_out']:
+            raise serializers.ValidationError("Check-in date must be before check-out date.")
+        return data
+
+class AvailableRoomTypeSerializer(serializers.Serializer):
+    # One row of Hotel.get_available_room_types()
+    room_type = serializers.IntegerField()
+    name = serializers.CharField()
+    capacity = serializers.IntegerField()
+    price_per_night = serializers.DecimalField(max_digits=9, decimal_places=2)
+    available_rooms = serializers.IntegerField()
+
+class ExportFilterSerializer(serializers.Serializer):
+    output_format = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    hotel = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, data):
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise serializers.ValidationError("date_from must not be after date_to.")
+        return data
+
+class StaffSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     hotel = serializers.PrimaryKeyRelatedField(queryset=Hotel.objects.all())
     
     class Meta:
         model = Staff
         fields = '__all__'
 
-class GuestSerializer(serializers.ModelSerializer):
+class GuestSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Guest
         fields = '__all__'
 
-class RoomTypeSerializer(serializers.ModelSerializer):
+class RoomTypeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = RoomType
         fields = '__all__'
 
-class RoomSerializer(serializers.ModelSerializer):
+class RoomSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     hotel = serializers.PrimaryKeyRelatedField(queryset=Hotel.objects.all())
     room_type = serializers.PrimaryKeyRelatedField(queryset=RoomType.objects.all())
     
@@ -41,6 +90,10 @@ class RoomSerializer(serializers.ModelSerializer):
         return data
 
 
+class RoomValuesSerializer(ValuesSerializer):
+    serializer_class = RoomSerializer
+
+
 # class BookingSerializer(serializers.ModelSerializer):
 #     number_of_days = serializers.SerializerMethodField()
 
@@ -106,13 +159,28 @@ class RoomSerializer(serializers.ModelSerializer):
 #         validated_data['check_out_date'] = check_in_date + timedelta(days=number_of_days)
 
 #         return super().create(validated_data)
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    # Booking.save prices the stay from room.room_type, and the checkout task reads room.hotel
+    room = serializers.PrimaryKeyRelatedField(queryset=Room.objects.select_related('room_type', 'hotel'))
     number_of_days = serializers.IntegerField(required=False, write_only=True, help_text="Number of days to stay")
+    outstanding_balance = serializers.DecimalField(
+        source='get_outstanding_balance', read_only=True, max_digits=15, decimal_places=2
+    )
 
     class Meta:
         model = Booking
-        fields = ['id', 'guest', 'room', 'check_in_date', 'check_out_date', 'number_of_days', 'total_price']
-        read_only_fields = ['total_price']
+        fields = [
+            'id', 'guest', 'room', 'check_in_date', 'check_out_date', 'number_of_days', 'total_price',
+            'amount_paid', 'outstanding_balance',
+        ]
+        read_only_fields = ['total_price', 'amount_paid']
+        expandable_fields = {'room': RoomSerializer, 'guest': GuestSerializer}
+        # Added by to_representation
+        computed_fields = ['number_of_days']
+        field_columns = {
+            'outstanding_balance': ['total_price', 'amount_paid'],
+            'number_of_days': ['check_in_date', 'check_out_date'],
+        }
 
     def validate(self, data):
         check_in_date = data.get('check_in_date')
@@ -135,20 +203,34 @@ class BookingSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
+        validated_data.pop('number_of_days', None)
         return super().create(validated_data)
 
     def update(self, instance, validated_data):
+        validated_data.pop('number_of_days', None)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        if 'check_in_date' in representation and 'check_out_date' in representation:
+        if self.is_selected('number_of_days'):
             check_in_date = instance.check_in_date
             check_out_date = instance.check_out_date
             representation['number_of_days'] = (check_out_date - check_in_date).days
         return representation
 
 
+class BookingValuesSerializer(ValuesSerializer):
+    serializer_class = BookingSerializer
+    annotations = {
+        'outstanding_balance': ExpressionWrapper(
+            F('total_price') - F('amount_paid'), output_field=DecimalField(max_digits=15, decimal_places=2)
+        ),
+    }
+    # Appended by BookingSerializer.to_representation
+    extra_fields = {
+        'number_of_days': (DaysBetween('check_in_date', 'check_out_date'), int),
+    }
+
 
 
 
@@ -162,7 +244,8 @@ class BookingSerializer(serializers.ModelSerializer):
 
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+
+class PaymentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     booking = serializers.PrimaryKeyRelatedField(queryset=Booking.objects.all())
     amount = serializers.DecimalField(read_only=True, max_digits=9, decimal_places=2)
     payment_date = serializers.DateField(read_only=True)
@@ -174,8 +257,12 @@ class PaymentSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         booking = data.get('booking')
-        
-        if booking is None:
+
+        if self.instance is not None:
+            # Moving a payment would rewrite two bookings' balances
+            if booking is not None and booking.pk != self.instance.booking_id:
+                raise serializers.ValidationError({'booking': "A payment cannot be moved to another booking."})
+        elif booking is None:
             raise serializers.ValidationError("Booking must be provided.")
-        
+
         return data
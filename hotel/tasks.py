@@ -1,18 +1,196 @@
 # hotel/tasks.py
 
-from celery import shared_task
+import logging
+import time
+import uuid
+
+from celery import current_app, shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, Max, Min, OuterRef, Q
 from django.utils import timezone
+from kombu.exceptions import OperationalError
 from hotel.models import Booking, Room
-from datetime import date
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def get_sweep_window():
+    # Hourly runs overlap by an hour; the daily full sweep catches anything older
+    return timedelta(hours=getattr(settings, 'ROOM_STATUS_SWEEP_WINDOW_HOURS', 25))
+
+
+def get_rooms_to_free(now, since=None, hotel_id=None):
+    """
+    Occupied rooms with a booking that has ended as of ``now`` and no booking
+    still in progress. A stay ends once the hotel's check-out time has passed
+    on the check-out date. With ``since``, only bookings that ended or were
+    written (back-dated or imported ones) since then are considered.
+    """
+    today = now.date()
+    ended = Q(check_out_date__lt=today) | Q(
+        check_out_date=today, room__hotel__check_out_time__lte=now.time()
+    )
+    ended_bookings = Booking.objects.filter(ended, room=OuterRef('pk'))
+    if since is not None:
+        ended_bookings = ended_bookings.filter(Q(check_out_date__gte=since.date()) | Q(updated_at__gte=since))
+    active_bookings = Booking.objects.filter(room=OuterRef('pk'), check_in_date__lte=today).exclude(ended)
+
+    rooms = Room.objects.filter(status=Room.OCCUPIED)
+    if hotel_id is not None:
+        rooms = rooms.filter(hotel_id=hotel_id)
+    return rooms.filter(Exists(ended_bookings)).exclude(Exists(active_bookings))
+
+
+def free_ended_rooms(now=None, since=None, hotel_id=None, chunk_size=None):
+    now = now or timezone.localtime()
+    rooms = get_rooms_to_free(now, since, hotel_id)
+    if not chunk_size:
+        return rooms.update(status=Room.AVAILABLE, updated_at=now)
+
+    # Walk the primary key range so each UPDATE holds its locks briefly
+    occupied_rooms = Room.objects.filter(status=Room.OCCUPIED)
+    if hotel_id is not None:
+        occupied_rooms = occupied_rooms.filter(hotel_id=hotel_id)
+    bounds = occupied_rooms.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    rooms_freed = 0
+    for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        rooms_freed += rooms.filter(pk__gte=start, pk__lt=start + chunk_size).update(
+            status=Room.AVAILABLE, updated_at=now
+        )
+    return rooms_freed
 
 
 @shared_task
-def update_room_status():
-    test_date = date(2024, 6, 30)  # Simulate 30/6/2024
-    bookings = Booking.objects.filter(
-        check_out_date__lt=test_date, room__status=Room.OCCUPIED
+def update_room_status(hotel_id=None, chunk_size=None, full=False):
+    started = time.perf_counter()
+    now = timezone.localtime()
+    # A fixed window rather than a stored watermark, so no worker depends on another's state
+    since = None if full else now - get_sweep_window()
+
+    rooms_freed = free_ended_rooms(now, since, hotel_id, chunk_size)
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        "update_room_status freed %d room(s) since %s in %.1f ms",
+        rooms_freed, since or 'the beginning', elapsed_ms,
+    )
+    return {
+        'rooms_freed': rooms_freed,
+        'since': since.isoformat() if since else None,
+        'as_of': now.isoformat(),
+        'elapsed_ms': round(elapsed_ms, 1),
+    }
+
+
+def get_checkout_eta(booking):
+    return timezone.make_aware(
+        datetime.combine(booking.check_out_date, booking.room.hotel.check_out_time)
     )
-    for booking in bookings:
-        room = booking.room
-        room.status = Room.AVAILABLE
-        room.save()
+
+
+@shared_task(ignore_result=True)
+def release_room_at_checkout(booking_id, check_out_date):
+    booking = Booking.objects.select_related('room').filter(pk=booking_id).first()
+    # A deleted or rescheduled booking makes this run a no-op
+    if booking is None or booking.check_out_date.isoformat() != check_out_date:
+        return 0
+    now = timezone.localtime()
+    return get_rooms_to_free(now, hotel_id=booking.room.hotel_id).filter(pk=booking.room_id).update(
+        status=Room.AVAILABLE, updated_at=now
+    )
+
+
+def get_checkout_task_id(booking_id):
+    return Booking.all_objects.filter(pk=booking_id).values_list('checkout_task_id', flat=True).first()
+
+
+def set_checkout_task_id(booking_id, task_id):
+    # Bookkeeping, not a change to the booking, so updated_at stays put
+    Booking.all_objects.filter(pk=booking_id).update(checkout_task_id=task_id, updated_at=F('updated_at'))
+
+
+def revoke_checkout(booking_id, task_id):
+    if not task_id or current_app.conf.task_always_eager:
+        return
+    try:
+        current_app.control.revoke(task_id)
+    except OperationalError:
+        # Stale runs check the booking themselves, so a lost revoke is harmless
+        logger.warning("Could not revoke checkout task %s for booking %s", task_id, booking_id)
+
+
+def cancel_checkout(booking_id):
+    # The id lives on the booking row, so any process can revoke what another scheduled
+    task_id = get_checkout_task_id(booking_id)
+    if task_id:
+        set_checkout_task_id(booking_id, '')
+        revoke_checkout(booking_id, task_id)
+
+
+def new_checkout_task_id():
+    return str(uuid.uuid4())
+
+
+def publish_checkout(booking, task_id=None, producer=None):
+    try:
+        return release_room_at_checkout.apply_async(
+            (booking.pk, booking.check_out_date.isoformat()), eta=get_checkout_eta(booking),
+            task_id=task_id, retry=False, producer=producer,
+        )
+    except OperationalError:
+        logger.warning("Could not schedule checkout for booking %s", booking.pk)
+        return None
+
+
+def schedule_checkout(booking, task_id=None):
+    """
+    Schedule the room release for the booking's check-out time, replacing any
+    earlier schedule. Runs after commit so the task always sees the saved row;
+    the periodic update_room_status sweep covers anything that fails to enqueue.
+
+    A new booking saved with ``task_id`` (see new_checkout_task_id()) has no
+    schedule to replace, so its task is published under that id and no write
+    follows the INSERT.
+    """
+    def enqueue():
+        if task_id is not None:
+            # A failed publish leaves an id nothing answers to, which revoking ignores
+            publish_checkout(booking, task_id)
+            return
+        cancel_checkout(booking.pk)
+        result = publish_checkout(booking)
+        if result is not None:
+            set_checkout_task_id(booking.pk, result.id)
+
+    transaction.on_commit(enqueue)
+
+
+def schedule_checkouts(bookings):
+    """
+    Schedule the room releases of new bookings inserted with their
+    checkout_task_id, as bulk imports do: one after-commit callback and one
+    broker connection for the whole batch, and no writes.
+    """
+    def enqueue():
+        with current_app.producer_or_acquire() as producer:
+            for booking in bookings:
+                if publish_checkout(booking, booking.checkout_task_id, producer) is None:
+                    break  # The broker is down; the update_room_status sweep frees the rest
+
+    transaction.on_commit(enqueue)
+
+
+def unschedule_checkout(booking):
+    # Read the id now: a hard delete takes it away with the row
+    booking_id = booking.pk
+    task_id = get_checkout_task_id(booking_id)
+
+    def cancel():
+        set_checkout_task_id(booking_id, '')
+        revoke_checkout(booking_id, task_id)
+
+    transaction.on_commit(cancel)
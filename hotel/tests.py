@@ -1,3 +1,1039 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import shutil
+import tempfile
+import uuid
+import zlib
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import OperationalError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APITestCase
+
+from account.models import User
+from common import countcache, responsecache, slowqueries, softdelete
+from common.compression import GzipCompressor, compress_sequence, negotiate_encoding
+from common.countcache import cached_count
+from common.jsoncodec import JSONParser, JSONRenderer
+from . import occupancy
+from .models import Booking, Guest, Hotel, Payment, Room, RoomType, Staff
+from . import tasks
+from .tasks import update_room_status
+
+
+class HotelDataTestCase(APITestCase):
+    """An authenticated client, and add_rows() to add one row to every hotel table per call."""
+
+    def setUp(self):
+        for alias in caches:
+            caches[alias].clear()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_authenticate(self.user)
+        self.room_type = RoomType.objects.create(
+            name='Double', description='-', price_per_night=50, capacity=2, image='double.png'
+        )
+        self.guest = Guest.objects.create(
+            first_name='A', last_name='B', date_of_birth=date(1990, 1, 1), address='-', phone='-',
+            email='guest@example.com',
+        )
+        self.rows = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.rows += 1
+            hotel = Hotel.objects.create(
+                name=f'Hotel {self.rows}', address='-', village='-', district='-', province='-', phone='-',
+                email='hotel@example.com', stars=3, check_in_time=time(14), check_out_time=time(12),
+            )
+            Staff.objects.create(
+                hotel=hotel, first_name='S', last_name='T', position='-', date_of_birth=date(1990, 1, 1),
+                phone='-', email='staff@example.com', hire_date=date(2020, 1, 1),
+            )
+            Guest.objects.create(
+                first_name='G', last_name=str(self.rows), date_of_birth=date(1990, 1, 1), address='-', phone='-',
+                email='guest@example.com',
+            )
+            RoomType.objects.create(
+                name=f'Type {self.rows}', description='-', price_per_night=10, capacity=1, image='type.png'
+            )
+            room = Room.objects.create(hotel=hotel, room_type=self.room_type, room_number=f'R{self.rows}')
+            check_in = date(2030, 1, 1) + timedelta(days=self.rows)
+            booking = Booking.objects.create(
+                guest=self.guest, room=room, check_in_date=check_in, check_out_date=check_in + timedelta(days=2)
+            )
+            Payment.objects.create(booking=booking, amount=10, payment_date=check_in)
+
+
+class ListQueryCountTests(HotelDataTestCase):
+    """Every list endpoint takes the same number of queries for a page of 2 rows as for 8."""
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(captured.captured_queries)
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        urls = [
+            '/api/hotels/', '/api/hotels/summary/', '/api/staffs/', '/api/guests/', '/api/roomtypes/',
+            '/api/rooms/', '/api/bookings/', '/api/payments/',
+        ]
+        self.add_rows(2)
+        small = {url: self.count_queries(url) for url in urls}
+        self.add_rows(6)
+        large = {url: self.count_queries(url) for url in urls}
+        self.assertEqual(small, large)
+
+    def test_booking_create_reads_room_once(self):
+        self.add_rows(1)
+        room = Room.objects.get()
+        check_in = date(2031, 1, 1)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post('/api/bookings/', {
+                'guest': self.guest.pk, 'room': room.pk,
+                'check_in_date': check_in.isoformat(), 'check_out_date': (check_in + timedelta(days=3)).isoformat(),
+            })
+        self.assertEqual(response.status_code, 201, response.content)
+        room_type_reads = [
+            query for query in captured.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "hotel_roomtype"' in query['sql']
+        ]
+        self.assertEqual(room_type_reads, [])
+
+    def test_values_serializers_render_like_the_serializers(self):
+        from .views import BookingViewSet, RoomViewSet
+
+        self.add_rows(3)
+        Booking.objects.filter(pk=Booking.objects.first().pk).delete()
+        urls = {
+            BookingViewSet: [
+                '/api/bookings/', '/api/bookings/?pagination=cursor&ordering=-created_at',
+                '/api/bookings/?fields=id,number_of_days,room', '/api/bookings/?omit=outstanding_balance',
+            ],
+            RoomViewSet: [
+                '/api/rooms/', f'/api/rooms/{Room.objects.first().pk}/',
+                f'/api/rooms/{Room.objects.first().pk}/?fields=id,status',
+            ],
+        }
+        for viewset, viewset_urls in urls.items():
+            values_serializer = viewset.values_serializer
+            for url in viewset_urls:
+                caches['counts'].clear()
+                fast = self.client.get(url).content
+                viewset.values_serializer = None
+                try:
+                    caches['counts'].clear()
+                    slow = self.client.get(url).content
+                finally:
+                    viewset.values_serializer = values_serializer
+                self.assertEqual(fast, slow, url)
+
+    def test_sparse_fieldsets_select_only_the_columns_they_render(self):
+        self.add_rows(2)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/bookings/?fields=id,room,number_of_days&pagination=cursor')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'room', 'number_of_days'])
+        page_query = captured.captured_queries[-1]['sql']
+        self.assertNotIn('total_price', page_query)
+        self.assertNotIn('guest_id', page_query)
+
+        response = self.client.get('/api/rooms/?omit=created_at,updated_at,is_deleted,deleted_at')
+        self.assertEqual(
+            list(response.data['results'][0]), ['id', 'hotel', 'room_type', 'room_number', 'status']
+        )
+        response = self.client.get('/api/bookings/?fields=id,bogus')
+        self.assertEqual(response.status_code, 400)
+
+    def test_expand_joins_the_relations_into_the_page_query(self):
+        self.add_rows(4)
+        plain = self.count_queries('/api/bookings/')
+        expanded = self.count_queries('/api/bookings/?expand=room,guest')
+        self.assertEqual(plain, expanded)
+        booking = self.client.get('/api/bookings/?expand=room,guest').data['results'][0]
+        self.assertEqual(booking['room']['room_number'], Room.objects.get(pk=booking['room']['id']).room_number)
+        self.assertEqual(booking['guest']['email'], 'guest@example.com')
+        self.assertEqual(self.client.get('/api/bookings/?expand=payments').status_code, 400)
+
+
+class AvailabilitySearchTests(HotelDataTestCase):
+    """Room types with a room free for the whole stay, by price."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_rows(1)
+        self.hotel = Hotel.objects.get()
+        self.booking = Booking.objects.get()  # 2030-01-02 to 2030-01-04 in room R1, a Double
+        suite = RoomType.objects.create(
+            name='Suite', description='-', price_per_night=120, capacity=4, image='suite.png'
+        )
+        Room.objects.create(hotel=self.hotel, room_type=suite, room_number='S1')
+
+    def search(self, check_in, check_out, **params):
+        response = self.client.get(f'/api/hotels/{self.hotel.pk}/availability/', {
+            'check_in': check_in, 'check_out': check_out, **params,
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row['name']: row for row in response.data}
+
+    def test_stays_touching_a_booking_do_not_overlap_it(self):
+        self.assertIn('Double', self.search('2030-01-04', '2030-01-06'))
+        self.assertIn('Double', self.search('2030-01-01', '2030-01-02'))
+        self.assertNotIn('Double', self.search('2030-01-03', '2030-01-05'))
+        self.assertNotIn('Double', self.search('2030-01-01', '2030-01-10'))
+
+    def test_renders_prices_like_the_other_endpoints(self):
+        rows = self.search('2030-02-01', '2030-02-03')
+        self.assertEqual(list(rows), ['Double', 'Suite'])
+        self.assertEqual(rows['Double']['price_per_night'], '50.00')
+        self.assertEqual(rows['Suite']['available_rooms'], 1)
+
+    def test_capacity_filters_room_types(self):
+        self.assertEqual(list(self.search('2030-02-01', '2030-02-03', capacity=3)), ['Suite'])
+
+    def test_deleted_bookings_do_not_block_a_room(self):
+        self.booking.delete()
+        self.assertIn('Double', self.search('2030-01-03', '2030-01-05'))
+
+    def test_deleted_hotels_are_not_searched(self):
+        self.hotel.delete()
+        response = self.client.get(f'/api/hotels/{self.hotel.pk}/availability/', {
+            'check_in': '2030-02-01', 'check_out': '2030-02-03',
+        })
+        self.assertEqual(response.status_code, 404)
+
+
+class OccupancyCalendarTests(HotelDataTestCase):
+    """Loaded calendars follow committed booking and room writes, cascades included."""
+
+    def setUp(self):
+        super().setUp()
+        occupancy.discard_calendar()
+        self.addCleanup(occupancy.discard_calendar)
+        self.add_rows(1)
+        self.hotel, self.room = Hotel.objects.get(), Room.objects.get()
+        self.check_in = timezone.localdate() + timedelta(days=10)
+
+    def free_rooms(self, check_in, nights=2):
+        response = self.client.get(f'/api/hotels/{self.hotel.pk}/free_rooms/', {
+            'check_in': check_in.isoformat(), 'check_out': (check_in + timedelta(days=nights)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data['rooms']
+
+    def book(self, check_in):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/bookings/', {
+                'guest': self.guest.pk, 'room': self.room.pk,
+                'check_in_date': check_in.isoformat(), 'check_out_date': (check_in + timedelta(days=2)).isoformat(),
+            })
+        self.assertEqual(response.status_code, 201, response.content)
+        return Booking.objects.get(pk=response.data['id'])
+
+    def test_staff_check_and_rebuild_the_serving_workers_calendar(self):
+        url = f'/api/hotels/{self.hotel.pk}/calendar/'
+        self.assertEqual(self.client.get(url).data['loaded'], False)
+        self.free_rooms(self.check_in)
+        self.assertEqual(self.client.get(url).data['mismatched_rooms'], [])
+        # A booking this worker never heard of
+        Booking.objects.bulk_create([Booking(
+            guest=self.guest, room=self.room, check_in_date=self.check_in,
+            check_out_date=self.check_in + timedelta(days=2), total_price=100,
+        )])
+        self.assertEqual(self.client.get(url).data['mismatched_rooms'], [self.room.pk])
+        self.assertEqual(self.client.post(url).data['mismatched_rooms'], [])
+        self.assertEqual(self.free_rooms(self.check_in), [])
+
+        self.client.force_authenticate(User.objects.create_user('clerk', 'clerk@example.com', 'clerk'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_booking_writes_update_the_loaded_calendar(self):
+        self.assertEqual(self.free_rooms(self.check_in), [self.room.pk])
+        booking = self.book(self.check_in)
+        self.assertEqual(self.free_rooms(self.check_in), [])
+
+        moved = self.check_in + timedelta(days=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/bookings/{booking.pk}/', {
+                'check_in_date': moved.isoformat(), 'check_out_date': (moved + timedelta(days=2)).isoformat(),
+            })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.free_rooms(self.check_in), [self.room.pk])
+        self.assertEqual(self.free_rooms(moved), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/bookings/{booking.pk}/')
+        self.assertEqual(self.free_rooms(moved), [self.room.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/bookings/{booking.pk}/restore/')
+        self.assertEqual(self.free_rooms(moved), [])
+
+    def test_rolled_back_writes_leave_the_calendar_alone(self):
+        booking = self.book(self.check_in)
+        self.assertEqual(self.free_rooms(self.check_in), [])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    booking.check_in_date += timedelta(days=5)
+                    booking.check_out_date += timedelta(days=5)
+                    booking.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.free_rooms(self.check_in), [])
+
+    def test_cascaded_deletes_release_the_nights(self):
+        self.book(self.check_in)
+        self.assertEqual(self.free_rooms(self.check_in), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/guests/{self.guest.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.free_rooms(self.check_in), [self.room.pk])
+
+    def test_room_writes_drop_the_calendar(self):
+        self.free_rooms(self.check_in)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.change_status(Room.OCCUPIED)
+        # Status is not something calendars index
+        self.assertTrue(occupancy.is_loaded(self.hotel.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.room_type = RoomType.objects.exclude(pk=self.room.room_type_id).first()
+            self.room.save()
+        self.assertFalse(occupancy.is_loaded(self.hotel.pk))
+        self.free_rooms(self.check_in)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/rooms/{self.room.pk}/hard_delete/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(occupancy.is_loaded(self.hotel.pk))
+        self.assertEqual(self.free_rooms(self.check_in), [])
+
+    def test_free_rooms_checks_the_hotel_first(self):
+        self.free_rooms(self.check_in)
+        self.hotel.delete()
+        response = self.client.get(f'/api/hotels/{self.hotel.pk}/free_rooms/', {
+            'check_in': self.check_in.isoformat(), 'check_out': (self.check_in + timedelta(days=2)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 404)
+
+
+class SoftDeleteCascadeTests(HotelDataTestCase):
+    """Soft deletes flip every live descendant in one UPDATE per model, and nothing else."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_rows(2)
+        self.hotel, self.other_hotel = Hotel.objects.order_by('pk')
+
+    def test_registry_is_built_at_startup(self):
+        relations = {relation.related_model for relation in softdelete._cascade_registry[Hotel]}
+        self.assertEqual(relations, {Room, Staff})
+
+    def test_delete_cascades_to_every_descendant(self):
+        with CaptureQueriesContext(connection) as captured:
+            total, counts = self.hotel.delete()
+        # One UPDATE per model and one for the payment ledger, no rows read
+        statements = [query['sql'] for query in captured.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual([sql.split()[0] for sql in statements], ['UPDATE'] * 6)
+        self.assertEqual(counts, {
+            'hotel.Staff': 1, 'hotel.Payment': 1, 'hotel.Booking': 1, 'hotel.Room': 1, 'hotel.Hotel': 1,
+        })
+        self.assertEqual(total, 5)
+        deleted_at = Hotel.all_objects.get(pk=self.hotel.pk).deleted_at
+        for model, lookup in [
+            (Staff, 'hotel'), (Room, 'hotel'), (Booking, 'room__hotel'), (Payment, 'booking__room__hotel'),
+        ]:
+            self.assertEqual(
+                list(model.all_objects.filter(**{lookup: self.hotel}).values_list('is_deleted', 'deleted_at')),
+                [(True, deleted_at)],
+            )
+            self.assertFalse(model.all_objects.filter(**{lookup: self.other_hotel}, is_deleted=True).exists())
+        # The guest is a parent of the booking, not a child of the hotel
+        self.assertFalse(Guest.deleted_objects.exists())
+
+    def test_dry_run_counts_without_deleting(self):
+        total, counts = self.hotel.delete(dry_run=True)
+        self.assertEqual(total, 5)
+        self.assertEqual(counts['hotel.Booking'], 1)
+        self.assertFalse(Booking.deleted_objects.exists())
+
+    def test_queryset_delete_cascades(self):
+        total, counts = Hotel.objects.all().delete()
+        self.assertEqual(counts['hotel.Booking'], 2)
+        self.assertEqual(total, 10)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_cascade_can_be_turned_off(self):
+        self.hotel.delete(cascade=False)
+        self.assertEqual(Room.objects.filter(hotel=self.hotel).count(), 1)
+
+    def test_already_deleted_children_keep_their_deleted_at(self):
+        booking = Booking.objects.get(room__hotel=self.hotel)
+        booking.delete()
+        deleted_at = Booking.all_objects.get(pk=booking.pk).deleted_at
+        self.hotel.delete()
+        self.assertEqual(Booking.all_objects.get(pk=booking.pk).deleted_at, deleted_at)
+
+
+    def test_restore_brings_back_only_the_same_cascade(self):
+        staff = Staff.objects.get(hotel=self.hotel)
+        staff.delete()
+        self.hotel.delete()
+        self.assertEqual(Staff.deleted_objects.count(), 1)
+        self.assertFalse(Booking.objects.filter(room__hotel=self.hotel).exists())
+
+        total, counts = Hotel.deleted_objects.all().restore(pk=self.hotel.pk)
+        self.assertEqual(counts, {
+            'hotel.Staff': 0, 'hotel.Payment': 1, 'hotel.Booking': 1, 'hotel.Room': 1, 'hotel.Hotel': 1,
+        })
+        self.assertEqual(total, 4)
+        for model, lookup in [(Room, 'hotel'), (Booking, 'room__hotel'), (Payment, 'booking__room__hotel')]:
+            self.assertEqual(model.objects.filter(**{lookup: self.hotel}).count(), 1)
+        # Deleted on its own before the hotel, so it stays deleted
+        self.assertTrue(Staff.all_objects.get(pk=staff.pk).is_deleted)
+
+    def test_restoring_a_child_leaves_its_parent_deleted(self):
+        self.hotel.delete()
+        room = Room.all_objects.get(hotel=self.hotel)
+        room.restore()
+        self.assertTrue(Room.objects.filter(pk=room.pk).exists())
+        self.assertTrue(Booking.objects.filter(room=room).exists())
+        self.assertTrue(Hotel.all_objects.get(pk=self.hotel.pk).is_deleted)
+
+
+class RoomStatusSweepTests(HotelDataTestCase):
+    """The hourly sweep frees rooms whose stays ended or were written lately; the full one, any."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_rows(2)
+        self.recent_room, self.old_room = Room.objects.order_by('pk')
+        today = timezone.localdate()
+        # An old stay nobody touched since, and one back-dated (imported) just now
+        Booking.objects.filter(room=self.old_room).update(
+            check_in_date=today - timedelta(days=30), check_out_date=today - timedelta(days=28),
+            updated_at=timezone.now() - timedelta(days=28),
+        )
+        Booking.objects.filter(room=self.recent_room).update(
+            check_in_date=today - timedelta(days=30), check_out_date=today - timedelta(days=28),
+        )
+        Room.objects.update(status=Room.OCCUPIED)
+
+    def test_incremental_sweep_frees_rooms_of_recently_written_stays(self):
+        self.assertEqual(update_room_status()['rooms_freed'], 1)
+        self.assertEqual(Room.objects.get(pk=self.recent_room.pk).status, Room.AVAILABLE)
+        self.assertEqual(Room.objects.get(pk=self.old_room.pk).status, Room.OCCUPIED)
+
+    def test_full_sweep_frees_every_ended_stay(self):
+        self.assertEqual(update_room_status(full=True, chunk_size=1)['rooms_freed'], 2)
+        self.assertFalse(Room.objects.filter(status=Room.OCCUPIED).exists())
+
+    def test_rooms_with_a_stay_in_progress_stay_occupied(self):
+        today = timezone.localdate()
+        Booking.objects.create(
+            guest=self.guest, room=self.recent_room, check_in_date=today, check_out_date=today + timedelta(days=1)
+        )
+        self.assertEqual(update_room_status(full=True)['rooms_freed'], 1)
+        self.assertEqual(Room.objects.get(pk=self.recent_room.pk).status, Room.OCCUPIED)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, CELERY_BROKER_URL='memory://')
+class CheckoutSchedulingTests(HotelDataTestCase):
+    """Each booking keeps one pending room-release task, tracked on its row."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_rows(1)
+        self.room = Room.objects.get()
+        self.check_in = timezone.localdate() + timedelta(days=10)
+
+    def book(self, check_in):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/bookings/', {
+                'guest': self.guest.pk, 'room': self.room.pk,
+                'check_in_date': check_in.isoformat(), 'check_out_date': (check_in + timedelta(days=2)).isoformat(),
+            })
+        self.assertEqual(response.status_code, 201, response.content)
+        return Booking.objects.get(pk=response.data['id'])
+
+    def test_schedule_reschedule_and_cancel(self):
+        booking = self.book(self.check_in)
+        scheduled = booking.checkout_task_id
+        self.assertTrue(scheduled)
+
+        with mock.patch.object(tasks, 'revoke_checkout') as revoke:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    f'/api/bookings/{booking.pk}/', {'check_out_date': (self.check_in + timedelta(days=4)).isoformat()}
+                )
+            self.assertEqual(response.status_code, 200, response.content)
+            revoke.assert_called_once_with(booking.pk, scheduled)
+            rescheduled = Booking.objects.get(pk=booking.pk).checkout_task_id
+            self.assertNotIn(rescheduled, ('', scheduled))
+
+            revoke.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(f'/api/bookings/{booking.pk}/')
+            revoke.assert_called_once_with(booking.pk, rescheduled)
+        self.assertEqual(Booking.all_objects.get(pk=booking.pk).checkout_task_id, '')
+
+    def test_create_writes_the_booking_once(self):
+        with CaptureQueriesContext(connection) as captured:
+            booking = self.book(self.check_in)
+        booking_writes = [
+            query['sql'].split()[0] for query in captured.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE')) and '"hotel_booking"' in query['sql'].split('(')[0]
+        ]
+        self.assertEqual(booking_writes, ['INSERT'])
+        self.assertTrue(booking.checkout_task_id)
+
+    def test_hard_delete_revokes_the_pending_task(self):
+        booking = self.book(self.check_in)
+        with mock.patch.object(tasks, 'revoke_checkout') as revoke:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(f'/api/bookings/{booking.pk}/hard_delete/')
+            self.assertEqual(response.status_code, 204)
+        revoke.assert_called_once_with(booking.pk, booking.checkout_task_id)
+
+    def test_task_id_survives_booking_updates(self):
+        booking = self.book(self.check_in)
+        updated_at = booking.updated_at
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.checkout_task_id = 'stale'
+        booking.save()
+        self.assertNotEqual(Booking.objects.get(pk=booking.pk).checkout_task_id, 'stale')
+        self.assertGreater(Booking.objects.get(pk=booking.pk).updated_at, updated_at)
+
+    def test_task_releases_the_room_once_the_stay_ended(self):
+        Booking.objects.all().delete()
+        Room.objects.update(status=Room.AVAILABLE)
+        self.book(timezone.localdate() - timedelta(days=5))
+        self.assertEqual(Room.objects.get().status, Room.AVAILABLE)
+
+
+class PaymentLedgerTests(HotelDataTestCase):
+    """Booking.amount_paid always equals the sum of the booking's active payments."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_rows(2)
+        self.booking, self.other_booking = Booking.objects.order_by('pk')
+
+    def assertLedgersMatch(self):
+        for booking in Booking.all_objects.annotate(payments_total=Booking.get_payments_total()):
+            self.assertEqual(booking.amount_paid, booking.payments_total, booking)
+
+    def test_moving_or_repricing_a_payment_updates_both_ledgers(self):
+        payment = Payment.objects.get(booking=self.booking)
+        payment.booking = self.other_booking
+        payment.save()
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).amount_paid, 0)
+        self.assertEqual(Booking.objects.get(pk=self.other_booking.pk).amount_paid, 20)
+        payment.amount = 15
+        payment.save()
+        self.assertEqual(Booking.objects.get(pk=self.other_booking.pk).amount_paid, 25)
+        self.assertLedgersMatch()
+
+        payment.amount = 1000
+        with self.assertRaisesMessage(ValueError, 'exceeds the outstanding balance'):
+            payment.save()
+        self.assertLedgersMatch()
+
+    def test_api_rejects_moving_a_payment(self):
+        payment = Payment.objects.get(booking=self.booking)
+        response = self.client.patch(f'/api/payments/{payment.pk}/', {'booking': self.other_booking.pk})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'/api/payments/{payment.pk}/', {'payment_method': Payment.PAYMENT_METHOD_CASH})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertLedgersMatch()
+
+    def test_queryset_delete_and_restore_go_through_the_ledger(self):
+        Payment.objects.all().delete()
+        self.assertEqual(list(Booking.objects.values_list('amount_paid', flat=True)), [0, 0])
+        self.assertLedgersMatch()
+        Payment.deleted_objects.filter(booking=self.booking).restore()
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).amount_paid, 10)
+        self.assertLedgersMatch()
+        Payment.objects.all().hard_delete()
+        self.assertLedgersMatch()
+
+    def test_cascades_go_through_the_ledger(self):
+        self.booking.delete()
+        self.assertEqual(Booking.all_objects.get(pk=self.booking.pk).amount_paid, 0)
+        self.assertLedgersMatch()
+        Booking.all_objects.get(pk=self.booking.pk).restore()
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).amount_paid, 10)
+        self.assertLedgersMatch()
+
+    def test_instance_delete_and_restore(self):
+        payment = Payment.objects.get(booking=self.booking)
+        payment.delete()
+        self.assertLedgersMatch()
+        payment.restore()
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).amount_paid, 10)
+        self.assertLedgersMatch()
+
+
+class ReservationTests(HotelDataTestCase):
+    """A room is never booked twice for the same night."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_rows(1)
+        self.room = Room.objects.get()
+        self.check_in = timezone.localdate() + timedelta(days=10)
+
+    def book(self, check_in, nights=2):
+        return self.client.post('/api/bookings/', {
+            'guest': self.guest.pk, 'room': self.room.pk,
+            'check_in_date': check_in.isoformat(), 'check_out_date': (check_in + timedelta(days=nights)).isoformat(),
+        })
+
+    def test_overlapping_booking_is_rejected(self):
+        self.assertEqual(self.book(self.check_in).status_code, 201)
+        response = self.book(self.check_in + timedelta(days=1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already booked', str(response.data))
+        # Back to back stays share no night
+        self.assertEqual(self.book(self.check_in + timedelta(days=2)).status_code, 201)
+        self.assertEqual(Booking.objects.filter(room=self.room, check_in_date__lt=date(2030, 1, 1)).count(), 2)
+
+    def test_overlapping_update_is_rejected(self):
+        first = self.book(self.check_in).data['id']
+        self.book(self.check_in + timedelta(days=2))
+        response = self.client.patch(
+            f'/api/bookings/{first}/', {'check_out_date': (self.check_in + timedelta(days=3)).isoformat()}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.get(pk=first).check_out_date, self.check_in + timedelta(days=2))
+
+    def test_lock_timeout_is_a_conflict(self):
+        from .views import BookingViewSet
+
+        locked = OperationalError('database is locked')
+        with mock.patch.object(BookingViewSet, 'reserve_room', side_effect=locked):
+            response = self.book(self.check_in)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Booking.objects.filter(check_in_date=self.check_in).exists())
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, CELERY_BROKER_URL='memory://')
+class BookingImportTests(HotelDataTestCase):
+    """Imported bookings get the same overlap check, room status and checkout as created ones."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_rows(2)
+        self.room, self.other_room = Room.objects.order_by('pk')
+        Room.objects.update(status=Room.AVAILABLE)
+        self.check_in = timezone.localdate() + timedelta(days=10)
+
+    def import_rows(self, rows):
+        body = '\n'.join(json.dumps(row) for row in rows)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.generic(
+                'POST', '/api/bookings/import/', body, content_type='application/x-ndjson'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def row(self, room, check_in, nights=2):
+        return {
+            'guest': self.guest.pk, 'room': room.pk, 'check_in_date': check_in.isoformat(), 'number_of_days': nights,
+        }
+
+    def test_overlaps_and_bad_rows_fail_alone(self):
+        existing = Booking.objects.get(room=self.room)
+        report = self.import_rows([
+            self.row(self.room, existing.check_in_date),  # clashes with a stored booking
+            self.row(self.room, self.check_in),
+            self.row(self.room, self.check_in + timedelta(days=1)),  # clashes with row 2
+            {**self.row(self.room, self.check_in), 'room': 999999},
+            self.row(self.other_room, self.check_in),
+        ])
+        self.assertEqual(report['created'], 2)
+        self.assertEqual([error['row'] for error in report['errors']], [1, 3, 4])
+        self.assertIn('already booked', str(report['errors'][0]))
+        self.assertIn('Unknown room', str(report['errors'][2]))
+        self.assertEqual(Booking.objects.filter(check_in_date=self.check_in).count(), 2)
+
+    def test_imported_stays_occupy_their_rooms_until_checkout(self):
+        past = timezone.localdate() - timedelta(days=20)
+        with CaptureQueriesContext(connection) as captured:
+            self.import_rows([self.row(self.room, self.check_in), self.row(self.other_room, past)])
+        booking_updates = [
+            query for query in captured.captured_queries if query['sql'].startswith('UPDATE "hotel_booking"')
+        ]
+        self.assertEqual(booking_updates, [])
+        self.assertEqual(Room.objects.get(pk=self.room.pk).status, Room.OCCUPIED)
+        self.assertEqual(Room.objects.get(pk=self.other_room.pk).status, Room.AVAILABLE)
+        self.assertTrue(Booking.objects.get(room=self.room, check_in_date=self.check_in).checkout_task_id)
+        self.assertFalse(Booking.objects.get(room=self.other_room, check_in_date=past).checkout_task_id)
+
+    def test_malformed_line_keeps_the_rows_before_it(self):
+        from .imports import BookingImporter, read_rows
+
+        lines = [
+            json.dumps(self.row(self.room, self.check_in)), '{"guest": ',
+            json.dumps(self.row(self.other_room, self.check_in)),
+        ]
+        report = BookingImporter(batch_size=10).run(read_rows(lines, 'ndjson'))
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [2])
+        self.assertTrue(Booking.objects.filter(room=self.room, check_in_date=self.check_in).exists())
+
+    def test_lock_timeout_fails_the_batch(self):
+        from .imports import BookingImporter
+
+        locked = OperationalError('database is locked')
+        with mock.patch.object(BookingImporter, 'lock_batch', side_effect=locked):
+            report = self.import_rows([self.row(self.room, self.check_in), self.row(self.other_room, self.check_in)])
+        self.assertEqual(report['created'], 0)
+        self.assertEqual([error['row'] for error in report['errors']], [1, 2])
+        self.assertFalse(Booking.objects.filter(check_in_date=self.check_in).exists())
+
+
+class PaginationCountModeTests(HotelDataTestCase):
+    """?count=none|approx|exact works in every pagination mode; none never counts."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_rows(5)
+
+    def get(self, url):
+        for alias in caches:
+            caches[alias].clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data, len(captured.captured_queries)
+
+    def test_every_mode_honours_count(self):
+        for pagination in ['page_number&page_size=2', 'limit_offset&limit=2', 'cursor&page_size=2']:
+            url = f'/api/bookings/?pagination={pagination}'
+            with self.subTest(pagination=pagination):
+                exact, exact_queries = self.get(f'{url}&count=exact')
+                approx, _ = self.get(f'{url}&count=approx')
+                none, none_queries = self.get(f'{url}&count=none')
+                self.assertEqual(exact['count'], 5)
+                # Without PostgreSQL statistics approx falls back to the cached exact count
+                self.assertEqual(approx['count'], 5)
+                self.assertNotIn('count', none)
+                self.assertEqual(none_queries, exact_queries - 1)
+                self.assertEqual(none['results'], exact['results'])
+                self.assertIsNotNone(none['next'])
+
+    def test_uncounted_pages_end_where_the_rows_do(self):
+        data, _ = self.get('/api/bookings/?pagination=page_number&page_size=2&page=3&count=none')
+        self.assertEqual((len(data['results']), data['next']), (1, None))
+        self.assertIn('page=2', data['previous'])
+        data, _ = self.get('/api/bookings/?pagination=limit_offset&limit=2&offset=4&count=none')
+        self.assertEqual((len(data['results']), data['next']), (1, None))
+        data, _ = self.get('/api/bookings/?pagination=limit_offset&limit=5&count=none')
+        self.assertEqual((len(data['results']), data['next']), (5, None))
+        self.assertEqual(self.client.get('/api/bookings/?page=4&page_size=2&count=none').status_code, 404)
+
+    def test_bad_count_requests_are_rejected(self):
+        self.assertEqual(self.client.get('/api/bookings/?count=some').status_code, 400)
+        self.assertEqual(self.client.get('/api/bookings/?page=last&count=none').status_code, 400)
+        self.assertEqual(self.client.get('/api/bookings/?page=last&count=exact').status_code, 200)
+
+
+class CountCacheTests(HotelDataTestCase):
+    """Cached counts never outlive the commit of a write that changes them."""
+
+    def test_count_cached_before_commit_is_retired_on_commit(self):
+        self.add_rows(2)
+        bookings = Booking.objects.all()
+        self.assertEqual(cached_count(bookings), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_rows(1)
+            # The writer itself sees its row straight away
+            self.assertEqual(cached_count(bookings), 3)
+            # A reader that can't see the uncommitted row caches the old count meanwhile
+            countcache.get_cache().set(countcache.get_count_key(bookings), 2)
+        self.assertEqual(cached_count(bookings), 3)
+
+    def test_bulk_writes_retire_counts(self):
+        self.add_rows(2)
+        rooms = Room.objects.filter(status=Room.AVAILABLE)
+        self.assertEqual(cached_count(rooms), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Room.objects.update(status=Room.OCCUPIED)
+        self.assertEqual(cached_count(rooms), 0)
+
+
+class ResponseCacheTests(HotelDataTestCase):
+    """Hotel responses are cached only in caches every worker shares."""
+
+    def get_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/hotels/')
+        self.assertEqual(response.status_code, 200)
+        return len(captured.captured_queries), response.data
+
+    def test_local_memory_caches_disable_it(self):
+        self.add_rows(1)
+        self.assertFalse(responsecache.is_enabled())
+        with mock.patch.object(responsecache, 'get_or_build') as get_or_build:
+            self.get_queries()
+        get_or_build.assert_not_called()
+
+    def test_single_process_servers_can_turn_it_on(self):
+        self.add_rows(1)
+        with self.settings(RESPONSE_CACHE='on'):
+            self.assertTrue(responsecache.is_enabled())
+            first, _ = self.get_queries()
+            cached, _ = self.get_queries()
+        self.assertLess(cached, first)
+        # Off even where every cache is shared
+        dummy = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        with self.settings(RESPONSE_CACHE='off', CACHES={'default': dummy, 'counts': dummy, 'responses': dummy}):
+            self.assertFalse(responsecache.is_enabled())
+
+    def test_shared_caches_serve_until_a_commit_retires_them(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shared = {
+            alias: {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': f'{location}/{alias}'}
+            for alias in ['default', 'counts', 'responses']
+        }
+        with self.settings(CACHES=shared):
+            self.assertTrue(responsecache.is_enabled())
+            self.add_rows(1)
+            first, _ = self.get_queries()
+            cached, _ = self.get_queries()
+            self.assertLess(cached, first)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.add_rows(1)
+            _, data = self.get_queries()
+            self.assertEqual(data['count'], 2)
+
+
+class ConditionalGetTests(HotelDataTestCase):
+    """ETags change when anything rendered changes, expanded relations included."""
+
+    def assertRevalidates(self, path):
+        etag = self.client.get(path)['ETag']
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.guest.phone = '+1'
+        self.guest.save()
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def get_statements(self, path, **headers):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path, **headers)
+        return response, [query['sql'] for query in captured.captured_queries]
+
+    def shared_counts(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        counts = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        return self.settings(CACHES={**settings.CACHES, 'counts': counts})
+
+    def test_list_etag_covers_expanded_relations(self):
+        self.add_rows(1)
+        self.assertRevalidates('/api/bookings/?expand=guest')
+
+    def test_shared_generations_validate_lists_without_a_query(self):
+        self.add_rows(1)
+        with self.shared_counts():
+            self.assertRevalidates('/api/bookings/?expand=guest')
+            path = '/api/bookings/?pagination=cursor&count=none'
+            response, statements = self.get_statements(path)
+            response, statements = self.get_statements(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([sql for sql in statements if 'hotel_booking' in sql])
+
+    def test_uncounted_lists_never_count(self):
+        self.add_rows(3)
+        for path in ['/api/bookings/?count=none', '/api/bookings/?pagination=cursor&count=none']:
+            response, statements = self.get_statements(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('ETag', response)
+            self.assertFalse([sql for sql in statements if 'COUNT(' in sql], path)
+
+    def test_detail_etag_covers_expanded_relations(self):
+        self.add_rows(1)
+        self.assertRevalidates(f'/api/bookings/{Booking.objects.get().pk}/?expand=guest')
+
+
+class MetricsAccessTests(APITestCase):
+    """/internal/metrics/ is for staff, and for networks only when configured."""
+
+    def test_loopback_needs_opting_in(self):
+        self.assertEqual(self.client.get('/internal/metrics/', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        with self.settings(METRICS_ALLOWED_NETWORKS=['127.0.0.0/8']):
+            self.assertEqual(self.client.get('/internal/metrics/', REMOTE_ADDR='127.0.0.1').status_code, 200)
+
+    def test_staff_users_are_allowed(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.assertEqual(self.client.get('/internal/metrics/').status_code, 200)
+
+
+class SlowQueryTests(APITestCase):
+    """Slow statements are recorded with a plan, without touching the caller's transaction."""
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_explain_runs_in_a_savepoint(self):
+        recorder = slowqueries.SlowQueryRecorder(connection, 0)
+        with self.settings(SLOW_QUERY_CACHE_ALIAS='default'), CaptureQueriesContext(connection) as captured:
+            with connection.execute_wrapper(recorder):
+                list(Hotel.objects.all())
+            records = slowqueries.get_records()
+        statements = [query['sql'] for query in captured.captured_queries]
+        explain_at = next(index for index, sql in enumerate(statements) if sql.startswith('EXPLAIN'))
+        self.assertTrue(statements[explain_at - 1].startswith('SAVEPOINT'))
+        self.assertEqual(records[0]['origin'], 'unknown')
+        self.assertIn('hotel_hotel', records[0]['plan'])
+
+
+class SparseFieldsetTests(HotelDataTestCase):
+    """?fields=, ?omit= and ?expand= shape the output and the SQL behind it."""
+
+    def get_page_query(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, captured.captured_queries[-1]['sql']
+
+    def test_fields_and_omit_shape_the_output(self):
+        self.add_rows(1)
+        response = self.client.get('/api/staffs/?fields=id,first_name')
+        self.assertEqual(list(response.data['results'][0]), ['id', 'first_name'])
+        response = self.client.get('/api/guests/?omit=address,phone,email')
+        self.assertNotIn('address', response.data['results'][0])
+        self.assertIn('first_name', response.data['results'][0])
+        response = self.client.get('/api/bookings/?fields=id,number_of_days&omit=number_of_days')
+        self.assertEqual(list(response.data['results'][0]), ['id'])
+
+    def test_unknown_names_are_rejected(self):
+        self.add_rows(1)
+        urls = [
+            '/api/staffs/?fields=id,bogus', '/api/guests/?omit=bogus', '/api/bookings/?omit=number_of_nights',
+            '/api/rooms/?expand=hotel', f'/api/bookings/{Booking.objects.get().pk}/?fields=bogus',
+        ]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+    def test_only_the_rendered_columns_are_selected(self):
+        self.add_rows(1)
+        _, sql = self.get_page_query('/api/staffs/?fields=id,first_name')
+        # updated_at is always loaded for the ETag
+        self.assertEqual(
+            sql.split(' FROM ')[0],
+            'SELECT "hotel_staff"."id", "hotel_staff"."updated_at", "hotel_staff"."first_name"',
+        )
+        _, sql = self.get_page_query('/api/bookings/?fields=id,room,outstanding_balance')
+        self.assertIn('"hotel_booking"."room_id"', sql)
+        self.assertIn('"hotel_booking"."amount_paid"', sql)
+        self.assertNotIn('"hotel_booking"."guest_id"', sql)
+        self.assertNotIn('"hotel_booking"."check_in_date"', sql)
+
+    def test_expand_takes_the_same_queries_for_any_page_size(self):
+        url = '/api/bookings/?expand=room,guest&fields=id,room,guest'
+        self.add_rows(2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        self.add_rows(6)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(len(response.data['results']), 8)
+        self.assertEqual(response.data['results'][0]['guest']['email'], 'guest@example.com')
+
+
+class JSONCodecTests(APITestCase):
+    """The renderer and parser in common.jsoncodec read and write what DRF's do."""
+
+    def test_renders_like_drf(self):
+        payloads = [
+            {
+                'price': Decimal('12.50'), 'day': date(2030, 1, 2), 'at': time(14, 30, 0, 5),
+                'utc': datetime(2030, 1, 2, 3, 4, 5, 6, tzinfo=dt_timezone.utc),
+                'local': datetime(2030, 1, 2, 3, 4, 5, tzinfo=dt_timezone(timedelta(hours=7))),
+                'id': uuid.UUID(int=1), 'text': 'é\u2028\u2029"', 'rows': ({'a': None}, [True, 1.5]),
+            },
+            {1: 'non-string key'},
+            {'big': 2 ** 70},
+        ]
+        for data in payloads:
+            self.assertEqual(JSONRenderer().render(data), renderers.JSONRenderer().render(data))
+        self.assertEqual(
+            JSONRenderer().render(payloads[0], 'application/json; indent=4'),
+            renderers.JSONRenderer().render(payloads[0], 'application/json; indent=4'),
+        )
+        self.assertEqual(JSONRenderer().render(None), b'')
+
+    def test_non_finite_numbers_fail_like_drf(self):
+        for value in [float('nan'), float('inf'), Decimal('-Infinity')]:
+            with self.assertRaises(ValueError):
+                renderers.JSONRenderer().render({'rows': [{'rate': value}]})
+            with self.assertRaises(ValueError):
+                JSONRenderer().render({'rows': [{'rate': value}]})
+
+    def test_parses_like_drf(self):
+        for body in [b'{"a": [1, 2.5, "\\u00e9"], "b": null}', b'{"big": 1180591620717411303424}']:
+            self.assertEqual(JSONParser().parse(io.BytesIO(body)), parsers.JSONParser().parse(io.BytesIO(body)))
+        for body in [b'{"a": NaN}', b'{"a": ']:
+            with self.assertRaisesMessage(ParseError, 'JSON parse error'):
+                JSONParser().parse(io.BytesIO(body))
+
+
+class CompressionTests(HotelDataTestCase):
+    """Large list and export responses are compressed as Accept-Encoding allows."""
+
+    def test_list_is_gzipped_when_accepted(self):
+        self.add_rows(20)
+        plain = self.client.get('/api/bookings/', HTTP_ACCEPT_ENCODING='identity')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        response = self.client.get('/api/bookings/', HTTP_ACCEPT_ENCODING='br;q=0, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        small = self.client.get(f'/api/bookings/{Booking.objects.first().pk}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+    def test_export_is_compressed_while_streaming(self):
+        self.add_rows(20)
+        plain = self.client.get('/api/bookings/export/?output_format=csv', HTTP_ACCEPT_ENCODING='identity')
+        response = self.client.get('/api/bookings/export/?output_format=csv', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b''.join(plain.streaming_content))
+
+    def test_html_is_left_alone(self):
+        self.add_rows(20)
+        response = self.client.get('/api/bookings/', HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streams_are_flushed_as_they_go(self):
+        chunks = [b'%d,row\n' % number for number in range(20000)]
+        parts = list(compress_sequence(iter(chunks), GzipCompressor(6), flush_bytes=16 * 1024))
+        self.assertGreater(len(parts), 5)
+        # Everything before the last flush decompresses without the end of the stream
+        sent = zlib.decompressobj(31).decompress(b''.join(parts[:-1]))
+        self.assertGreater(len(sent), len(b''.join(chunks)) - 16 * 1024)
+        self.assertTrue(b''.join(chunks).startswith(sent))
+        self.assertEqual(gzip.decompress(b''.join(parts)), b''.join(chunks))
+
+    def test_negotiation_follows_q_values(self):
+        self.assertEqual(negotiate_encoding('br;q=0.5, gzip', ['br', 'gzip']), 'gzip')
+        self.assertEqual(negotiate_encoding('gzip, br', ['br', 'gzip']), 'br')
+        self.assertEqual(negotiate_encoding('*;q=0, identity', ['gzip']), None)
+        self.assertEqual(negotiate_encoding('x-gzip', ['gzip']), 'gzip')
+        self.assertEqual(negotiate_encoding('', ['gzip']), None)
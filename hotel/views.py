@@ -1,5 +1,6 @@
 from rest_framework import viewsets, status,permissions
-from django.db import IntegrityError
+from django.db import IntegrityError, OperationalError, transaction
+from contextlib import contextmanager
 from datetime import timedelta
 from rest_framework.response import Response
 from django.utils import timezone
@@ -10,21 +11,46 @@ from rest_framework.views import APIView
 from hotel.models import Hotel
 from rest_framework import viewsets
 from rest_framework.response import Response
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
-from .models import Hotel, Staff, Guest, RoomType, Room, Booking, Payment
+from .models import Hotel, Staff, Guest, RoomType, Room, Booking, Payment, is_lock_error
 from .serializers import (
-    HotelSerializer, StaffSerializer, GuestSerializer,
-    RoomTypeSerializer, RoomSerializer, BookingSerializer, PaymentSerializer
+    HotelSerializer, HotelSummarySerializer, StaffSerializer, GuestSerializer,
+    RoomTypeSerializer, RoomSerializer, BookingSerializer, PaymentSerializer,
+    AvailabilitySearchSerializer, AvailableRoomTypeSerializer, ExportFilterSerializer, BookingValuesSerializer,
+    RoomValuesSerializer,
 )
 from rest_framework.decorators import action
 from drf_yasg.utils import swagger_auto_schema
 from django.http import Http404
+from . import occupancy
+from .imports import CONTENT_TYPE_FORMATS, GuestImporter, RoomImporter, BookingImporter, read_rows
+from .exports import CONTENT_TYPES, export_rows
+from django.db.models import F
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.http import StreamingHttpResponse
+from .tasks import new_checkout_task_id, schedule_checkout, unschedule_checkout
+from common.eagerloading import EagerLoadingMixin
+from common.sparsefields import get_selection
+from common.metrics import serializer_timer
+from common import countcache, responsecache
+import hashlib
+import os
+
+
+class RoomBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The room is being booked by another request; try again."
+    default_code = 'room_busy'
 
     
     
-class SoftDeleteViewSetMixin(viewsets.ModelViewSet):
+class SoftDeleteViewSetMixin(EagerLoadingMixin, viewsets.ModelViewSet):
+    # The ETag of retrieve reads it
+    always_load = ('updated_at',)
+
     def get_object(self):
         queryset = self.filter_queryset(self.get_queryset())
         filter_kwargs = {self.lookup_field: self.kwargs[self.lookup_field]}
@@ -37,31 +63,291 @@ class SoftDeleteViewSetMixin(viewsets.ModelViewSet):
         self.check_object_permissions(self.request, obj)
         return obj
 
+    def list(self, request, *args, **kwargs):
+        # Validated without a query of its own, so ?count=none and cursor pages stay COUNT-free
+        build_response = lambda: self.get_list_response(request, *args, **kwargs)
+        if not responsecache.is_shared(countcache.get_cache()):
+            # Local generations miss other workers' writes: hash the page itself instead
+            response = build_response()
+            response.add_post_render_callback(self.validate_rendered)
+            return response
+        # Generations move on every committed write to the listed models, expanded relations included
+        queryset = self.filter_queryset(self.get_queryset())
+        models = countcache.get_query_models(queryset) | {
+            queryset.model._meta.get_field(name).related_model for name in self.get_expanded_relations()
+        }
+        etag = self.get_etag(countcache.get_generations(models))
+        return self.conditional_response(etag, None, build_response)
+
+    def validate_rendered(self, response):
+        if response.status_code != status.HTTP_200_OK:
+            return None
+        etag = self.get_etag(hashlib.md5(response.content).hexdigest())
+        response['ETag'] = etag
+        return get_conditional_response(self.request._request, etag=etag, response=response)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        timestamps = [instance.updated_at] + [
+            getattr(getattr(instance, name), 'updated_at', None) for name in self.get_expanded_relations()
+        ]
+        last_modified = max((timestamp for timestamp in timestamps if timestamp), default=None)
+        etag = self.get_etag(instance.pk, *timestamps)
+        return self.conditional_response(
+            etag, last_modified, lambda: self.get_retrieve_response(instance)
+        )
+
+    def get_expanded_relations(self):
+        # Unknown names are left for the serializer to reject
+        meta = getattr(self.get_serializer_class(), 'Meta', None)
+        expandable = getattr(meta, 'expandable_fields', {})
+        return [name for name in self.get_field_selection().get('expand') or () if name in expandable]
+
+    def get_list_response(self, request, *args, **kwargs):
+        with serializer_timer():
+            return super().list(request, *args, **kwargs)
+
+    def get_retrieve_response(self, instance):
+        with serializer_timer():
+            return Response(self.get_serializer(instance).data)
+
+    def get_etag(self, *state):
+        # The representation also depends on the query params and the renderer
+        raw = f'{self.request.get_full_path()}:{self.request.accepted_media_type}:{state}'
+        return f'W/"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+    def conditional_response(self, etag, last_modified, build_response):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        # Returns a 304 (or 412) when the client's validators still match
+        response = get_conditional_response(self.request._request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = build_response()
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def is_dry_run(self):
+        return self.request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        instance.delete()
+        if self.is_dry_run():
+            total, counts = instance.delete(dry_run=True)
+            return Response({'total': total, 'counts': counts}, status=status.HTTP_200_OK)
+        self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post'])
     def restore(self, request, pk=None):
         instance = self.get_object()
-        instance.restore()
+        if self.is_dry_run():
+            total, counts = instance.restore(dry_run=True)
+            return Response({'total': total, 'counts': counts}, status=status.HTTP_200_OK)
+        self.perform_restore(instance)
         return Response(status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['delete'])
     def hard_delete(self, request, pk=None):
         instance = self.get_object()
-        instance.hard_delete()
+        self.perform_hard_delete(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def perform_restore(self, instance):
+        instance.restore()
+
+    def perform_hard_delete(self, instance):
+        instance.hard_delete()
+
 
     
     
-class HotelViewSet(SoftDeleteViewSetMixin):
+class BulkImportViewSetMixin:
+    importer_class = None
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        # The body is read line by line, never parsed or buffered as a whole
+        content_type = request.content_type.split(';')[0].strip()
+        input_format = request.query_params.get('input_format') or CONTENT_TYPE_FORMATS.get(content_type)
+        if input_format is None:
+            raise ValidationError("Send text/csv or application/x-ndjson, or pass ?input_format=csv|ndjson.")
+        try:
+            batch_size = int(request.query_params.get('batch_size', 1000))
+        except ValueError:
+            raise ValidationError("batch_size must be an integer.")
+        lines = (line.decode('utf-8-sig') for line in request.stream or [])
+        try:
+            report = self.importer_class(batch_size=max(1, min(batch_size, 10000))).run(read_rows(lines, input_format))
+        except ValueError as e:
+            raise ValidationError(str(e))
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class ExportViewSetMixin:
+    export_fields = []
+    export_expressions = {}
+    export_date_field = None
+    export_hotel_field = None
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        params = ExportFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        # values() skips model instances and serializers entirely
+        queryset = self.get_queryset().model.objects.order_by('pk')
+        if 'date_from' in filters:
+            queryset = queryset.filter(**{f'{self.export_date_field}__gte': filters['date_from']})
+        if 'date_to' in filters:
+            queryset = queryset.filter(**{f'{self.export_date_field}__lte': filters['date_to']})
+        if 'hotel' in filters:
+            queryset = queryset.filter(**{self.export_hotel_field: filters['hotel']})
+        queryset = queryset.values(*self.export_fields, **self.export_expressions)
+
+        output_format = filters['output_format']
+        response = StreamingHttpResponse(export_rows(queryset, output_format), content_type=CONTENT_TYPES[output_format])
+        filename = f"{self.basename}-export.{output_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class CachedResponseMixin:
+    # Caches serialized list/retrieve data; writes to cache_models retire the entries.
+    # Off unless the response and count caches are shared (see common.responsecache)
+    cache_timeout = 300
+    cache_models = None
+
+    def get_cache_models(self):
+        return self.cache_models or [self.get_queryset().model]
+
+    def get_cache_key(self):
+        # Vary by the query params (in any order) and the host the links are built on
+        params = sorted(self.request.query_params.lists())
+        kwargs = sorted(self.kwargs.items())
+        raw = f'{self.request.build_absolute_uri(self.request.path)}:{kwargs}:{params}'
+        return f'response-cache:{self.basename}:{self.action}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def get_cached_data(self, handler, request, *args, **kwargs):
+        if not responsecache.is_enabled():
+            return handler(request, *args, **kwargs)
+        data = responsecache.get_or_build(
+            self.get_cache_key(),
+            self.get_cache_models(),
+            lambda: handler(request, *args, **kwargs).data,
+            self.cache_timeout,
+        )
+        return Response(data)
+
+    def get_list_response(self, request, *args, **kwargs):
+        return self.get_cached_data(super().get_list_response, request, *args, **kwargs)
+
+    def get_retrieve_response(self, instance):
+        return self.get_cached_data(super().get_retrieve_response, instance)
+
+
+class ValuesSerializationMixin:
+    # Opt-in: list and retrieve render through a ValuesSerializer instead of serializer_class
+    values_serializer = None
+
+    def get_values_serializer(self):
+        selection = self.get_field_selection()
+        if self.values_serializer is None or selection.get('expand'):
+            return None  # Expanded relations render from instances
+        return self.values_serializer.select(fields=selection.get('fields'), omit=selection.get('omit'))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        values_serializer = self.get_values_serializer()
+        if values_serializer is not None and self.action == 'retrieve':
+            queryset = values_serializer.annotate(queryset)
+        return queryset
+
+    def get_list_response(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        if values_serializer is None:
+            return super().get_list_response(request, *args, **kwargs)
+        with serializer_timer():
+            rows = values_serializer.get_rows(self.filter_queryset(self.get_queryset()))
+            page = self.paginate_queryset(rows)
+            if page is not None:
+                return self.get_paginated_response(values_serializer.to_representation_many(page))
+            return Response(values_serializer.to_representation_many(rows))
+
+    def get_retrieve_response(self, instance):
+        values_serializer = self.get_values_serializer()
+        # Soft-deleted rows come from all_objects without the annotations
+        if values_serializer is None or not values_serializer.is_annotated(instance):
+            return super().get_retrieve_response(instance)
+        with serializer_timer():
+            return Response(values_serializer.instance_to_representation(instance))
+
+
+class HotelViewSet(CachedResponseMixin, SoftDeleteViewSetMixin):
     queryset = Hotel.objects.all()
     serializer_class = HotelSerializer
+    cache_timeout = 600
     # permission_classes = [IsAuthenticated]
-    
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        # Dashboard figures for every hotel from one query per page
+        queryset = self.filter_queryset(Hotel.objects.with_stats()).order_by('pk')
+        selection = get_selection(request)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(HotelSummarySerializer(page, many=True, **selection).data)
+        return Response(HotelSummarySerializer(queryset, many=True, **selection).data)
+
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        hotel = self.get_object()
+        if hotel.is_deleted:
+            raise Http404
+        search = AvailabilitySearchSerializer(data=request.query_params)
+        search.is_valid(raise_exception=True)
+        room_types = hotel.get_available_room_types(
+            check_in_date=search.validated_data['check_in'],
+            check_out_date=search.validated_data['check_out'],
+            capacity=search.validated_data.get('capacity'),
+        )
+        return Response(AvailableRoomTypeSerializer(room_types, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def free_rooms(self, request, pk=None):
+        hotel = self.get_object()
+        if hotel.is_deleted:
+            raise Http404
+        search = AvailabilitySearchSerializer(data=request.query_params)
+        search.is_valid(raise_exception=True)
+        calendar = occupancy.get_calendar(hotel.pk)
+        try:
+            rooms = calendar.free_rooms(search.validated_data['check_in'], search.validated_data['check_out'])
+        except ValueError as e:
+            raise ValidationError(str(e))
+        return Response({'count': len(rooms), 'rooms': rooms})
+
+    @action(detail=True, methods=['get', 'post'], permission_classes=[permissions.IsAdminUser])
+    def calendar(self, request, pk=None):
+        # Calendars live in each worker's memory: this checks, or with POST rebuilds, the serving worker's
+        hotel = self.get_object()
+        if hotel.is_deleted:
+            raise Http404
+        if request.method == 'POST':
+            calendar = occupancy.rebuild_calendar(hotel.pk)
+        elif occupancy.is_loaded(hotel.pk):
+            calendar = occupancy.get_calendar(hotel.pk)
+        else:
+            return Response({'worker': os.getpid(), 'loaded': False})
+        return Response({
+            'worker': os.getpid(),
+            'loaded': True,
+            'start_date': calendar.start_date,
+            'end_date': calendar.end_date,
+            'rooms': len(calendar.rooms),
+            'mismatched_rooms': occupancy.check_consistency(calendar),
+        })
 
 
 class StaffViewSet(SoftDeleteViewSetMixin):
@@ -69,21 +355,25 @@ class StaffViewSet(SoftDeleteViewSetMixin):
     serializer_class = StaffSerializer
     # permission_classes = [IsAuthenticated]
 
-class GuestViewSet(SoftDeleteViewSetMixin):
+class GuestViewSet(BulkImportViewSetMixin, SoftDeleteViewSetMixin):
     queryset = Guest.all_objects.all()
     serializer_class = GuestSerializer
+    importer_class = GuestImporter
 
 
     
 
-class RoomTypeViewSet(SoftDeleteViewSetMixin):
+class RoomTypeViewSet(CachedResponseMixin, SoftDeleteViewSetMixin):
     queryset = RoomType.objects.all()
     serializer_class = RoomTypeSerializer
+    cache_timeout = 600
     # permission_classes = [IsAuthenticated]
 
-class RoomViewSet(SoftDeleteViewSetMixin):
+class RoomViewSet(ValuesSerializationMixin, BulkImportViewSetMixin, SoftDeleteViewSetMixin):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
+    values_serializer = RoomValuesSerializer()
+    importer_class = RoomImporter
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -146,61 +436,122 @@ class RoomViewSet(SoftDeleteViewSetMixin):
 #         total_nights = (booking.check_out_date - booking.check_in_date).days
 #         return total_nights * price_per_night
 
-class BookingViewSet(SoftDeleteViewSetMixin):
+class BookingViewSet(ValuesSerializationMixin, BulkImportViewSetMixin, ExportViewSetMixin, SoftDeleteViewSetMixin):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
+    values_serializer = BookingValuesSerializer()
+    importer_class = BookingImporter
+    export_fields = [
+        'id', 'guest', 'room', 'check_in_date', 'check_out_date', 'total_price', 'amount_paid',
+        'created_at', 'updated_at',
+    ]
+    export_expressions = {'hotel': F('room__hotel')}
+    export_date_field = 'check_in_date'
+    export_hotel_field = 'room__hotel'
 
     def perform_create(self, serializer):
-        room = serializer.validated_data['room']
-        if room.status == Room.OCCUPIED:
-            raise ValidationError("The room is already occupied.")
+        # The task id goes in with the row, so scheduling adds no UPDATE
+        task_id = new_checkout_task_id()
+        with self.reservation():
+            self.reserve_room(serializer.validated_data)
+            booking = serializer.save(checkout_task_id=task_id)
+        schedule_checkout(booking, task_id)
+
+    def perform_update(self, serializer):
+        with self.reservation():
+            self.reserve_room({
+                'room': serializer.validated_data.get('room', serializer.instance.room),
+                'check_in_date': serializer.validated_data.get('check_in_date', serializer.instance.check_in_date),
+                'check_out_date': serializer.validated_data.get('check_out_date', serializer.instance.check_out_date),
+            }, exclude=serializer.instance)
+            booking = serializer.save()
+        schedule_checkout(booking)
+
+    @contextmanager
+    def reservation(self):
+        # A writer that times out waiting for the room lock is told to retry, not sent a 500
+        try:
+            with transaction.atomic():
+                yield
+        except OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            raise RoomBusy()
+
+    def reserve_room(self, data, exclude=None):
+        # Updating the room first takes its row lock (SQLite's write lock), so
+        # concurrent reservations of the same room queue up here and each one
+        # sees the bookings committed before it
+        room = data['room']
+        Room.objects.filter(pk=room.pk).update(status=Room.OCCUPIED, updated_at=timezone.now())
+        overlapping = Booking.objects.filter(
+            room=room,
+            check_in_date__lt=data['check_out_date'],
+            check_out_date__gt=data['check_in_date'],
+        )
+        if exclude is not None:
+            overlapping = overlapping.exclude(pk=exclude.pk)
+        if overlapping.exists():
+            raise ValidationError("The room is already booked for these dates.")
         room.status = Room.OCCUPIED
-        room.save()
-        booking = serializer.save()
-        booking.total_price = self.calculate_total_price(booking)
-        booking.save()
 
     def perform_destroy(self, instance):
         room = instance.room
         room.status = Room.AVAILABLE
         room.save()
         instance.delete()
+        unschedule_checkout(instance)
+
+    def perform_restore(self, instance):
+        instance.restore()
+        schedule_checkout(instance)
 
-    def calculate_total_price(self, booking):
-        price_per_night = booking.room.room_type.price_per_night
-        total_nights = (booking.check_out_date - booking.check_in_date).days
-        return total_nights * price_per_night
+    def perform_hard_delete(self, instance):
+        unschedule_checkout(instance)
+        instance.hard_delete()
 
 
 
 
 
 
-class PaymentViewSet(SoftDeleteViewSetMixin):
+class PaymentViewSet(ExportViewSetMixin, SoftDeleteViewSetMixin):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
+    export_fields = ['id', 'booking', 'amount', 'payment_date', 'payment_method', 'created_at']
+    export_expressions = {'hotel': F('booking__room__hotel')}
+    export_date_field = 'payment_date'
+    export_hotel_field = 'booking__room__hotel'
 
     def perform_create(self, serializer):
-        booking = serializer.validated_data['booking']
-        
-        # Calculate the amount based on the outstanding balance of the booking
-        amount = booking.total_price - booking.get_total_paid()
-        
-        # Ensure the amount is positive
-        if amount <= 0:
-            return Response({"detail": "Payment amount must be positive."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Set the payment date to the current date and time
-        payment_date = timezone.now()
-        
-        # Create the Payment instance directly without passing amount through serializer
-        payment = Payment.objects.create(
-            booking=booking,
-            amount=amount,
-            payment_date=payment_date,
-            payment_method=serializer.validated_data['payment_method']  # Assuming payment_method is provided in the request
-        )
+        with transaction.atomic():
+            # Lock the booking so the outstanding balance can't change underneath us
+            booking = Booking.objects.select_for_update().get(pk=serializer.validated_data['booking'].pk)
+
+            # Calculate the amount based on the outstanding balance of the booking
+            amount = booking.get_outstanding_balance()
+
+            # Ensure the amount is positive
+            if amount <= 0:
+                raise ValidationError("Payment amount must be positive.")
+
+            # Set the payment date to the current date and time
+            payment_date = timezone.localdate()
+
+            # Create the Payment instance directly without passing amount through serializer
+            serializer.instance = Payment.objects.create(
+                booking=booking,
+                amount=amount,
+                payment_date=payment_date,
+                payment_method=serializer.validated_data['payment_method']  # Assuming payment_method is provided in the request
+            )
+
+    def perform_restore(self, instance):
+        try:
+            instance.restore()
+        except ValueError as e:
+            raise ValidationError(str(e))
 
 
 